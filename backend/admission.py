@@ -0,0 +1,94 @@
+import asyncio
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+
+from metrics import metrics
+
+
+class Overloaded(Exception):
+    """A request was shed instead of queued; reason is "queue_full" or "timeout"."""
+
+    def __init__(self, limiter, reason):
+        super().__init__(f"{limiter} overloaded ({reason})")
+        self.reason = reason
+
+
+class Limiter:
+    """
+    Concurrency limit with a bounded wait queue. At most max_active callers hold a slot at
+    once and up to max_waiting more wait for one, each for at most timeout seconds. Callers
+    beyond that are shed at once and waits past the deadline are shed too (both raise
+    Overloaded), so a traffic spike turns into quick refusals instead of everyone's latency
+    climbing until upstream timeouts fire.
+    """
+
+    def __init__(self, name, max_active, max_waiting=0, timeout=None):
+        self.name = name
+        self.max_active = max_active
+        self.max_waiting = max_waiting
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self.admitted = 0
+        self.shed = Counter()
+        self._semaphore = None
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self):
+        if self._semaphore is None:
+            # Created on first use so it belongs to the server's event loop
+            self._semaphore = asyncio.Semaphore(self.max_active)
+        if self._semaphore.locked():
+            if self.waiting >= self.max_waiting:
+                self._shed("queue_full")
+            self.waiting += 1
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                self._shed("timeout")
+            finally:
+                self.waiting -= 1
+            metrics.observe("admission_wait_seconds", time.perf_counter() - started, limiter=self.name)
+        else:
+            await self._semaphore.acquire()
+        self.active += 1
+        self.admitted += 1
+
+    def release(self):
+        self.active -= 1
+        self._semaphore.release()
+
+    def _shed(self, reason):
+        self.shed[reason] += 1
+        metrics.increment("admission_shed", limiter=self.name, reason=reason)
+        raise Overloaded(self.name, reason)
+
+
+class TokenBucket:
+    """Rate limit for one caller: rate requests per second on average, in bursts of up to burst."""
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def take(self):
+        """Spend one token. Returns 0 if allowed, else the seconds until a token is available."""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
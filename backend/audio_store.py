@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+
+RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header, size):
+    """
+    Parse a single-range HTTP Range header. Returns (start, end) inclusive, None to serve
+    the whole file (no header, or a form we do not support), or False if unsatisfiable.
+    """
+    match = RANGE.match((header or "").strip())
+    if not match or not any(match.groups()) or size == 0:
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        start, end = max(0, size - int(last)), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def read_bytes(path, start, length):
+    with open(path, "rb") as f:
+        f.seek(start)
+        return f.read(length)
+
+
+class AudioArtifact:
+    __slots__ = ("name", "size", "created", "last_used", "owners", "pinned", "shared", "released")
+
+    def __init__(self, name, size, created):
+        self.name = name
+        self.size = size
+        self.created = created
+        self.last_used = created
+        self.owners = set()
+        self.pinned = False
+        # Set once a second session is handed the file (a TTS cache hit); it then only ages out
+        self.shared = False
+        # Set once every owning session has ended (never for shared files)
+        self.released = False
+
+
+class AudioArtifactManager:
+    """
+    Tracks the generated audio files served from the audio directory: which sessions use
+    each file and when it was created and last handed out. A file belongs to the session it
+    was made for until another session is handed it too, after which it is shared. cleanup()
+    deletes unshared files whose session has ended, files unused for longer than ttl, and the oldest files
+    beyond max_bytes. Pinned files (the pre-synthesized fixed replies) are never deleted.
+    A file cleanup() has picked is tracked again only once it is gone, and track() then
+    reports it missing, so a URL is never handed out for a file about to be deleted.
+    """
+
+    def __init__(self, directory, ttl=3600, max_bytes=500 * 1024 * 1024, on_delete=None):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.on_delete = on_delete
+        self.deleted = 0
+        self._artifacts = {}
+        self._by_session = {}
+        self._lock = threading.Lock()
+        # Files picked by cleanup() and not yet unlinked; track() waits for them
+        self._deleting = set()
+        self._deleted = threading.Condition(self._lock)
+        self._scan()
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            return sum(a.size for a in self._artifacts.values())
+
+    def _scan(self):
+        # Files left by a previous run have no owner; they age out like any other
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if os.path.isfile(path):
+                stat = os.stat(path)
+                self._artifacts[name] = AudioArtifact(name, stat.st_size, stat.st_mtime)
+
+    def track(self, name, session_id=None, pinned=False, shared=False):
+        """
+        Record that session_id was handed the file name. Handing it to a second session marks
+        it shared. Returns False if the file no longer exists (e.g. cleanup just deleted it),
+        in which case it must not be served. Safe to call from worker threads.
+        """
+        now = time.time()
+        with self._lock:
+            while name in self._deleting:
+                self._deleted.wait()
+            artifact = self._artifacts.get(name)
+            if artifact is None:
+                try:
+                    size = os.path.getsize(os.path.join(self.directory, name))
+                except OSError:
+                    return False
+                artifact = self._artifacts[name] = AudioArtifact(name, size, now)
+            artifact.last_used = now
+            artifact.pinned = artifact.pinned or pinned
+            # Another session (current, or one that has already ended) got this file first
+            reused = session_id and (artifact.owners - {session_id} or artifact.released)
+            artifact.shared = artifact.shared or shared or bool(reused)
+            artifact.released = False
+            if session_id:
+                artifact.owners.add(session_id)
+                self._by_session.setdefault(session_id, set()).add(name)
+            return True
+
+    def forget(self, name):
+        """Stop tracking a file that was already deleted elsewhere (e.g. evicted from the TTS cache)."""
+        with self._lock:
+            artifact = self._artifacts.pop(name, None)
+            if artifact is not None:
+                for session_id in artifact.owners:
+                    self._by_session.get(session_id, set()).discard(name)
+
+    def release_session(self, session_id):
+        """
+        The session ended: drop its references. Its own files become eligible for deletion once
+        no other session uses them; shared cache files are left to the TTL and size limit.
+        """
+        with self._lock:
+            for name in self._by_session.pop(session_id, ()):
+                artifact = self._artifacts.get(name)
+                if artifact is None:
+                    continue
+                artifact.owners.discard(session_id)
+                if not artifact.owners and not artifact.shared:
+                    artifact.released = True
+
+    def cleanup(self):
+        """Delete released, expired and over-budget files. Returns the number deleted."""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            doomed = [a for a in self._artifacts.values()
+                      if not a.pinned and (a.released or a.last_used < cutoff)]
+            total = sum(a.size for a in self._artifacts.values()) - sum(a.size for a in doomed)
+            if total > self.max_bytes:
+                doomed_names = {a.name for a in doomed}
+                survivors = sorted((a for a in self._artifacts.values()
+                                    if not a.pinned and a.name not in doomed_names),
+                                   key=lambda a: a.last_used)
+                for artifact in survivors:
+                    if total <= self.max_bytes:
+                        break
+                    doomed.append(artifact)
+                    total -= artifact.size
+            for artifact in doomed:
+                del self._artifacts[artifact.name]
+                self._deleting.add(artifact.name)
+                for session_id in artifact.owners:
+                    names = self._by_session.get(session_id)
+                    if names is not None:
+                        names.discard(artifact.name)
+        # Unlink outside the lock so request threads are never stuck behind disk I/O;
+        # only a track() of one of these very files waits for it
+        for artifact in doomed:
+            try:
+                os.remove(os.path.join(self.directory, artifact.name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.error(f"Could not delete audio file {artifact.name}: {e}")
+            if self.on_delete is not None:
+                self.on_delete(artifact.name)
+            with self._lock:
+                self._deleting.discard(artifact.name)
+                self._deleted.notify_all()
+        self.deleted += len(doomed)
+        return len(doomed)
+
+    async def run(self, interval=60):
+        """Background cleanup loop; file deletion runs on a worker thread."""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await loop.run_in_executor(None, self.cleanup)
+                if removed:
+                    logging.info(f"Removed {removed} audio files")
+            except Exception as e:
+                logging.error(f"Audio cleanup error: {e}")
@@ -0,0 +1,520 @@
+"""
+Load and latency benchmark for the conversation pipeline.
+
+Starts the backend with Gemini and TTS replaced by local stubs (WILLOW_GEMINI_STUB,
+WILLOW_TTS_ENGINE=stub) and a throwaway database, log and audio directory, then runs
+simulated prospects concurrently through scripted conversations: chat turns over /talk
+(or /talk/stream) or /ws/audio, where each turn is streamed as PCM before its text,
+followed by the farewell and lead polling on /lead. Reports requests/sec and latency
+percentiles per endpoint, per pipeline stage and for event-loop lag (both scraped from
+/metrics), and writes everything as JSON so runs can be compared across commits.
+
+    python benchmark.py --prospects 50 --conversations 4 --gemini-latency 0.4 --out before.json
+    python benchmark.py --prospects 50 --conversations 4 --gemini-latency 0.4 --baseline before.json
+
+Pass --url to drive a server that is already running instead (start it with the stub
+variables yourself). Server-side percentiles cover the last 2048 samples of each series.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import httpx
+import numpy as np
+
+SESSION_HEADER = "X-Session-Id"
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+SAMPLE_RATE = 16000
+QUANTILES = (0.5, 0.95, 0.99)
+
+SCRIPTS = [
+    [
+        "Hi, I'm Dana, head of sales at Acme Logistics.",
+        "We get a few hundred inbound leads a week and can't follow up fast enough.",
+        "How does Willow AI qualify leads?",
+        "Does it integrate with HubSpot?",
+        "What does it cost?",
+        "Our budget is around two thousand dollars a month.",
+    ],
+    [
+        "Hello, this is Raj from Brightpath Health.",
+        "Our domain is brightpath.health and I run marketing operations.",
+        "What problem does Willow AI solve?",
+        "We lose leads that come in after hours.",
+        "Can it book meetings on our calendars?",
+        "We have about fifty thousand a year for this.",
+    ],
+    [
+        "Hey there.",
+        "I'm Chen, founder of a small SaaS company called Loopwork.",
+        "How is this different from a normal chatbot?",
+        "Is my data kept private?",
+        "What would onboarding look like?",
+    ],
+]
+FAREWELL = "Thanks, that's all. Bye!"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[1], formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--prospects", type=int, default=20, help="concurrent simulated prospects")
+    parser.add_argument("--conversations", type=int, default=3, help="conversations per prospect")
+    parser.add_argument("--ws-fraction", type=float, default=0.25,
+                        help="share of prospects that talk over /ws/audio instead of /talk")
+    parser.add_argument("--stream", action="store_true", help="use /talk/stream instead of /talk")
+    parser.add_argument("--think-time", type=float, default=0.0, help="pause between turns, seconds")
+    parser.add_argument("--gemini-latency", type=float, default=0.3, help="stub Gemini latency per call, seconds")
+    parser.add_argument("--tts-latency", type=float, default=0.05, help="stub TTS latency per utterance, seconds")
+    parser.add_argument("--audio-format", default="wav", choices=("wav", "mp3", "opus"),
+                        help="reply encoding to request (mp3 and opus need ffmpeg)")
+    parser.add_argument("--pcm", help="prerecorded speech for /ws/audio: a 16-bit mono WAV, raw 16 kHz "
+                                      "s16le file, or a directory of them (default: synthetic noise)")
+    parser.add_argument("--realtime", action="store_true", help="send PCM at real-time speed")
+    parser.add_argument("--no-audio", action="store_true", help="send only text frames over /ws/audio")
+    parser.add_argument("--no-reply-cache", action="store_true", help="disable the semantic reply cache")
+    parser.add_argument("--lead-wait", type=float, default=30.0, help="give up on a pending lead after this long")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--url", help="benchmark a running server instead of starting one")
+    parser.add_argument("--port", type=int, help="port for the started server (default: a free one)")
+    parser.add_argument("--out", help="where to write the JSON results (default: benchmark-<commit>.json)")
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    parser.add_argument("--keep", action="store_true", help="keep the started server's logs, database and audio")
+    return parser.parse_args(argv)
+
+
+# --- Measurements ---
+
+def quantile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+def summarize(values):
+    """count, mean and p50/p95/p99 of a list of seconds, in milliseconds."""
+    values = sorted(values)
+    if not values:
+        return {"count": 0}
+    summary = {"count": len(values), "mean_ms": round(1000 * sum(values) / len(values), 2)}
+    for q in QUANTILES:
+        summary[f"p{int(q * 100)}_ms"] = round(1000 * quantile(values, q), 2)
+    summary["max_ms"] = round(1000 * values[-1], 2)
+    return summary
+
+
+class Recorder:
+    """Client-side latency samples and error counts per endpoint."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.errors = Counter()
+        # Turns answered with the server's busy reply, per endpoint
+        self.shed = Counter()
+
+    def add(self, endpoint, seconds):
+        self.samples[endpoint].append(seconds)
+
+    @asynccontextmanager
+    async def timed(self, endpoint):
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.errors[endpoint] += 1
+            raise
+        self.add(endpoint, time.perf_counter() - started)
+
+    def requests(self):
+        # Sub-measurements (first sentence, STT, audio upload, lead polling overall) are not requests
+        return sum(len(v) for k, v in self.samples.items()
+                   if not k.endswith(("_first_sentence", "_stt", "_audio_send", "_ready")))
+
+    def report(self):
+        endpoints = {}
+        for endpoint in sorted(set(self.samples) | set(self.errors)):
+            endpoints[endpoint] = {**summarize(self.samples[endpoint]), "errors": self.errors[endpoint]}
+        return endpoints
+
+
+async def monitor_loop(samples, interval=0.1):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - started - interval))
+
+
+# --- Prospects ---
+
+def load_pcm(path):
+    """Return a list of (pcm bytes, sample rate) clips from a WAV/raw file or a directory of them."""
+    paths = [path] if not os.path.isdir(path) else [
+        os.path.join(path, name) for name in sorted(os.listdir(path))
+        if name.lower().endswith((".wav", ".raw", ".pcm"))
+    ]
+    clips = []
+    for clip_path in paths:
+        if clip_path.lower().endswith(".wav"):
+            with wave.open(clip_path, "rb") as wav:
+                if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+                    raise ValueError(f"{clip_path}: need 16-bit mono PCM")
+                clips.append((wav.readframes(wav.getnframes()), wav.getframerate()))
+        else:
+            with open(clip_path, "rb") as f:
+                clips.append((f.read(), SAMPLE_RATE))
+    if not clips:
+        raise ValueError(f"No .wav, .raw or .pcm files in {path}")
+    return clips
+
+
+def synthetic_pcm(rng, seconds=1.5):
+    """Speech-length noise bursts: keeps the recognizer busy without recorded audio."""
+    length = int(seconds * SAMPLE_RATE)
+    envelope = np.abs(np.sin(np.linspace(0, 6 * np.pi, length)))
+    noise = rng.standard_normal(length) * 2500 * envelope
+    return noise.astype(np.int16).tobytes(), SAMPLE_RATE
+
+
+class Prospect:
+    def __init__(self, index, args, base_url, recorder, clips):
+        self.index = index
+        self.args = args
+        self.base_url = base_url
+        self.recorder = recorder
+        self.clips = clips
+        self.rng = random.Random(args.seed * 1000 + index)
+        self.use_ws = self.rng.random() < args.ws_fraction
+
+    async def run(self):
+        # One client per prospect so session cookies are not shared between prospects
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=60.0) as client:
+            for _ in range(self.args.conversations):
+                script = self.rng.choice(SCRIPTS)
+                try:
+                    if self.use_ws:
+                        session_id = await self.ws_conversation(script)
+                    else:
+                        session_id = await self.http_conversation(client, script)
+                    await self.finish(client, session_id)
+                except Exception as e:
+                    # The failed request was counted; start the next conversation afresh
+                    self.recorder.errors["conversations"] += 1
+                    if self.recorder.errors["conversations"] <= 5:
+                        print(f"Prospect {self.index}: conversation failed: {e!r}", file=sys.stderr)
+                client.cookies.clear()
+
+    async def pause(self):
+        if self.args.think_time:
+            await asyncio.sleep(self.rng.uniform(0.5, 1.5) * self.args.think_time)
+
+    async def http_conversation(self, client, script):
+        headers = {}
+        for line in script:
+            body = {"message": line, "audio_format": self.args.audio_format}
+            talk = self.talk_stream if self.args.stream else self.talk
+            reply, headers[SESSION_HEADER] = await talk(client, body, headers)
+            if reply.get("audio_url"):
+                async with self.recorder.timed("audio"):
+                    (await client.get(reply["audio_url"])).raise_for_status()
+            await self.pause()
+        return headers[SESSION_HEADER]
+
+    async def talk(self, client, body, headers):
+        async with self.recorder.timed("talk"):
+            response = await client.post("/talk", json=body, headers=headers)
+            response.raise_for_status()
+        if response.json().get("busy"):
+            self.recorder.shed["talk"] += 1
+        return response.json(), response.headers[SESSION_HEADER]
+
+    async def talk_stream(self, client, body, headers):
+        started = time.perf_counter()
+        first_sentence = False
+        done = None
+        async with self.recorder.timed("talk_stream"):
+            async with client.stream("POST", "/talk/stream", json=body, headers=headers) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    event = json.loads(line) if line else {}
+                    if event.get("type") == "sentence" and not first_sentence:
+                        first_sentence = True
+                        self.recorder.add("talk_stream_first_sentence", time.perf_counter() - started)
+                    elif event.get("type") == "done":
+                        done = event
+        if done is None:
+            raise RuntimeError("stream ended without a done event")
+        if done.get("busy"):
+            self.recorder.shed["talk_stream"] += 1
+        return done, response.headers[SESSION_HEADER]
+
+    async def ws_conversation(self, script):
+        import websockets
+        clip_rate = self.clips[0][1] if self.clips else SAMPLE_RATE
+        url = (self.base_url.replace("http", "ws", 1)
+               + f"/ws/audio?audio_format={self.args.audio_format}&sample_rate={clip_rate}")
+        async with self.recorder.timed("ws_connect"):
+            websocket = await websockets.connect(url, max_size=None)
+        async with websocket:
+            session_id = json.loads(await websocket.recv())["session_id"]
+            for line in script:
+                if not self.args.no_audio:
+                    await self.ws_speak(websocket)
+                started = time.perf_counter()
+                first_sentence = False
+                async with self.recorder.timed("ws_turn"):
+                    await websocket.send(json.dumps({"message": line}))
+                    while True:
+                        event = json.loads(await asyncio.wait_for(websocket.recv(), 60))
+                        if event.get("type") == "sentence" and not first_sentence:
+                            first_sentence = True
+                            self.recorder.add("ws_turn_first_sentence", time.perf_counter() - started)
+                        elif event.get("type") == "done":
+                            if event.get("busy"):
+                                self.recorder.shed["ws_turn"] += 1
+                            break
+                await self.pause()
+        return session_id
+
+    async def ws_speak(self, websocket):
+        """Stream a clip, flush, and time how long the final transcript takes."""
+        pcm, rate = self.rng.choice(self.clips) if self.clips else synthetic_pcm(np.random.default_rng(self.rng.getrandbits(32)))
+        chunk = rate * 2 // 10  # 100 ms
+        async with self.recorder.timed("ws_audio_send"):
+            for start in range(0, len(pcm), chunk):
+                await websocket.send(pcm[start:start + chunk])
+                if self.args.realtime:
+                    await asyncio.sleep(0.1)
+        async with self.recorder.timed("ws_stt"):
+            await websocket.send(json.dumps({"type": "flush"}))
+            while True:
+                event = json.loads(await asyncio.wait_for(websocket.recv(), 30))
+                if event.get("type") == "final":
+                    text = event.get("text")
+                    break
+                if event.get("type") == "error":
+                    # e.g. stt_unavailable: the server will not transcribe this socket's audio
+                    raise RuntimeError(f"/ws/audio error: {event.get('error')}: {event.get('detail')}")
+                if event.get("type") == "done":
+                    # A reply to an utterance Vosk closed on its own; keep waiting for ours
+                    continue
+        if text:
+            # A real transcript starts its own turn on the server; wait it out so the
+            # scripted text turn that follows is timed on its own
+            while json.loads(await asyncio.wait_for(websocket.recv(), 60)).get("type") != "done":
+                pass
+
+    async def finish(self, client, session_id):
+        headers = {SESSION_HEADER: session_id}
+        async with self.recorder.timed("lead_end"):
+            (await client.post("/lead", json={"message": FAREWELL}, headers=headers)).raise_for_status()
+        deadline = time.perf_counter() + self.args.lead_wait
+        async with self.recorder.timed("lead_ready"):
+            while True:
+                async with self.recorder.timed("lead_poll"):
+                    response = await client.get("/lead", params={"wait": 10}, headers=headers)
+                    response.raise_for_status()
+                if response.json().get("lead_status") != "pending":
+                    break
+                if time.perf_counter() > deadline:
+                    raise TimeoutError("lead still pending")
+
+
+# --- Server ---
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(args, workdir):
+    port = args.port or free_port()
+    env = dict(os.environ)
+    env.update({
+        "WILLOW_GEMINI_STUB": "1",
+        "WILLOW_GEMINI_STUB_LATENCY": str(args.gemini_latency),
+        "WILLOW_TTS_ENGINE": "stub",
+        "WILLOW_TTS_STUB_LATENCY": str(args.tts_latency),
+        "WILLOW_DB_PATH": os.path.join(workdir, "willow.db"),
+        "WILLOW_LOG_PATH": os.path.join(workdir, "interaction.log"),
+        "WILLOW_AUDIO_DIR": os.path.join(workdir, "audio"),
+        "WILLOW_MAX_SESSIONS": str(max(1000, 2 * args.prospects * args.conversations)),
+    })
+    if args.no_reply_cache:
+        env["WILLOW_REPLY_CACHE_THRESHOLD"] = "0"
+    # Scripted prospects type faster than people; keep the per-session rate limit out of the way
+    env.setdefault("WILLOW_SESSION_RATE", "0")
+    log = open(os.path.join(workdir, "server.log"), "wb")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_ready(base_url, process=None, timeout=120.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError("server exited during startup")
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.25)
+    raise TimeoutError(f"{base_url} did not come up within {timeout:.0f}s")
+
+
+METRIC_LINE = re.compile(r"^(\w+)(?:\{(.*)\})? (\S+)$")
+LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def parse_metrics(text):
+    """Pull stage, route and event-loop percentiles and all counters out of /metrics."""
+    stages, routes, loop_lag, counters = defaultdict(dict), defaultdict(dict), {}, {}
+    for line in text.splitlines():
+        match = METRIC_LINE.match(line)
+        if not match:
+            continue
+        name, labels, value = match.group(1), dict(LABEL.findall(match.group(2) or "")), float(match.group(3))
+        quantile_label = labels.pop("quantile", None)
+        key = f"p{int(float(quantile_label) * 100)}_ms" if quantile_label else None
+        if name.startswith("willow_stage_seconds"):
+            target = stages[labels.get("stage")]
+        elif name.startswith("willow_request_seconds"):
+            target = routes[f"{labels.get('method')} {labels.get('route')}"]
+        elif name.startswith("willow_event_loop_lag_seconds"):
+            target = loop_lag
+        else:
+            if name.endswith("_total"):
+                label_text = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+                counters[f"{name}{{{label_text}}}" if label_text else name] = value
+            continue
+        if key:
+            target[key] = round(1000 * value, 2)
+        elif name.endswith("_count"):
+            target["count"] = int(value)
+        elif name.endswith("_sum"):
+            target["sum_ms"] = round(1000 * value, 2)
+    return dict(stages), dict(routes), loop_lag, counters
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Reporting ---
+
+def print_table(title, rows, baseline=None):
+    print(f"\n{title}")
+    print(f"  {'':32} {'count':>7} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, row in rows.items():
+        line = f"  {name:32} {row.get('count', 0):>7} {row.get('p50_ms', float('nan')):>9.1f} " \
+               f"{row.get('p99_ms', float('nan')):>9.1f} {row.get('errors', ''):>7}"
+        old = (baseline or {}).get(name)
+        if old and old.get("p50_ms") and row.get("p50_ms") is not None:
+            line += f"   p50 {change(old['p50_ms'], row['p50_ms'])}, p99 {change(old.get('p99_ms'), row.get('p99_ms'))}"
+        print(line)
+
+
+def change(old, new):
+    if not old or new is None:
+        return "n/a"
+    return f"{100 * (new - old) / old:+.0f}%"
+
+
+def report(results, baseline=None):
+    baseline = baseline or {}
+    print(f"\n{results['requests']} requests in {results['duration_s']:.1f}s: {results['rps']:.1f} req/s"
+          + (f" (baseline {baseline['rps']:.1f} req/s at {baseline.get('commit')})" if baseline.get("rps") else ""))
+    print_table("Endpoints (client side)", results["endpoints"], baseline.get("endpoints"))
+    if results["shed"]:
+        print("  Shed by admission control: " + ", ".join(f"{k} {v}" for k, v in results["shed"].items()))
+    print_table("Stages (server side)", results["stages"], baseline.get("stages"))
+    print_table("Event-loop lag", {"server": results["event_loop_lag"], "benchmark client": results["client_loop_lag"]},
+                {"server": baseline.get("event_loop_lag"), "benchmark client": baseline.get("client_loop_lag")})
+
+
+async def run(args):
+    clips = load_pcm(args.pcm) if args.pcm else []
+    workdir = tempfile.mkdtemp(prefix="willow-bench-")
+    process = None
+    base_url = args.url
+    if base_url is None:
+        process, base_url = start_server(args, workdir)
+        print(f"Started server at {base_url} (logs and data in {workdir}{'' if args.keep else ', removed afterwards'})")
+    try:
+        await wait_ready(base_url, process)
+        recorder = Recorder()
+        client_lag = []
+        monitor = asyncio.ensure_future(monitor_loop(client_lag))
+        prospects = [Prospect(i, args, base_url, recorder, clips) for i in range(args.prospects)]
+        print(f"Running {args.prospects} prospects x {args.conversations} conversations "
+              f"({sum(p.use_ws for p in prospects)} over /ws/audio)...")
+        started = time.perf_counter()
+        await asyncio.gather(*(prospect.run() for prospect in prospects))
+        duration = time.perf_counter() - started
+        monitor.cancel()
+        async with httpx.AsyncClient(base_url=base_url, timeout=30.0) as client:
+            stages, routes, loop_lag, counters = parse_metrics((await client.get("/metrics")).text)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(30)
+            if not args.keep:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    config = {key: value for key, value in vars(args).items() if key not in ("out", "baseline", "port", "keep")}
+    return {
+        "commit": git_commit(),
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "config": config,
+        "duration_s": round(duration, 3),
+        "requests": recorder.requests(),
+        "rps": round(recorder.requests() / duration, 2) if duration else 0.0,
+        "endpoints": recorder.report(),
+        "shed": dict(recorder.shed),
+        "stages": stages,
+        "routes": routes,
+        "event_loop_lag": loop_lag,
+        "client_loop_lag": summarize(client_lag),
+        "counters": counters,
+    }
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    results = asyncio.run(run(args))
+    report(results, baseline)
+    out = args.out or f"benchmark-{results['commit'] or 'results'}.json"
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,41 @@
-from openai import OpenAI
+import asyncio
 import os
+import time
+from event_log import get_event_log
+from llm import OpenAIProvider, LLMRouter
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-)
+# Same async provider layer as the server: concurrency limit, circuit breaker, no blocking calls
+llm = LLMRouter([OpenAIProvider(
+    os.getenv("OPENROUTER_API_KEY"),
+    model="openai/gpt-4o",
+    headers={
+        "HTTP-Referer": "http://localhost:3000",  # Or your frontend URL
+        "X-Title": "Willow AI SDR",  # Or your app/site name
+    },
+)])
 
-def get_bot_response(prompt: str):
+async def get_bot_response(prompt: str):
     """
     Get a short bot response from OpenRouter. Handles errors and logs all prompts/responses.
     """
+    started = time.perf_counter()
     try:
-        completion = client.chat.completions.create(
-            extra_headers={
-                "HTTP-Referer": "http://localhost:3000",  # Or your frontend URL
-                "X-Title": "Willow AI SDR",  # Or your app/site name
-            },
-            model="openai/gpt-4o",
-            max_tokens=5,  # Limit tokens to fit your credit limit
-            messages=[
-                {"role": "system", "content": "You are a sales representative. Reply in 1-2 words only."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        response = completion.choices[0].message.content
-        with open("chatbot_transcript.log", "a") as f:
-            f.write(f"PROMPT: {prompt}\nRESPONSE: {response}\n")
+        response = await llm.generate({
+            "systemInstruction": {"parts": [{"text": "You are a sales representative. Reply in 1-2 words only."}]},
+            "contents": [{"role": "user", "parts": [{"text": prompt}]}],
+            "generationConfig": {"maxOutputTokens": 5},  # Limit tokens to fit your credit limit
+        })
+        get_event_log().log("llm_call", stage="chatbot", prompt=prompt, response=response,
+                            llm_ms=round((time.perf_counter() - started) * 1000, 1))
         return response
     except Exception as e:
         print(f"[Chatbot] Error: {e}")
         return "Sorry, I couldn't process that."
+
+# For testing
+if __name__ == "__main__":
+    print(asyncio.run(get_bot_response("Hi, what do you sell?")))
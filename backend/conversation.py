@@ -0,0 +1,84 @@
+import json
+
+from retrieval import estimate_tokens
+
+# Lead facts collected from the conversation as it goes
+LEAD_FIELDS = ("name", "role", "company", "domain", "problem", "budget")
+
+CONTEXT_UPDATE_PROMPT = """You maintain notes on a live sales conversation between a website visitor (User) and Jane, a sales assistant.
+
+Current summary:
+{summary}
+
+Current lead facts:
+{facts}
+
+New turns:
+{turns}
+
+Update the summary (at most 6 sentences, keep names, company, role, needs, objections and budget) and the lead facts with anything the new turns add or change. Output a JSON object with the fields summary, {fields}. Use null for facts that are still unknown."""
+
+LEAD_SUMMARY_PROMPT = """Summarize this sales conversation in 5-6 sentences for a human sales agent. Include:
+- The user's name, company, and role (if provided)
+- The user's requirements and main problem
+- Any objections or concerns
+- Budget (if mentioned)
+- Any other relevant details for handoff
+
+Conversation:
+{conversation}
+
+Output a JSON object with the fields company, domain, problem, budget, summary and agent_summary (a short summary for the agent). Set missing fields to null."""
+
+
+def format_turns(turns):
+    return "\n".join(("User: " if h["role"] == "user" else "Jane: ") + h["text"] for h in turns)
+
+
+def recent_turns(history, token_budget, min_turns=2):
+    """The newest turns that fit in token_budget, always at least min_turns of them."""
+    used = 0
+    count = 0
+    for turn in reversed(history):
+        used += estimate_tokens(turn["text"])
+        if count >= min_turns and used > token_budget:
+            break
+        count += 1
+    return history[len(history) - count:]
+
+
+def build_context_update(summary, lead, turns):
+    """Gemini JSON-mode payload that folds new turns into the rolling summary and lead facts."""
+    facts = {field: lead.get(field) for field in LEAD_FIELDS}
+    prompt = CONTEXT_UPDATE_PROMPT.format(
+        summary=summary or "(none yet)",
+        facts=json.dumps(facts),
+        turns=format_turns(turns),
+        fields=", ".join(LEAD_FIELDS),
+    )
+    return {
+        "contents": [{"parts": [{"text": prompt}]}],
+        "generationConfig": {"responseMimeType": "application/json"},
+    }
+
+
+def build_lead_summary(conversation):
+    """Gemini JSON-mode payload that turns a finished conversation into a lead for the sales team."""
+    return {
+        "contents": [{"parts": [{"text": LEAD_SUMMARY_PROMPT.format(conversation=conversation)}]}],
+        "generationConfig": {"responseMimeType": "application/json"},
+    }
+
+
+def parse_context_update(text):
+    """Return (summary, facts) from a context update reply, or None if it is unusable."""
+    try:
+        data = json.loads(text)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("summary"), str):
+        return None
+    facts = {field: data[field] for field in LEAD_FIELDS
+             if isinstance(data.get(field), (str, int, float)) and data[field] != ""}
+    return data["summary"].strip(), facts
+
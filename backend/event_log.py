@@ -0,0 +1,158 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+_STOP = object()
+
+
+class EventLog:
+    """
+    Non-blocking JSON Lines log. log() only puts the record on a bounded queue; a writer
+    thread drains it in batches, so disk latency never stalls the event loop or the audio
+    loop. When the queue is full new records are dropped and counted, and the writer notes
+    the count in the log. The file is rotated to path.1 .. path.<backups> once it passes
+    max_bytes or is older than max_age seconds.
+    """
+
+    def __init__(self, path, max_queue=10000, batch_size=256, flush_interval=0.5,
+                 max_bytes=50 * 1024 * 1024, max_age=24 * 3600, backups=5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.backups = backups
+        self.dropped = 0
+        self.written = 0
+        self._reported_drops = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._file = None
+        self._opened = 0.0
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        # The writer thread does not survive a fork (e.g. a server preloading before it starts its
+        # workers); the child gets a fresh queue and starts its own writer on the next log()
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._file = None
+
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-log", daemon=True)
+                self._thread.start()
+        return self
+
+    def log(self, event, **fields):
+        """Queue one record. Never blocks; drops the record if the writer has fallen behind."""
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put_nowait({"ts": round(time.time(), 3), "event": event, **fields})
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout=5.0):
+        """Flush queued records and stop the writer thread."""
+        if self._thread is None:
+            return
+        # Blocking put is fine here: the writer is draining the queue
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+            while batch and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(record is _STOP for record in batch)
+            records = [record for record in batch if record is not _STOP]
+            if self.dropped != self._reported_drops:
+                records.append({"ts": round(time.time(), 3), "event": "log_dropped",
+                                "count": self.dropped - self._reported_drops})
+                self._reported_drops = self.dropped
+            if records:
+                try:
+                    self._write(records)
+                except Exception as e:
+                    # Nowhere left to log to; the records are lost but the writer keeps going
+                    print(f"[EventLog] Write error: {e}")
+            if stop:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _write(self, records):
+        if self._file is None:
+            self._open()
+        elif self._file.tell() >= self.max_bytes or time.time() - self._opened >= self.max_age:
+            self._rotate()
+        lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        self._file.write(lines)
+        self._file.flush()
+        self.written += len(records)
+
+    def _open(self):
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened = time.time()
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._opened = time.time()
+
+
+class EventLogHandler(logging.Handler):
+    """Route standard logging records (warnings, errors) into an EventLog."""
+
+    def __init__(self, event_log, level=logging.NOTSET):
+        super().__init__(level)
+        self.event_log = event_log
+
+    def emit(self, record):
+        try:
+            self.event_log.log("log", level=record.levelname, logger=record.name, message=record.getMessage())
+        except Exception:
+            self.handleError(record)
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_event_log():
+    """The process-wide log at WILLOW_LOG_PATH (backend/interaction.log by default), flushed at exit."""
+    global _default
+    with _default_lock:
+        if _default is None:
+            path = os.getenv("WILLOW_LOG_PATH") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "interaction.log")
+            _default = EventLog(path,
+                                max_bytes=int(float(os.getenv("WILLOW_LOG_MAX_MB", "50")) * 1024 * 1024),
+                                backups=int(os.getenv("WILLOW_LOG_BACKUPS", "5")))
+            atexit.register(_default.close)
+        return _default
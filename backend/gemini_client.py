@@ -0,0 +1,233 @@
+import asyncio
+import hashlib
+import json
+import logging
+import random
+import time
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (httpx only speaks HTTP/2 when h2 is installed)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta"
+
+# Rate limiting and transient server errors are worth another try; anything else is not
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class GeminiClient:
+    """
+    Application-lifetime Gemini client. One pooled httpx.AsyncClient is shared by
+    every request so turns reuse warm keep-alive connections instead of paying a
+    fresh TCP+TLS handshake each time. Pass an httpx transport (e.g. httpx.MockTransport)
+    to run against a local stand-in.
+    """
+
+    def __init__(self, api_key, model="gemini-2.0-flash", base_url=GEMINI_BASE_URL, transport=None,
+                 max_connections=20, max_keepalive=10, connect_timeout=3.0, read_timeout=15.0,
+                 deadline=20.0, max_retries=3, backoff=0.25):
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url
+        self.transport = transport
+        self.limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.timeout = httpx.Timeout(connect=connect_timeout, read=read_timeout, write=connect_timeout, pool=connect_timeout)
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._client = None
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"x-goog-api-key": self.api_key or ""},
+                http2=HTTP2_AVAILABLE and self.transport is None,
+                limits=self.limits,
+                timeout=self.timeout,
+                transport=self.transport,
+            )
+        return self
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def post(self, method, payload):
+        """
+        POST payload to models/<model>:<method> and return the decoded JSON body.
+        Retries 429/5xx and transport errors with full-jitter backoff, but never past
+        the per-request deadline.
+        """
+        return await self.request("POST", f"/models/{self.model}:{method}", payload)
+
+    async def request(self, http_method, url, payload=None, params=None):
+        """Send one API request with the retry policy of post() and return the decoded JSON body."""
+        await self.start()
+        method = f"{http_method} {url}"
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            timeout = httpx.Timeout(
+                connect=min(self.timeout.connect, remaining),
+                read=min(self.timeout.read, remaining),
+                write=min(self.timeout.write, remaining),
+                pool=min(self.timeout.pool, remaining),
+            )
+            retry_after = None
+            try:
+                response = await self._client.request(http_method, url, json=payload, params=params, timeout=timeout)
+                if response.status_code not in RETRY_STATUSES or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response.json()
+                error = f"HTTP {response.status_code}"
+                retry_after = _retry_after_seconds(response)
+            except httpx.TransportError as e:
+                if attempt >= self.max_retries:
+                    raise
+                error = repr(e)
+            delay = random.uniform(0, self.backoff * (2 ** attempt))
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+            if time.monotonic() + delay >= deadline:
+                raise httpx.TimeoutException(f"Gemini deadline exceeded after {attempt + 1} attempts ({error})")
+            logging.warning(f"Gemini {method} attempt {attempt + 1} failed ({error}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def generate(self, payload):
+        """Call generateContent and return the text of the first candidate."""
+        data = await self.post("generateContent", payload)
+        # Gemini returns: candidates[0].content.parts[0].text
+        return data["candidates"][0]["content"]["parts"][0]["text"]
+
+    async def stream(self, payload):
+        """
+        Call streamGenerateContent over server-sent events and yield text fragments
+        as they arrive. Not retried: once tokens have been handed out a retry would
+        repeat them.
+        """
+        await self.start()
+        url = f"/models/{self.model}:streamGenerateContent"
+        async with self._client.stream("POST", url, params={"alt": "sse"}, json=payload) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                chunk = json.loads(line[len("data:"):])
+                for candidate in chunk.get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        if part.get("text"):
+                            yield part["text"]
+
+
+class ContextCache:
+    """
+    Keeps the static prompt prefix (system instruction plus any fixed contents) in a Gemini
+    cachedContents resource so it is uploaded once rather than with every request. The
+    resource is created by refresh() (at startup, then in the background), its TTL is
+    extended when it comes within refresh_margin seconds of expiring, and it is replaced
+    when the prefix changes. name() never calls the API itself and returns None while the
+    cache is unavailable; callers then send the prefix inline. Prefixes estimated below
+    min_tokens, the model's minimum cacheable size, are never uploaded.
+    """
+
+    def __init__(self, client, ttl=3600, refresh_margin=300, retry_interval=600, min_tokens=4096):
+        self.client = client
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self.min_tokens = min_tokens
+        self._prefix = None
+        self._digest = None
+        self._too_small = False
+        self._name = None
+        self._expires = 0.0
+        self._retry_at = 0.0
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def set_prefix(self, system_instruction, contents=None):
+        """Set the static prefix. A changed prefix replaces the cached resource on next use."""
+        prefix = {"systemInstruction": system_instruction}
+        if contents:
+            prefix["contents"] = contents
+        digest = hashlib.sha1(json.dumps(prefix, sort_keys=True).encode("utf-8")).hexdigest()
+        if digest != self._digest:
+            self._prefix, self._digest = prefix, digest
+            self._expires = 0.0
+            self._retry_at = 0.0
+            # Roughly four characters per token
+            parts = [system_instruction] + list(contents or [])
+            tokens = sum(len(part.get("text", "")) for content in parts for part in content.get("parts", [])) // 4
+            self._too_small = tokens < self.min_tokens
+            if self._too_small:
+                logging.info(f"Prompt prefix (~{tokens} tokens) is below the {self.min_tokens}-token "
+                             "context cache minimum, sending it inline")
+
+    async def name(self):
+        """
+        Return the resource name (cachedContents/...) to send as cachedContent, or None.
+        Never waits on the API: a missing or expiring resource is (re)created in the
+        background and the prefix goes inline until it is ready.
+        """
+        if self._prefix is None or self._too_small:
+            return None
+        now = time.monotonic()
+        if self._name is None or now >= self._expires - self.refresh_margin:
+            if now >= self._retry_at and (self._task is None or self._task.done()):
+                self._task = asyncio.ensure_future(self.refresh())
+        return self._name if self._name is not None and now < self._expires else None
+
+    async def refresh(self):
+        """Create, extend or replace the resource as needed. Returns its name, or None if unavailable."""
+        if self._prefix is None or self._too_small:
+            return None
+        async with self._lock:
+            now = time.monotonic()
+            if self._name is not None and now < self._expires - self.refresh_margin:
+                return self._name
+            if now < self._retry_at:
+                return None
+            try:
+                if self._name is not None and now < self._expires:
+                    await self.client.request("PATCH", f"/{self._name}", {"ttl": f"{self.ttl}s"},
+                                              params={"updateMask": "ttl"})
+                else:
+                    await self._discard()
+                    body = {"model": f"models/{self.client.model}", "ttl": f"{self.ttl}s", **self._prefix}
+                    self._name = (await self.client.request("POST", "/cachedContents", body))["name"]
+                self._expires = now + self.ttl
+                return self._name
+            except Exception as e:
+                logging.warning(f"Gemini context cache unavailable, sending the prompt inline: {e}")
+                await self._discard()
+                self._retry_at = now + self.retry_interval
+                return None
+
+    async def invalidate(self):
+        """Drop the current resource, e.g. after the API rejected it as unknown or expired."""
+        async with self._lock:
+            await self._discard()
+
+    async def _discard(self):
+        # Caller holds self._lock
+        name, self._name, self._expires = self._name, None, 0.0
+        if name is not None:
+            try:
+                await self.client.request("DELETE", f"/{name}")
+            except Exception as e:
+                logging.info(f"Could not delete Gemini context cache {name}: {e}")
+
+
+def _retry_after_seconds(response):
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
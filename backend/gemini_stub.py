@@ -0,0 +1,123 @@
+import json
+import re
+import time
+import uuid
+
+import httpx
+
+MODEL_METHOD = re.compile(r"/models/([^/:]+):(\w+)$")
+CACHED_CONTENT = re.compile(r"/(cachedContents/[\w-]+)$")
+
+
+class StubGemini:
+    """
+    Local stand-in for the Gemini REST API, served through httpx.MockTransport so the
+    backend runs without network access or an API key. Supports generateContent,
+    streamGenerateContent (SSE) and the cachedContents create/patch/delete calls, and
+    enforces cache expiry like the real service. It also answers OpenAI-style
+    /chat/completions (plain and streamed), standing in for OpenRouter. Every request body
+    is kept in self.requests so callers can check what was actually sent.
+    """
+
+    def __init__(self, reply=None, latency=0.0, min_cache_tokens=0):
+        # reply(payload) -> str; the default echoes the latest user text (as {"summary": ...} in JSON mode)
+        self.reply = reply or _echo
+        self.latency = latency
+        self.min_cache_tokens = min_cache_tokens
+        self.requests = []
+        self.caches = {}
+
+    def transport(self):
+        return httpx.MockTransport(self.handle)
+
+    async def handle(self, request):
+        if self.latency:
+            import asyncio
+            await asyncio.sleep(self.latency)
+        body = json.loads(request.content) if request.content else None
+        self.requests.append((request.method, request.url.path, body))
+        path = request.url.path
+        if path.endswith("/chat/completions") and request.method == "POST":
+            return self._chat(body)
+        match = MODEL_METHOD.search(path)
+        if match and request.method == "POST":
+            return self._generate(match.group(2), body)
+        if path.endswith("/cachedContents") and request.method == "POST":
+            return self._create_cache(body)
+        match = CACHED_CONTENT.search(path)
+        if match and match.group(1) in self.caches:
+            name = match.group(1)
+            if request.method == "DELETE":
+                del self.caches[name]
+                return httpx.Response(200, json={})
+            if request.method == "PATCH":
+                self.caches[name]["expires"] = time.monotonic() + _seconds(body["ttl"])
+                return httpx.Response(200, json={"name": name})
+        return _error(404, f"Not found: {request.method} {path}")
+
+    def _create_cache(self, body):
+        size = len(json.dumps(body)) // 4
+        if size < self.min_cache_tokens:
+            return _error(400, f"Cached content is too small: {size} tokens, minimum {self.min_cache_tokens}")
+        name = f"cachedContents/{uuid.uuid4().hex[:12]}"
+        self.caches[name] = {"body": body, "expires": time.monotonic() + _seconds(body.get("ttl", "3600s"))}
+        return httpx.Response(200, json={"name": name, "model": body["model"]})
+
+    def _generate(self, method, body):
+        name = body.get("cachedContent")
+        if name is not None:
+            cache = self.caches.get(name)
+            if cache is None or cache["expires"] < time.monotonic():
+                return _error(403, f"CachedContent not found or expired: {name}")
+            if "systemInstruction" in body:
+                return _error(400, "systemInstruction must be set on the cached content, not the request")
+        text = self.reply(body)
+        if method == "streamGenerateContent":
+            words = text.split(" ")
+            lines = "".join(
+                f"data: {json.dumps(_candidate(word + (' ' if i < len(words) - 1 else '')))}\r\n\r\n"
+                for i, word in enumerate(words)
+            )
+            return httpx.Response(200, content=lines.encode("utf-8"), headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json=_candidate(text))
+
+    def _chat(self, body):
+        # Answer through the same reply function, given the messages in Gemini form
+        payload = {"contents": [
+            {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+            for m in body["messages"] if m["role"] != "system"
+        ]}
+        if body.get("response_format", {}).get("type") == "json_object":
+            payload["generationConfig"] = {"responseMimeType": "application/json"}
+        text = self.reply(payload)
+        if body.get("stream"):
+            words = text.split(" ")
+            lines = "".join(
+                f"data: {json.dumps({'choices': [{'delta': {'content': word + (' ' if i < len(words) - 1 else '')}}]})}\n\n"
+                for i, word in enumerate(words)
+            ) + "data: [DONE]\n\n"
+            return httpx.Response(200, content=lines.encode("utf-8"), headers={"content-type": "text/event-stream"})
+        return httpx.Response(200, json={"choices": [{"message": {"role": "assistant", "content": text}}]})
+
+
+def _echo(payload):
+    text = "Hello!"
+    for content in reversed(payload.get("contents", [])):
+        if content.get("role", "user") == "user":
+            text = f"You said: {content['parts'][0]['text']}"
+            break
+    if payload.get("generationConfig", {}).get("responseMimeType") == "application/json":
+        return json.dumps({"summary": text[:200]})
+    return text
+
+
+def _candidate(text):
+    return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}}]}
+
+
+def _seconds(ttl):
+    return float(ttl.rstrip("s"))
+
+
+def _error(status, message):
+    return httpx.Response(status, json={"error": {"code": status, "message": message}})
@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import random
+import time
+
+
+class LeadJob:
+    __slots__ = ("session_id", "args", "status", "lead", "attempts", "finished", "done")
+
+    def __init__(self, session_id, args):
+        self.session_id = session_id
+        self.args = args
+        # "pending" until summarized, then "done", or "failed" once retries are exhausted
+        self.status = "pending"
+        self.lead = None
+        self.attempts = 0
+        self.finished = None
+        self.done = asyncio.Event()
+
+
+class LeadSummaryQueue:
+    """
+    Summarizes finished conversations into leads off the request path. submit() queues a
+    job and returns at once; a fixed number of worker tasks run summarize(session_id, *args)
+    (a coroutine returning the lead dict), retrying failures with jittered backoff. After
+    the last failed attempt fallback(session_id, *args) supplies the lead instead. The latest job per
+    session is kept for result_ttl seconds so /lead can fetch or poll it.
+    """
+
+    def __init__(self, summarize, fallback, workers=2, max_retries=2, backoff=1.0,
+                 max_pending=1000, result_ttl=3600):
+        self.summarize = summarize
+        self.fallback = fallback
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.result_ttl = result_ttl
+        self.failed = 0
+        self.max_pending = max_pending
+        self._queue = None
+        self._jobs = {}
+        self._tasks = []
+
+    def start(self):
+        """Start the workers. Must be called from the running event loop."""
+        if not self._tasks:
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, session_id, *args):
+        """Queue a summary for session_id, replacing any earlier result for it."""
+        self.start()
+        self._expire()
+        job = LeadJob(session_id, args)
+        self._jobs[session_id] = job
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            logging.error(f"Lead summary queue full; using fallback lead for session {session_id}")
+            self._finish(job, "failed", self.fallback(session_id, *args))
+        return job
+
+    def get(self, session_id):
+        self._expire()
+        return self._jobs.get(session_id)
+
+    async def wait(self, session_id, timeout):
+        """Return the job for session_id once it has finished or timeout seconds have passed."""
+        job = self.get(session_id)
+        if job is not None and timeout > 0:
+            try:
+                await asyncio.wait_for(asyncio.shield(job.done.wait()), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    async def _work(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job):
+        while True:
+            job.attempts += 1
+            try:
+                self._finish(job, "done", await self.summarize(job.session_id, *job.args))
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if job.attempts > self.max_retries:
+                    logging.error(f"Lead summary for session {job.session_id} failed after {job.attempts} attempts: {e}")
+                    self.failed += 1
+                    self._finish(job, "failed", self.fallback(job.session_id, *job.args))
+                    return
+                delay = random.uniform(0, self.backoff * (2 ** (job.attempts - 1)))
+                logging.warning(f"Lead summary attempt {job.attempts} failed ({e}), retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def _finish(self, job, status, lead):
+        job.status = status
+        job.lead = lead
+        job.finished = time.monotonic()
+        job.done.set()
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.result_ttl
+        for session_id in [s for s, job in self._jobs.items() if job.finished is not None and job.finished < cutoff]:
+            del self._jobs[session_id]
@@ -0,0 +1,435 @@
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+
+import httpx
+
+from metrics import metrics
+
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+
+
+class LLMUnavailable(Exception):
+    """Every provider failed or was shut off by its circuit breaker."""
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+def is_upstream_failure(error):
+    """
+    True for errors that say the provider is unhealthy (transport errors, timeouts, 408/429/5xx,
+    malformed replies) and so are worth failing over. Other 4xx mean the request itself was
+    rejected and would be rejected anywhere.
+    """
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status >= 500 or status in (408, 429)
+    return True
+
+
+class CircuitBreaker:
+    """
+    Stops calling an upstream that keeps failing. After failure_threshold consecutive failures
+    the circuit opens and calls are refused for reset_timeout seconds; then a single trial call
+    is let through (half-open), and its outcome closes the circuit or opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._trial:
+            self._trial = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial or self.failures >= self.failure_threshold:
+            if self.opened_at is None or self._trial:
+                logging.warning(f"Circuit opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+        self._trial = False
+
+    def record_cancelled(self):
+        # A cancelled call (e.g. the losing side of a hedge) says nothing about the upstream
+        self._trial = False
+
+
+class LLMProvider:
+    """
+    One upstream model. generate(payload) returns the reply text and stream(payload) yields
+    text fragments. Payloads use the Gemini request format (contents, systemInstruction,
+    generationConfig), which other providers translate. At most max_concurrency calls run at
+    a time and every call goes through a circuit breaker. Recent successful calls are timed so
+    the router can tell when a call is running late: durations for generate and time to first
+    byte for stream, kept apart since a whole reply takes much longer than its first fragment.
+    """
+    name = "base"
+    # Whether payloads may reference a Gemini context cache (cachedContent)
+    supports_context_cache = False
+
+    def __init__(self, name=None, max_concurrency=10, breaker=None, window=200):
+        self.name = name or self.name
+        self.max_concurrency = max_concurrency
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = {"generate": deque(maxlen=window), "stream": deque(maxlen=window)}
+        self._semaphore = None
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def available(self):
+        return self.breaker.state != "open"
+
+    def has_capacity(self):
+        return self._semaphore is None or not self._semaphore.locked()
+
+    def _slot(self):
+        # Created on first use so it belongs to the server's event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _generate(self, payload):
+        raise NotImplementedError
+
+    def _stream(self, payload):
+        raise NotImplementedError
+
+    async def generate(self, payload):
+        if not self.breaker.allow():
+            raise CircuitOpen(self.name)
+        async with self._slot():
+            started = time.perf_counter()
+            try:
+                text = await self._generate(payload)
+            except asyncio.CancelledError:
+                self._cancelled()
+                raise
+            except Exception as e:
+                self._failed(e)
+                raise
+            self._timed("generate", time.perf_counter() - started)
+            self._succeeded()
+            return text
+
+    async def stream(self, payload):
+        if not self.breaker.allow():
+            raise CircuitOpen(self.name)
+        async with self._slot():
+            started = time.perf_counter()
+            received = False
+            try:
+                async for fragment in self._stream(payload):
+                    if not received:
+                        received = True
+                        self._timed("stream", time.perf_counter() - started)
+                    yield fragment
+            except (asyncio.CancelledError, GeneratorExit):
+                # Closed early by the consumer: fine if the reply had started, otherwise not a verdict
+                if received:
+                    self._succeeded()
+                else:
+                    self._cancelled()
+                raise
+            except Exception as e:
+                self._failed(e)
+                raise
+            self._succeeded()
+
+    def _timed(self, mode, seconds):
+        self.latencies[mode].append(seconds)
+        metrics.observe("llm_generate_seconds" if mode == "generate" else "llm_first_byte_seconds",
+                        seconds, provider=self.name)
+
+    def _succeeded(self):
+        self.breaker.record_success()
+        metrics.increment("llm_calls", provider=self.name, outcome="ok")
+
+    def _cancelled(self):
+        self.breaker.record_cancelled()
+        metrics.increment("llm_calls", provider=self.name, outcome="cancelled")
+
+    def _failed(self, error):
+        if is_upstream_failure(error):
+            self.breaker.record_failure()
+            metrics.increment("llm_calls", provider=self.name, outcome="error")
+        else:
+            # The upstream answered, it just did not like the request
+            self.breaker.record_success()
+            metrics.increment("llm_calls", provider=self.name, outcome="rejected")
+
+
+class GeminiProvider(LLMProvider):
+    """Gemini through a GeminiClient, which retries transient errors within its own deadline."""
+    name = "gemini"
+
+    def __init__(self, client, context_cache=False, **options):
+        super().__init__(**options)
+        self.client = client
+        self.supports_context_cache = context_cache
+
+    async def start(self):
+        await self.client.start()
+
+    async def close(self):
+        await self.client.close()
+
+    async def _generate(self, payload):
+        return await self.client.generate(payload)
+
+    def _stream(self, payload):
+        return self.client.stream(payload)
+
+
+class OpenAIProvider(LLMProvider):
+    """
+    An OpenAI-compatible chat completions API (OpenRouter by default) over one pooled async
+    client. Gemini-format payloads are translated to chat messages, so payloads must carry
+    their prompt inline rather than through a Gemini context cache.
+    """
+    name = "openrouter"
+
+    def __init__(self, api_key, model, base_url=OPENROUTER_BASE_URL, transport=None, headers=None,
+                 connect_timeout=3.0, read_timeout=15.0, **options):
+        super().__init__(**options)
+        self.api_key = api_key
+        self.model = model
+        self.base_url = base_url
+        self.transport = transport
+        self.headers = headers or {}
+        self.timeout = httpx.Timeout(read_timeout, connect=connect_timeout)
+        self._client = None
+
+    async def start(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"Authorization": f"Bearer {self.api_key or ''}", **self.headers},
+                timeout=self.timeout,
+                transport=self.transport,
+            )
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _generate(self, payload):
+        await self.start()
+        response = await self._client.post("/chat/completions", json=chat_request(self.model, payload))
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    async def _stream(self, payload):
+        await self.start()
+        request = {**chat_request(self.model, payload), "stream": True}
+        async with self._client.stream("POST", "/chat/completions", json=request) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                for choice in json.loads(data).get("choices", [])[:1]:
+                    text = choice.get("delta", {}).get("content")
+                    if text:
+                        yield text
+
+
+def chat_request(model, payload):
+    """Translate a Gemini-format payload into an OpenAI chat completions request."""
+    if "cachedContent" in payload:
+        raise ValueError("Payload references a Gemini context cache; build it inline for this provider")
+    messages = []
+    system = payload.get("systemInstruction")
+    if system:
+        messages.append({"role": "system", "content": "\n\n".join(part.get("text", "") for part in system.get("parts", []))})
+    for content in payload.get("contents", []):
+        messages.append({
+            "role": "assistant" if content.get("role") == "model" else "user",
+            "content": "".join(part.get("text", "") for part in content.get("parts", [])),
+        })
+    request = {"model": model, "messages": messages}
+    config = payload.get("generationConfig", {})
+    if config.get("responseMimeType") == "application/json":
+        request["response_format"] = {"type": "json_object"}
+    if "maxOutputTokens" in config:
+        request["max_tokens"] = config["maxOutputTokens"]
+    if "temperature" in config:
+        request["temperature"] = config["temperature"]
+    return request
+
+
+class LLMRouter:
+    """
+    Sends each request to the first provider whose circuit is not open and fails over down
+    the list when a provider errors. Requests are hedged: if the provider has not produced its
+    reply (generate) or first byte (stream) within its recent hedge_quantile latency for that
+    kind of call (hedge_after seconds until it has min_samples of them), the same request also goes to the next provider with spare capacity
+    and whichever answers first wins; the other call is cancelled. A stream is committed to
+    whichever provider sent its first fragment, so errors after that are not failed over.
+    Errors that reject the request itself (4xx other than 408/429) are raised at once.
+
+    payload may be a dict or a coroutine function taking the provider and returning the
+    dict, for payloads that depend on the provider (e.g. whether it can use a context cache).
+    """
+
+    def __init__(self, providers, hedge=True, hedge_quantile=0.95, hedge_after=2.0,
+                 min_hedge_delay=0.25, min_samples=20):
+        self.providers = list(providers)
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_after = hedge_after
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+
+    async def start(self):
+        for provider in self.providers:
+            await provider.start()
+
+    async def close(self):
+        for provider in self.providers:
+            await provider.close()
+
+    def hedge_delay(self, provider, mode="stream"):
+        """How long to wait for provider's reply (mode "generate") or first byte ("stream") before hedging."""
+        samples = sorted(provider.latencies[mode])
+        if len(samples) < self.min_samples:
+            return self.hedge_after
+        return max(self.min_hedge_delay, samples[min(len(samples) - 1, int(self.hedge_quantile * len(samples)))])
+
+    async def generate(self, payload, hedge=True):
+        """
+        Return the reply text from whichever provider answers first. Pass hedge=False for
+        background calls nobody is waiting on: they still fail over but never run twice.
+        """
+        async def call(provider):
+            return await provider.generate(await _resolve(payload, provider))
+        return await self._race(call, mode="generate", hedge=hedge)
+
+    async def stream(self, payload):
+        """Yield reply fragments from whichever provider starts answering first."""
+        async def call(provider):
+            fragments = provider.stream(await _resolve(payload, provider))
+            try:
+                first = await fragments.__anext__()
+            except StopAsyncIteration:
+                first = None
+            except BaseException:
+                await fragments.aclose()
+                raise
+            return first, fragments
+
+        async def discard(opened):
+            await opened[1].aclose()
+
+        first, fragments = await self._race(call, discard, mode="stream")
+        try:
+            if first is not None:
+                yield first
+            async for fragment in fragments:
+                yield fragment
+        finally:
+            await fragments.aclose()
+
+    async def _race(self, call, discard=None, mode="stream", hedge=True):
+        providers = [provider for provider in self.providers if provider.available()]
+        if not providers:
+            raise LLMUnavailable("Every LLM provider's circuit is open")
+        pending = {}
+        errors = []
+        next_index = 0
+        launched_at = 0.0
+        hedged = False
+
+        def launch():
+            nonlocal next_index, launched_at
+            provider = providers[next_index]
+            next_index += 1
+            launched_at = time.monotonic()
+            pending[asyncio.ensure_future(call(provider))] = provider
+            return provider
+
+        def can_hedge():
+            return (self.hedge and hedge and not hedged and next_index < len(providers)
+                    and providers[next_index].has_capacity())
+
+        leader = launch()
+        winner = None
+        try:
+            while pending:
+                timeout = None
+                if can_hedge():
+                    timeout = max(0.0, launched_at + self.hedge_delay(leader, mode) - time.monotonic())
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    hedged = True
+                    metrics.increment("llm_hedges", provider=launch().name)
+                    continue
+                for task in done:
+                    provider = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        if not is_upstream_failure(e):
+                            raise
+                        logging.warning(f"LLM provider {provider.name} failed: {e!r}")
+                        errors.append(f"{provider.name}: {e!r}")
+                        continue
+                    if winner is None:
+                        winner = (provider, result)
+                    elif discard is not None:
+                        await discard(result)
+                if winner is not None:
+                    provider, result = winner
+                    if hedged:
+                        metrics.increment("llm_hedge_wins", provider=provider.name)
+                    return result
+                if not pending and next_index < len(providers):
+                    leader = launch()
+                    hedged = False
+                    metrics.increment("llm_failovers", provider=leader.name)
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+            for task in pending:
+                # A loser that finished before it could be cancelled still has to be closed
+                if not task.cancelled() and task.exception() is None and discard is not None:
+                    await discard(task.result())
+        raise LLMUnavailable("; ".join(errors))
+
+
+async def _resolve(payload, provider):
+    return await payload(provider) if callable(payload) else payload
@@ -1,18 +1,50 @@
 from fastapi import FastAPI, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, RedirectResponse, StreamingResponse
 from fastapi import Response
-from fastapi.staticfiles import StaticFiles
 import uvicorn
-from tts import speak, text_to_speech
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from tts import synthesize, AUDIO_FORMATS
+from tts_engines import create_engine, LocalTTSEngine
+from sessions import SessionStore
+from tts_worker import TTSWorkerPool
+from tts_cache import TTSCache
+from audio_store import AudioArtifactManager, parse_range, read_bytes
+from gemini_client import GeminiClient, ContextCache
+from gemini_stub import StubGemini
+from llm import GeminiProvider, OpenAIProvider, LLMRouter, CircuitBreaker
+from streaming import iter_sentences, synthesize_in_order
+import stt
+from model_registry import registry
+from event_log import EventLogHandler, get_event_log
+from metrics import metrics, timer, start_request_timing, stop_request_timing, server_timing_header
+from retrieval import KnowledgeIndex, estimate_tokens
+from response_cache import ResponseCache, is_cacheable
+from conversation import (LEAD_FIELDS, build_context_update, build_lead_summary, format_turns,
+                          parse_context_update, recent_turns)
+from speculation import Speculator
+from store import ConversationStore
+from lead_jobs import LeadSummaryQueue
+from admission import Limiter, Overloaded, TokenBucket
+from contextlib import asynccontextmanager
 import os as _os
 import random
 import logging
-import httpx
+import json
+import mimetypes
+import re
 import os
+import hashlib
+import hmac
+import time
+import httpx
 from dotenv import load_dotenv
 from datetime import datetime
 
+# Load environment variables from .env
+load_dotenv()
+
 app = FastAPI()
 
 app.add_middleware(
@@ -21,27 +53,128 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Id"],
 )
 
+# --- Metrics ---
+# Per-stage latency summaries and counters, scraped as Prometheus text from /metrics.
+# WILLOW_SERVER_TIMING=1 also reports each request's stages in a Server-Timing header
+# (stages that finish before the response headers are sent).
+SERVER_TIMING = os.getenv("WILLOW_SERVER_TIMING") == "1"
+metrics.describe("stage_seconds", "Time spent in each pipeline stage")
+metrics.describe("request_seconds", "HTTP request latency by route")
+metrics.describe("errors", "Stages that raised")
+metrics.describe("fallbacks", "Turns answered with the fallback reply")
+metrics.describe("event_loop_lag_seconds", "How late the event loop woke from a timed sleep")
+metrics.describe("llm_first_byte_seconds", "Time to the first byte of each LLM provider's streamed reply")
+metrics.describe("llm_generate_seconds", "Time each LLM provider took to return a whole (non-streamed) reply")
+metrics.describe("llm_calls", "LLM provider calls by outcome")
+metrics.describe("llm_hedges", "Requests hedged to a second provider, by the provider hedged to")
+metrics.describe("llm_hedge_wins", "Hedged requests by the provider that answered first")
+metrics.describe("llm_failovers", "Requests failed over after a provider error, by fallback")
+metrics.describe("vad_frames", "Audio frames passed to speech recognition or skipped as silence")
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    timings = start_request_timing()
+    started = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.observe("request_seconds", time.perf_counter() - started, method=request.method,
+                    route=route.path if route is not None else "unmatched")
+    if SERVER_TIMING and timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+    return response
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
+
+def collect_component_metrics():
+    yield "sessions", "gauge", len(sessions), {}
+    yield "reply_cache_lookups_total", "counter", response_cache.hits, {"result": "hit"}
+    yield "reply_cache_lookups_total", "counter", response_cache.misses, {"result": "miss"}
+    yield "tts_cache_lookups_total", "counter", tts_cache.hits, {"result": "hit"}
+    yield "tts_cache_lookups_total", "counter", tts_cache.misses, {"result": "miss"}
+    yield "tts_cache_bytes", "gauge", tts_cache.total_bytes, {}
+    yield "audio_files_deleted_total", "counter", audio_files.deleted, {}
+    yield "lead_summaries_failed_total", "counter", lead_jobs.failed, {}
+    yield "log_records_dropped_total", "counter", event_log.dropped, {}
+    yield "store_writes_dropped_total", "counter", store.dropped, {}
+    for provider in llm.providers:
+        yield "llm_circuit_open", "gauge", int(provider.breaker.state != "closed"), {"provider": provider.name}
+    for name, status in registry.status().items():
+        yield "model_loaded", "gauge", int(status["state"] == "loaded"), {"model": name}
+
+metrics.add_collector(collect_component_metrics)
+
+# Anything that blocks the event loop (sync I/O, CPU work) shows up as lag here
+LOOP_LAG_INTERVAL = float(os.getenv("WILLOW_LOOP_LAG_INTERVAL", "0.25"))
+_loop_monitor = None
+
+async def monitor_event_loop():
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        metrics.observe("event_loop_lag_seconds", max(0.0, loop.time() - started - LOOP_LAG_INTERVAL))
+
+@app.on_event("startup")
+async def start_loop_monitor():
+    global _loop_monitor
+    _loop_monitor = asyncio.ensure_future(monitor_event_loop())
+
+@app.on_event("shutdown")
+async def stop_loop_monitor():
+    if _loop_monitor is not None:
+        _loop_monitor.cancel()
+
 # --- Logging Setup ---
-# Log all interactions and errors to a file for review and compliance
-logging.basicConfig(
-    filename="interaction.log",
-    level=logging.INFO,
-    format="%(asctime)s %(levelname)s %(message)s"
+# Log all interactions and errors as JSON Lines for review and compliance. Records go through
+# a queue to a writer thread, so a slow disk never blocks a request.
+event_log = get_event_log().start()
+logging.getLogger().setLevel(logging.INFO)
+logging.getLogger().addHandler(EventLogHandler(event_log))
+
+def log_interaction(role, text, session_id=None, stage="chat", **timings):
+    """Log every user/bot message for review and compliance, with any stage timings in ms."""
+    event_log.log("turn", session_id=session_id, role=role, stage=stage, text=text, **timings)
+
+# Per-visitor conversation state, keyed by a session id sent as a cookie or header
+SESSION_COOKIE = "willow_session"
+SESSION_HEADER = "X-Session-Id"
+
+sessions = SessionStore(
+    max_sessions=int(os.getenv("WILLOW_MAX_SESSIONS", "1000")),
+    ttl=float(os.getenv("WILLOW_SESSION_TTL", "1800")),
+    on_evict=lambda session_id: audio_files.release_session(session_id),
 )
 
-def log_interaction(role, text):
-    """Log every user/bot message for review and compliance."""
-    logging.info(f"{role.upper()}: {text}")
-
-# Simple in-memory state for demo (use a database or session in production)
-conversation_state = {
-    "step": 0,
-    "lead": {},
-    # Store the full transcript for review and recovery
-    "history": []
-}
+def get_session(request):
+    """Return the caller's session, creating one if the id is missing or expired."""
+    # Browsers cannot set headers on websockets, so a query parameter is accepted too
+    session_id = (request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+                  or request.query_params.get("session_id"))
+    return sessions.get_or_create(session_id)
+
+def with_session(response, session):
+    """Attach the session id to a response so the browser sends it back next turn."""
+    response.set_cookie(SESSION_COOKIE, session.session_id, httponly=True, samesite="lax")
+    response.headers[SESSION_HEADER] = session.session_id
+    return response
+
+# Fixed bot replies. Their audio is synthesized once at startup and then served from the TTS cache.
+FALLBACK_REPLY = "Sorry, the AI backend is currently unavailable. Please try again later."
+ERROR_REPLY = "Sorry, something went wrong. Please try again later."
+FAREWELL_REPLY = "Thank you for chatting with Willow AI! I've summarized your requirements for our team. Have a great day!"
+SAMPLE_VIDEO_URL = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
+DEMO_VIDEO_REPLY = (
+    f"Absolutely! Here's a quick demo video of Willow AI in action: {SAMPLE_VIDEO_URL}\n"
+    "This video will show you how Willow AI engages leads, qualifies them, and books meetings in real time. Let me know if you have any questions after watching!"
+)
+# Sent instead of a real reply when the server is too busy to take the turn
+BUSY_REPLY = "One moment, please. I'm helping a lot of visitors right now. Could you say that again in a few seconds?"
+CANNED_REPLIES = [BUSY_REPLY, FALLBACK_REPLY, ERROR_REPLY, FAREWELL_REPLY, DEMO_VIDEO_REPLY]
 
 qualifying_questions = [
     ("company", "What is your company name?"),
@@ -50,25 +183,101 @@ qualifying_questions = [
     ("budget", "What is your budget for this project?")
 ]
 
-# Load environment variables from .env
-load_dotenv()
-
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY')
-GEMINI_API_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={GEMINI_API_KEY}"
 
-async def get_gemini_reply(prompt):
-    payload = {
+# WILLOW_GEMINI_STUB=1 answers from a local stand-in instead of the real API (no network or key needed),
+# after WILLOW_GEMINI_STUB_LATENCY seconds per call
+gemini_stub = (StubGemini(latency=float(os.getenv("WILLOW_GEMINI_STUB_LATENCY", "0")))
+               if os.getenv("WILLOW_GEMINI_STUB") == "1" else None)
+
+# One pooled client for the whole process; connections stay warm between turns
+gemini = GeminiClient(
+    GEMINI_API_KEY,
+    model=os.getenv("WILLOW_GEMINI_MODEL", "gemini-2.0-flash"),
+    transport=gemini_stub.transport() if gemini_stub else None,
+    max_connections=int(os.getenv("WILLOW_GEMINI_MAX_CONNECTIONS", "20")),
+    connect_timeout=float(os.getenv("WILLOW_GEMINI_CONNECT_TIMEOUT", "3")),
+    read_timeout=float(os.getenv("WILLOW_GEMINI_READ_TIMEOUT", "15")),
+    deadline=float(os.getenv("WILLOW_GEMINI_DEADLINE", "20")),
+    max_retries=int(os.getenv("WILLOW_GEMINI_MAX_RETRIES", "3")),
+)
+
+# The system prompt and knowledge base are the same for every turn. They are uploaded once into a
+# Gemini context cache (refreshed before it expires) and each request carries only the conversation.
+# Set WILLOW_GEMINI_CONTEXT_CACHE=0 to always send them inline as systemInstruction. Prefixes
+# below the model's minimum cacheable size (WILLOW_GEMINI_CACHE_MIN_TOKENS) always go inline.
+CONTEXT_CACHE_ENABLED = os.getenv("WILLOW_GEMINI_CONTEXT_CACHE", "1") == "1"
+context_cache = ContextCache(gemini, ttl=int(os.getenv("WILLOW_GEMINI_CACHE_TTL", "3600")),
+                             min_tokens=int(os.getenv("WILLOW_GEMINI_CACHE_MIN_TOKENS", "4096")))
+
+# --- LLM providers ---
+# Every LLM call goes through one router: Gemini first, then the fallbacks that are configured
+# (another Gemini model, OpenRouter). Each provider has its own concurrency limit and circuit
+# breaker; a call still waiting for its first byte past the provider's p95 is hedged to the next.
+def provider_options(name, default_concurrency):
+    prefix = f"WILLOW_{name.upper()}"
+    return {
+        "max_concurrency": int(os.getenv(f"{prefix}_CONCURRENCY", str(default_concurrency))),
+        "breaker": CircuitBreaker(
+            failure_threshold=int(os.getenv("WILLOW_LLM_BREAKER_FAILURES", "5")),
+            reset_timeout=float(os.getenv("WILLOW_LLM_BREAKER_RESET", "30")),
+        ),
+    }
+
+llm_providers = [GeminiProvider(gemini, context_cache=CONTEXT_CACHE_ENABLED, **provider_options("gemini", 20))]
+
+GEMINI_FALLBACK_MODEL = os.getenv("WILLOW_GEMINI_FALLBACK_MODEL")
+if GEMINI_FALLBACK_MODEL:
+    # Context caches belong to one model, so the fallback model always gets the prompt inline
+    llm_providers.append(GeminiProvider(
+        GeminiClient(GEMINI_API_KEY, model=GEMINI_FALLBACK_MODEL, transport=gemini.transport,
+                     deadline=gemini.deadline, max_retries=1),
+        name="gemini_fallback", **provider_options("gemini_fallback", 10)))
+
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
+if OPENROUTER_API_KEY or gemini_stub:
+    llm_providers.append(OpenAIProvider(
+        OPENROUTER_API_KEY,
+        model=os.getenv("WILLOW_OPENROUTER_MODEL", "openai/gpt-4o-mini"),
+        transport=gemini_stub.transport() if gemini_stub else None,
+        headers={"HTTP-Referer": "http://localhost:3000", "X-Title": "Willow AI SDR"},
+        **provider_options("openrouter", 10)))
+
+llm = LLMRouter(
+    llm_providers,
+    hedge=os.getenv("WILLOW_LLM_HEDGE", "1") == "1",
+    hedge_after=float(os.getenv("WILLOW_LLM_HEDGE_AFTER", "2")),
+)
+
+@app.on_event("startup")
+async def start_llm_providers():
+    await llm.start()
+    if CONTEXT_CACHE_ENABLED:
+        # Create the context cache now rather than on the first visitor's turn
+        refresh_knowledge_base()
+        asyncio.ensure_future(context_cache.refresh())
+
+@app.on_event("shutdown")
+async def close_llm_providers():
+    await llm.close()
+
+def build_gemini_payload(prompt):
+    return {
         "contents": [
             {"parts": [{"text": prompt}]}
         ]
     }
+
+async def get_gemini_reply(prompt, stage="gemini", hedge=True):
+    """
+    Generate a reply through the LLM router, timed as stage. prompt is a plain string, a prebuilt
+    request payload, or a coroutine function building the payload for a given provider.
+    Background jobs pass hedge=False: with nobody waiting, a hedge would only double the spend.
+    """
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(GEMINI_API_URL, json=payload, timeout=15)
-            response.raise_for_status()
-            data = response.json()
-            # Gemini returns: candidates[0].content.parts[0].text
-            return data["candidates"][0]["content"]["parts"][0]["text"]
+        with timer(stage):
+            return await llm.generate(build_gemini_payload(prompt) if isinstance(prompt, str) else prompt,
+                                      hedge=hedge)
     except Exception as e:
         # Log the error and return a fallback message
         logging.error(f"Gemini API error: {e}")
@@ -78,119 +287,341 @@ async def get_gemini_reply(prompt):
 async def root():
     return {"message": "Backend up"}
 
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 200 once every required model has loaded, 503 with per-model status until then."""
+    is_ready = registry.ready()
+    return JSONResponse({"ready": is_ready, "models": registry.status()}, status_code=200 if is_ready else 503)
+
+# Vosk decoding is CPU-bound, so recognizers run on a worker pool instead of the event loop
+stt_executor = ThreadPoolExecutor(max_workers=int(os.getenv("WILLOW_STT_WORKERS", "4")), thread_name_prefix="stt")
+
+@app.on_event("shutdown")
+async def shutdown_stt_executor():
+    stt_executor.shutdown(wait=False)
+
 @app.websocket("/ws/audio")
 async def websocket_endpoint(websocket: WebSocket):
+    """
+    Streaming voice endpoint. Binary frames are 16-bit mono PCM (sample rate from the
+    sample_rate query parameter, 16 kHz by default); partial and final transcripts are
+    sent back as JSON frames and each final transcript goes through the same conversation
+    pipeline as /talk. Text frames carry either a typed {"message": ...} or {"type": "flush"}
+    to finalize the current utterance. Problems are reported as {"type": "error"} frames: if
+    speech recognition cannot start (no Vosk model, bad sample_rate) the socket stays open
+    for typed messages only, and a frame that fails to decode is dropped.
+    """
     await websocket.accept()
+    session = get_session(websocket)
     print("🎤 Connected to frontend")
-
-    while True:
+    await websocket.send_json({"type": "session", "session_id": session.session_id})
+
+    loop = asyncio.get_running_loop()
+    audio_format = choose_audio_format(websocket)
+    recognizer = None
+    # Set when speech recognition cannot run for this socket; typed messages still work
+    audio_unavailable = False
+    last_partial = ""
+    turns = set()
+    # Starts the reply from a steady partial transcript; see start_speculation
+    speculator = Speculator(lambda text: start_speculation(session, text), SPECULATE_STABLE,
+                            discard=waste_speculation) if SPECULATE else None
+
+    async def send_error(error, **details):
         try:
-            data = await websocket.receive_bytes()
-            print("🔊 Received audio data:", len(data))
+            await websocket.send_json({"type": "error", "error": error, **details})
+        except Exception:
+            # The socket is already gone
+            pass
+
+    def open_recognizer():
+        sample_rate = int(websocket.query_params.get("sample_rate", stt.SAMPLE_RATE))
+        if not 8000 <= sample_rate <= 48000:
+            raise ValueError(f"unsupported sample_rate {sample_rate}")
+        return stt.StreamingRecognizer(sample_rate)
+
+    async def respond(user_text, speculation=None):
+        wait = rate_limited(session)
+        if wait:
+            if speculation is not None:
+                speculator.abandon(speculation)
+            await websocket.send_json({"type": "error", "error": "rate_limited", "retry_after": round(wait, 1)})
+            return
+        async with session.lock:
+            try:
+                async with admit(user_text):
+                    async for event in stream_turn(session, user_text, audio_format, speculation):
+                        await websocket.send_json(event)
+            except Overloaded:
+                if speculation is not None:
+                    speculator.abandon(speculation)
+                await websocket.send_json({"type": "done", **busy_reply(session)})
+            except Exception:
+                logging.exception("/ws/audio turn failed")
+                await send_error("turn_failed", reply=ERROR_REPLY, audio_url=canned_audio_url(ERROR_REPLY))
+
+    def start_turn(user_text, speculation=None):
+        # Run the reply in the background so recognition keeps up with incoming audio
+        task = asyncio.ensure_future(respond(user_text, speculation))
+        turns.add(task)
+        task.add_done_callback(turns.discard)
+
+    async def finish_utterance(text):
+        nonlocal last_partial
+        last_partial = ""
+        speculation = None
+        if speculator is not None:
+            if text:
+                speculation = speculator.take(text)
+            else:
+                speculator.cancel()
+        if text:
+            metrics.increment("voice_turns")
+            await websocket.send_json({"type": "final", "text": text})
+            start_turn(text, speculation)
 
-            # (STT → Bot Logic → TTS → send audio back)
-            await websocket.send_text("Hello from backend!")  # TEMP
-        except Exception as e:
-            print("❌ Error:", e)
-            break
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("text") is not None:
+                try:
+                    frame = json.loads(message["text"])
+                    if not isinstance(frame, dict):
+                        raise ValueError("expected a JSON object")
+                except ValueError as e:
+                    await send_error("bad_frame", detail=str(e))
+                    continue
+                if frame.get("type") == "flush":
+                    if recognizer is not None:
+                        try:
+                            text = await loop.run_in_executor(stt_executor, recognizer.flush)
+                        except Exception as e:
+                            logging.exception("Speech recognition failed on /ws/audio")
+                            recognizer = None
+                            await send_error("stt_failed", detail=str(e))
+                            continue
+                        await finish_utterance(text)
+                    continue
+                # Text frames carry a chat message; stream the reply back sentence by sentence
+                user_text = (frame.get("message") or "").strip()
+                if user_text:
+                    start_turn(user_text)
+                continue
+
+            data = message.get("bytes") or b""
+            if audio_unavailable:
+                continue
+            if recognizer is None:
+                try:
+                    recognizer = await loop.run_in_executor(stt_executor, open_recognizer)
+                except Exception as e:
+                    # No model, or a sample rate we cannot decode: carry on with typed messages only
+                    logging.exception("Speech recognition unavailable on /ws/audio")
+                    audio_unavailable = True
+                    await send_error("stt_unavailable", detail=str(e))
+                    continue
+            try:
+                kind, text = await loop.run_in_executor(stt_executor, recognizer.accept, data)
+            except Exception as e:
+                # Start the next utterance on a fresh recognizer
+                logging.exception("Speech recognition failed on /ws/audio")
+                recognizer = None
+                last_partial = ""
+                await send_error("stt_failed", detail=str(e))
+                continue
+            if kind == "final":
+                await finish_utterance(text)
+            elif text and text != last_partial:
+                last_partial = text
+                if speculator is not None:
+                    speculator.partial(text)
+                await websocket.send_json({"type": "partial", "text": text})
+    except Exception as e:
+        logging.exception("/ws/audio connection failed")
+        await send_error("internal", detail=str(e))
+        try:
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        if speculator is not None:
+            speculator.cancel()
+        for task in list(turns):
+            task.cancel()
 
 @app.options("/talk")
 async def options_talk():
     return {}
 
 @app.post("/reset")
-async def reset():
-    conversation_state["step"] = 0
-    conversation_state["lead"] = {}
-    conversation_state["history"] = []
-    return {"status": "reset"}
+async def reset(request: Request):
+    session = get_session(request)
+    async with session.lock:
+        session.reset()
+    # The visitor started over, so audio from the old conversation is no longer needed
+    audio_files.release_session(session.session_id)
+    return with_session(JSONResponse({"status": "reset"}), session)
 
 @app.post("/lead")
 async def get_lead(request: Request):
     """
-    Endpoint to finalize and fetch the lead summary. Handles errors and logs all actions.
+    Finalize the lead if a message is given, else return the lead summary. Summaries are
+    written in the background; pass "wait" (seconds) to wait for a pending one.
     """
+    session = get_session(request)
     try:
         data = await request.json()
+    except Exception:
+        data = {}
+    try:
         user_text = (data.get("message") or "").strip()
-        lead = conversation_state.get("lead", {})
-        # If a message is provided, treat this as a lead finalization request
         if user_text:
-            # Compose a summary prompt for Gemini
-            conversation_str = "\n".join([
-                ("User: " + h["text"]) if h["role"] == "user" else ("Jane: " + h["text"]) for h in conversation_state["history"]
-            ])
-            summary_prompt = f"""
-Summarize this sales conversation in 5-6 sentences for a human sales agent. Include:
-- The user's name, company, and role (if provided)
-- The user's requirements and main problem
-- Any objections or concerns
-- Budget (if mentioned)
-- Any other relevant details for handoff
-
-Conversation:
-{conversation_str}
-
-Now, output a JSON object with the following fields: company, domain, problem, budget, summary, user_last_message, and a short summary for the agent. If any field is missing, set it to null. Example:
-{{
-  "company": ...,
-  "domain": ...,
-  "problem": ...,
-  "budget": ...,
-  "summary": ...,
-  "user_last_message": ...,
-  "agent_summary": ...
-}}
-"""
-            gemini_json = await get_gemini_reply(summary_prompt)
-            if not gemini_json:
-                bot_reply = "Sorry, the AI backend is currently unavailable. Please try again later."
-                log_interaction("bot", bot_reply)
-                return JSONResponse({
-                    "reply": bot_reply,
-                    "lead": None,
-                    "end": True
-                })
-            import json
-            try:
-                lead_summary = json.loads(gemini_json)
-            except Exception:
-                lead_summary = {
-                    "summary": gemini_json,
-                    "conversation": conversation_state["history"][:],
-                    "user_last_message": user_text,
-                    "company": lead.get("company"),
-                    "domain": lead.get("domain"),
-                    "problem": lead.get("problem"),
-                    "budget": lead.get("budget"),
-                    "agent_summary": None
-                }
-            lead_summary["conversation"] = conversation_state["history"][:]
-            conversation_state["lead"] = lead_summary
-            bot_reply = "Thank you for chatting with Willow AI! I've summarized your requirements for our team. Have a great day!"
-            conversation_state["history"].append({"role": "bot", "text": bot_reply})
-            log_interaction("bot", bot_reply)
-            lead_summary["conversation"] = conversation_state["history"][:]
-            return JSONResponse({
-                "reply": bot_reply,
-                "showImage": False,
-                "lead": lead_summary,
-                "end": True,
-                "youtube_url": None
-            })
-        # Otherwise, just return the current lead
-        return JSONResponse({"lead": lead})
+            async with session.lock:
+                return with_session(JSONResponse(end_conversation(session, user_text)), session)
+        # Polling does not touch the conversation, so it does not wait for the session lock
+        return with_session(JSONResponse(await lead_status(session, data.get("wait"))), session)
     except Exception as e:
         logging.error(f"/lead endpoint error: {e}")
-        return JSONResponse({
-            "reply": "Sorry, something went wrong. Please try again later.",
+        return with_session(JSONResponse({
+            "reply": ERROR_REPLY,
+            "audio_url": canned_audio_url(ERROR_REPLY),
             "lead": None,
             "end": True
-        })
+        }), session)
+
+@app.get("/lead")
+async def poll_lead(request: Request, wait: float = 0):
+    """Fetch the lead summary for the session, waiting up to wait seconds while it is pending."""
+    session = get_session(request)
+    return with_session(JSONResponse(await lead_status(session, wait)), session)
+
+# Lead summaries run on a small pool of background workers so the farewell is not held up by Gemini
+LEAD_MAX_WAIT = 30
+
+async def summarize_lead(session_id, conversation_id, conversation_str, facts, user_text):
+    reply = await get_gemini_reply(build_lead_summary(conversation_str), stage="gemini_lead_summary",
+                                   hedge=False)
+    lead_summary = json.loads(reply) if reply else None
+    if not isinstance(lead_summary, dict):
+        raise ValueError(f"unusable lead summary: {reply!r}")
+    # Keep facts gathered during the call that the summary left out
+    for field, value in facts.items():
+        if lead_summary.get(field) is None:
+            lead_summary[field] = value
+    lead_summary["user_last_message"] = user_text
+    lead_summary["conversation_id"] = conversation_id
+    store.save_lead(conversation_id, session_id, lead_summary, "done")
+    return lead_summary
+
+def fallback_lead(session_id, conversation_id, conversation_str, facts, user_text):
+    """Lead handed over when Gemini could not summarize: the collected facts (and, in the store, the transcript)."""
+    lead_summary = {field: facts.get(field) for field in LEAD_FIELDS}
+    lead_summary.update({
+        "summary": None,
+        "agent_summary": None,
+        "user_last_message": user_text,
+        "conversation_id": conversation_id,
+    })
+    store.save_lead(conversation_id, session_id, lead_summary, "failed")
+    return lead_summary
+
+lead_jobs = LeadSummaryQueue(
+    summarize_lead,
+    fallback_lead,
+    workers=int(os.getenv("WILLOW_LEAD_WORKERS", "2")),
+    max_retries=int(os.getenv("WILLOW_LEAD_RETRIES", "2")),
+)
+
+@app.on_event("startup")
+async def start_lead_jobs():
+    lead_jobs.start()
+
+@app.on_event("shutdown")
+async def stop_lead_jobs():
+    await lead_jobs.stop()
+
+def end_conversation(session, user_text=None):
+    """Queue the lead summary and say goodbye without waiting for it. The caller must hold session.lock."""
+    user_text = user_text or next((h["text"] for h in reversed(session.history) if h["role"] == "user"), None)
+    lead_jobs.submit(session.session_id, session.conversation_id, conversation_for_summary(session),
+                     dict(session.lead), user_text)
+    bot_reply = FAREWELL_REPLY
+    # The conversation is over, so no summary update is needed
+    record_turn(session, "bot", bot_reply)
+    return {
+        "reply": bot_reply,
+        "audio_url": canned_audio_url(bot_reply),
+        "showImage": False,
+        "lead": session.lead,
+        "lead_status": "pending",
+        "end": True,
+        "youtube_url": None
+    }
+
+async def lead_status(session, wait=None):
+    job = await lead_jobs.wait(session.session_id, min(float(wait or 0), LEAD_MAX_WAIT))
+    if job is None:
+        return {"lead": session.lead, "lead_status": None}
+    if job.lead is None:
+        return {"lead": session.lead, "lead_status": job.status}
+    lead = dict(job.lead)
+    lead["conversation"] = await asyncio.get_running_loop().run_in_executor(None, store.turns, lead["conversation_id"])
+    return {"lead": lead, "lead_status": job.status}
+
+# --- Lead dashboard API ---
+# These endpoints require "Authorization: Bearer <WILLOW_ADMIN_TOKEN>" and are disabled while it is unset
+ADMIN_TOKEN = os.getenv("WILLOW_ADMIN_TOKEN")
+LEADS_MAX_PAGE = 200
+
+def admin_denied(request):
+    if not ADMIN_TOKEN:
+        return JSONResponse({"error": "lead endpoints are disabled until WILLOW_ADMIN_TOKEN is set"},
+                            status_code=403)
+    if not hmac.compare_digest(request.headers.get("authorization", ""), f"Bearer {ADMIN_TOKEN}"):
+        return JSONResponse({"error": "unauthorized"}, status_code=401)
+    return None
+
+def requested_fields(fields):
+    return [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+@app.get("/leads")
+async def list_leads(request: Request, limit: int = 50, cursor: int = None, company: str = None,
+                     domain: str = None, q: str = None, since: float = None, until: float = None,
+                     fields: str = None):
+    """
+    Saved leads, newest first. Pages are keyset-paginated: pass the returned next_cursor as
+    cursor for the next page. company and domain match exactly (case-insensitive), q searches
+    company, domain, problem and summary, and fields picks the returned columns.
+    """
+    denied = admin_denied(request)
+    if denied:
+        return denied
+    leads, next_cursor = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: store.list_leads(max(1, min(limit, LEADS_MAX_PAGE)), cursor, company, domain, q,
+                                       since, until, requested_fields(fields)))
+    return {"leads": leads, "next_cursor": next_cursor}
+
+@app.get("/leads/{lead_id}")
+async def get_saved_lead(request: Request, lead_id: int, fields: str = None):
+    """One saved lead with its full transcript."""
+    denied = admin_denied(request)
+    if denied:
+        return denied
+    lead = await asyncio.get_running_loop().run_in_executor(None, store.get_lead, lead_id, requested_fields(fields))
+    if lead is None:
+        return JSONResponse({"error": "not found"}, status_code=404)
+    return lead
+
+@app.delete("/leads/{lead_id}")
+async def delete_saved_lead(request: Request, lead_id: int):
+    denied = admin_denied(request)
+    if denied:
+        return denied
+    store.delete_lead(lead_id)
+    return {"status": "deleted"}
 
-if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
-    
 SYSTEM_PROMPT = '''
 Role & Objective:
 You are Jane, an AI SDR for Willow AI, an AI-powered sales agent designed to engage, qualify, and convert inbound leads for B2B companies. Your job is to:
@@ -390,32 +821,499 @@ There is GEO (Generative Engine Optimization) that's helping a lot of businesses
 9️⃣ What happens if AI doesn’t know the answer?✅ Willow AI routes the conversation to a human agent if needed.✅ It can also capture the question and follow up via email once a rep provides the answer.
 '''
 
-# Store conversation history in memory (for demo, just last 10 turns)
-if "history" not in conversation_state:
-    conversation_state["history"] = []
-
-# Update speak/text_to_speech usage to save files in audio_dir
-from tts import text_to_speech as _orig_text_to_speech
+# Retrieval index over the knowledge base so prompts only carry the relevant sections.
+# Set WILLOW_KB_PATH to load a customer KB from a file; it is re-indexed when the file changes.
+KB_PATH = os.getenv("WILLOW_KB_PATH")
+KB_TOP_K = int(os.getenv("WILLOW_KB_TOP_K", "4"))
+KB_TOKEN_BUDGET = int(os.getenv("WILLOW_KB_TOKEN_BUDGET", "800"))
+kb_index = KnowledgeIndex(KNOWLEDGE_BASE)
 
-audio_dir = _os.path.join(_os.path.abspath(_os.path.dirname(__file__)), "audio")
+def refresh_knowledge_base():
+    """Re-index WILLOW_KB_PATH if it changed and keep the cached prompt prefix in step."""
+    if KB_PATH:
+        try:
+            kb_index.refresh_from_file(KB_PATH)
+        except OSError as e:
+            logging.error(f"Could not load knowledge base from {KB_PATH}: {e}")
+    if CONTEXT_CACHE_ENABLED:
+        update_prompt_prefix()
+
+def knowledge_for(history):
+    """Knowledge base sections relevant to the latest user turns."""
+    # The previous user turn helps with follow-ups like "and how much does that cost?"
+    user_turns = [h["text"] for h in history if h["role"] == "user"]
+    query = " ".join(user_turns[-2:])
+    return kb_index.context_for(query, KB_TOP_K, KB_TOKEN_BUDGET)
+
+audio_dir = os.getenv("WILLOW_AUDIO_DIR") or _os.path.join(_os.path.abspath(_os.path.dirname(__file__)), "audio")
 _os.makedirs(audio_dir, exist_ok=True)
-app.mount("/audio", StaticFiles(directory=audio_dir), name="audio")
 
-def speak(text):
+tts_pool = TTSWorkerPool(max_workers=int(os.getenv("WILLOW_TTS_WORKERS", "4")))
+
+@app.on_event("shutdown")
+async def shutdown_tts_pool():
+    tts_pool.shutdown()
+
+TTS_SPEED = 1.2
+
+# gTTS by default; WILLOW_TTS_ENGINE=coqui runs a local model warm in a process pool instead,
+# and WILLOW_TTS_ENGINE=stub a deterministic tone generator for benchmarks
+TTS_ENGINE = os.getenv("WILLOW_TTS_ENGINE", "gtts")
+if TTS_ENGINE == "coqui":
+    tts_options = {
+        "model_name": os.getenv("WILLOW_TTS_MODEL", LocalTTSEngine.DEFAULT_MODEL),
+        "processes": int(os.getenv("WILLOW_TTS_PROCESSES", "2")),
+    }
+elif TTS_ENGINE == "stub":
+    tts_options = {"latency": float(os.getenv("WILLOW_TTS_STUB_LATENCY", "0"))}
+else:
+    tts_options = {}
+tts_engine = create_engine(TTS_ENGINE, **tts_options)
+TTS_VOICE = tts_engine.voice
+
+def _start_tts_engine():
+    tts_engine.start()
+    return tts_engine
+
+# Local engines start worker processes, which must happen in each server worker, not before the fork
+registry.register("tts_engine", _start_tts_engine, preload=False)
+
+@app.on_event("shutdown")
+async def close_tts_engine():
+    tts_engine.close()
+# Compact mono encodings by default; clients can ask for another per request
+DEFAULT_AUDIO_FORMAT = os.getenv("WILLOW_AUDIO_FORMAT", "mp3")
+
+# Every generated file is tracked by owning session and age, and cleaned up in the background
+audio_files = AudioArtifactManager(
+    audio_dir,
+    ttl=float(os.getenv("WILLOW_AUDIO_TTL", "3600")),
+    max_bytes=int(os.getenv("WILLOW_AUDIO_MAX_MB", "500")) * 1024 * 1024,
+)
+
+# Identical replies share one audio file; only cache misses are synthesized
+tts_cache = TTSCache(
+    audio_dir,
+    max_bytes=int(os.getenv("WILLOW_TTS_CACHE_MB", "200")) * 1024 * 1024,
+    on_evict=audio_files.forget,
+)
+audio_files.on_delete = tts_cache.forget
+
+def _synthesize(text, fmt):
     # Increase speed by setting a higher playback rate (e.g., 1.2x)
-    filename = _orig_text_to_speech(text, speed=1.2)  # Pass speed param if supported
-    base = _os.path.basename(filename)
-    target = _os.path.join(audio_dir, base)
-    if filename != target:
-        try:
-            _os.replace(filename, target)
-            logging.info(f"Moved TTS file to audio_dir: {target}")
-        except FileNotFoundError:
-            logging.error(f"TTS file not found: {filename}")
+    try:
+        print(f"🔊 Converting text to speech ({tts_engine.name}):", text)
+        return synthesize(text, speed=TTS_SPEED, fmt=fmt, engine=registry.get("tts_engine"))
+    except Exception as e:
+        logging.error(f"TTS error: {e}")
+        return None
+
+def _speak_sync(text, session_id=None, fmt=DEFAULT_AUDIO_FORMAT):
+    # Audio is built in memory and written once, straight into the audio directory
+    for _ in range(2):
+        name = tts_cache.get_or_create(text, TTS_SPEED, TTS_VOICE, lambda: _synthesize(text, fmt),
+                                       fmt=fmt, ext=AUDIO_FORMATS[fmt]["ext"])
+        if not name or audio_files.track(name, session_id):
+            return name
+        # Cleanup deleted the cached file between the hit and track(); synthesize it again
+        tts_cache.forget(name)
+    logging.error(f"TTS file {name} kept disappearing, sending the reply without audio")
+    return None
+
+# Audio of the fixed replies in the default format, once synthesized
+canned_audio = {}
+
+def canned_audio_url(reply):
+    """URL of a fixed reply's pre-synthesized audio, or None while it is not ready."""
+    name = canned_audio.get(reply)
+    return f"/audio/{name}" if name else None
+
+def _prewarm_sync(text):
+    name = _speak_sync(text)
+    if name:
+        # Fixed replies are shared by everyone, so they never expire
+        audio_files.track(name, pinned=True, shared=True)
+        canned_audio[text] = name
+    return name
+
+_background_tasks = []
+
+@app.on_event("startup")
+async def start_audio_background_tasks():
+    """Synthesize the fixed replies so they are free when first used, and start audio cleanup."""
+
+    async def prewarm():
+        for reply in CANNED_REPLIES:
+            await tts_pool.run(_prewarm_sync, reply)
+
+    _background_tasks.append(asyncio.ensure_future(prewarm()))
+    interval = float(os.getenv("WILLOW_AUDIO_CLEANUP_INTERVAL", "60"))
+    _background_tasks.append(asyncio.ensure_future(audio_files.run(interval)))
+
+@app.on_event("shutdown")
+async def stop_audio_background_tasks():
+    for task in _background_tasks:
+        task.cancel()
+
+# Synthesis waiting on the TTS pool is bounded too; past the limit a reply goes out without audio
+tts_limiter = Limiter(
+    "tts",
+    max_active=tts_pool.max_workers,
+    max_waiting=int(os.getenv("WILLOW_TTS_MAX_QUEUED", "32")),
+    timeout=float(os.getenv("WILLOW_TTS_QUEUE_TIMEOUT", "10")),
+)
+
+async def speak(text, session_id=None, fmt=DEFAULT_AUDIO_FORMAT):
+    """Synthesize text on the TTS pool without blocking the event loop. Returns None if TTS is overloaded."""
+    try:
+        async with tts_limiter.slot():
+            with timer("tts"):
+                return await tts_pool.run(_speak_sync, text, session_id, fmt)
+    except Overloaded as e:
+        logging.warning(f"Skipping audio: {e}")
+        return None
+
+async def reply_audio_url(text, defer_audio=False, session_id=None, fmt=DEFAULT_AUDIO_FORMAT):
+    """
+    Return the audio URL for a reply. With defer_audio the synthesis runs in the
+    background and the URL points at /tts/<job_id>, which resolves once it finishes.
+    """
+    if defer_audio:
+        return f"/tts/{tts_pool.start_job(_speak_sync, text, session_id, fmt)}"
+    audio_path = await speak(text, session_id, fmt)
+    return f"/audio/{audio_path}" if audio_path else None
+
+def choose_audio_format(request, data=None):
+    """Pick the reply encoding from ?audio_format=, the JSON body, or the Accept header."""
+    requested = request.query_params.get("audio_format") or (data or {}).get("audio_format")
+    if requested in AUDIO_FORMATS:
+        return requested
+    accept = request.headers.get("accept", "")
+    if "audio/ogg" in accept or "audio/opus" in accept:
+        return "opus"
+    if "audio/mpeg" in accept:
+        return "mp3"
+    if "audio/wav" in accept:
+        return "wav"
+    return DEFAULT_AUDIO_FORMAT
+
+@app.get("/audio/{name}")
+async def get_audio(name: str, request: Request):
+    """
+    Serve a generated audio file with HTTP Range support, so the browser can start
+    playback before the whole file has downloaded.
+    """
+    path = _os.path.join(audio_dir, _os.path.basename(name))
+    try:
+        size = _os.path.getsize(path)
+    except OSError:
+        return JSONResponse({"error": "Audio not found"}, status_code=404)
+    byte_range = parse_range(request.headers.get("range"), size)
+    if byte_range is False:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{size}"})
+    start, end = byte_range or (0, size - 1)
+    data = await asyncio.get_running_loop().run_in_executor(None, read_bytes, path, start, end - start + 1)
+    headers = {
+        "Accept-Ranges": "bytes",
+        # File names are content-addressed, so the bytes behind a name never change
+        "Cache-Control": "public, max-age=86400, immutable",
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    return Response(data, status_code=206 if byte_range else 200, headers=headers, media_type=media_type)
+
+@app.get("/tts/{job_id}")
+async def tts_job(job_id: str):
+    """Wait for a deferred TTS job and redirect to the finished audio file."""
+    audio_path = await tts_pool.wait_job(job_id)
+    if not audio_path:
+        return JSONResponse({"error": "Audio not available"}, status_code=404)
+    return RedirectResponse(f"/audio/{audio_path}")
+
+END_KEYWORDS = [
+    "bye", "ok bye", "thank you", "thankyou", "thanks", "see you", "goodbye", "talk later", "end chat", "end conversation", "that's all", "done", "finish", "no more", "that's it"
+]
+VIDEO_KEYWORDS = ["video", "demo", "show", "see", "sample"]
+
+def wants_end(user_text):
+    """Detect end-of-conversation intent."""
+    user_text_lower = user_text.lower()
+    return any(kw in user_text_lower for kw in END_KEYWORDS)
+
+def wants_video(user_text):
+    user_text_lower = user_text.lower()
+    return any(kw in user_text_lower for kw in VIDEO_KEYWORDS)
+
+def find_youtube_url(bot_reply):
+    # Detect YouTube video link in bot_reply (simple regex for demo)
+    yt_match = re.search(r'(https?://(?:www\.)?(?:youtube\.com|youtu\.be)/[\w\-?&=%.]+)', bot_reply)
+    return yt_match.group(1) if yt_match else None
+
+# Each prompt carries a rolling summary plus the newest turns that fit WILLOW_CONTEXT_TOKEN_BUDGET.
+# The summary and lead facts are updated by Gemini in the background after every turn, and
+# every turn is written to the conversation store (WILLOW_DB_PATH, SQLite) in the background.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("WILLOW_CONTEXT_TOKEN_BUDGET", "600"))
+# Hard cap on in-memory turns in case background summarization keeps failing
+MAX_HISTORY_TURNS = 200
+store = ConversationStore(os.getenv("WILLOW_DB_PATH") or _os.path.join(_os.path.abspath(_os.path.dirname(__file__)), "willow.db"))
+
+@app.on_event("shutdown")
+def close_store():
+    store.close()
+
+def record_turn(session, role, text, **timings):
+    session.history.append({"role": role, "text": text})
+    log_interaction(role, text, session.session_id, **timings)
+    store.add_turn(session.conversation_id, session.session_id, role, text)
+    excess = len(session.history) - MAX_HISTORY_TURNS
+    if excess > 0:
+        del session.history[:excess]
+        session.folded = max(0, session.folded - excess)
+
+def add_user_turn(session, user_text):
+    if user_text:
+        record_turn(session, "user", user_text)
+
+def add_bot_turn(session, bot_reply, **timings):
+    record_turn(session, "bot", bot_reply, **timings)
+    schedule_context_update(session)
+
+def schedule_context_update(session):
+    # One update per session at a time; turns added meanwhile are picked up by the next one
+    if session.context_task is None or session.context_task.done():
+        session.context_task = asyncio.create_task(update_context(session))
+
+async def update_context(session):
+    """Fold the turns not yet summarized into session.summary and session.lead, then trim history."""
+    # Runs after the reply is sent; keep it out of that request's Server-Timing
+    stop_request_timing()
+    history = session.history
+    end = len(history)
+    if end <= session.folded:
+        return
+    reply = await get_gemini_reply(build_context_update(session.summary, session.lead, history[session.folded:end]),
+                                   stage="gemini_context_update", hedge=False)
+    if session.history is not history:
+        # The session was reset while Gemini was working
+        return
+    update = parse_context_update(reply) if reply else None
+    if update is None:
+        # Keep the turns; the next update retries them together with the new ones
+        return
+    session.summary, facts = update
+    session.lead.update(facts)
+    session.folded = end
+    # Summarized turns that no longer fit the prompt window can go
+    drop = min(session.folded, len(history) - len(recent_turns(history, CONTEXT_TOKEN_BUDGET)))
+    if drop > 0:
+        del history[:drop]
+        session.folded -= drop
+
+def prompt_turns(session):
+    return recent_turns(session.history, CONTEXT_TOKEN_BUDGET)
+
+def conversation_for_summary(session):
+    """The conversation for handoff summaries: rolling summary plus every turn it does not cover yet."""
+    start = min(session.folded, len(session.history) - len(prompt_turns(session)))
+    turns = format_turns(session.history[start:])
+    if not session.summary:
+        return turns
+    return f"Summary of the conversation so far: {session.summary}\nLead details collected: {session.lead}\n\nMost recent turns:\n{turns}"
+
+# Answers to common questions ("how much does it cost?") are reused across visitors.
+# Near-duplicates match at WILLOW_REPLY_CACHE_THRESHOLD shingle similarity (0 disables).
+response_cache = ResponseCache(
+    threshold=float(os.getenv("WILLOW_REPLY_CACHE_THRESHOLD", "0.8")),
+    ttl=int(os.getenv("WILLOW_REPLY_CACHE_TTL", "3600")),
+    max_entries=int(os.getenv("WILLOW_REPLY_CACHE_SIZE", "500")),
+)
+REPLY_CACHE_ENABLED = response_cache.threshold > 0
+_system_prompt_digest = hashlib.sha1(SYSTEM_PROMPT.encode("utf-8")).hexdigest()
+
+def prompt_version():
+    """Changes whenever the system prompt or knowledge base does, invalidating cached replies."""
+    return f"{_system_prompt_digest[:12]}:{(kb_index.version or '')[:12]}"
+
+def cached_reply(user_text):
+    if not REPLY_CACHE_ENABLED or not is_cacheable(user_text):
+        return None
+    return response_cache.lookup(user_text, prompt_version())
+
+def has_cached_reply(user_text):
+    """Whether cached_reply() would answer user_text, without counting a lookup."""
+    if not REPLY_CACHE_ENABLED or not is_cacheable(user_text):
+        return False
+    return response_cache.peek(user_text, prompt_version()) is not None
+
+def remember_reply(session, user_text, bot_reply):
+    if not REPLY_CACHE_ENABLED or not is_cacheable(user_text):
+        return
+    # Only replies to a conversation's opening question are shared: later replies are written
+    # with the visitor's earlier turns in view and can repeat their name, company or budget,
+    # often before the background context update has put them in session.lead
+    if session.summary or sum(h["role"] == "user" for h in session.history) > 1:
+        return
+    # A reply that mentions this visitor's details must not be shown to anyone else
+    reply_lower = bot_reply.lower()
+    if any(isinstance(value, str) and len(value) > 2 and value.lower() in reply_lower
+           for value in session.lead.values()):
+        return
+    response_cache.store(user_text, prompt_version(), bot_reply)
+
+# Prompt pieces are assembled once; per turn only the conversation and state are filled in
+SYSTEM_INSTRUCTION = {"parts": [{"text": SYSTEM_PROMPT}]}
+RETRIEVED_KNOWLEDGE = "Knowledge Base:\n{knowledge}\n\n".format
+CONVERSATION_SUMMARY = "Conversation summary: {summary}\n".format
+TURN_STATE = "Current step: {step}\nCollected lead info: {lead}\nYour reply (be concise, human, and impactful):".format
+GEMINI_ROLES = {"user": "user", "bot": "model"}
+_prefix_version = None
+
+def update_prompt_prefix():
+    # With the whole knowledge base cached on the Gemini side, per-turn retrieval is unnecessary
+    global _prefix_version
+    if kb_index.version != _prefix_version:
+        _prefix_version = kb_index.version
+        context_cache.set_prefix({"parts": [{"text": SYSTEM_PROMPT}, {"text": "Knowledge Base:\n" + kb_index.text}]})
+
+def conversation_contents(history, note):
+    """Map the session history to Gemini contents, with note appended to the latest user turn."""
+    contents = []
+    for h in history:
+        role = GEMINI_ROLES[h["role"]]
+        if contents and contents[-1]["role"] == role:
+            contents[-1]["parts"].append({"text": h["text"]})
+        else:
+            contents.append({"role": role, "parts": [{"text": h["text"]}]})
+    if contents and contents[0]["role"] == "model":
+        # The window can start mid-conversation; Gemini expects a user turn first
+        contents.insert(0, {"role": "user", "parts": [{"text": "(earlier conversation omitted)"}]})
+    if not contents or contents[-1]["role"] != "user":
+        contents.append({"role": "user", "parts": []})
+    contents[-1]["parts"].append({"text": note})
+    return contents
+
+async def build_reply_payload(session, use_cache=True, pending=None):
+    """
+    Request payload for the next bot reply. Only the conversation and turn state are built
+    per request; the static prefix is referenced through the context cache when available
+    and otherwise sent as systemInstruction with just the relevant knowledge base sections.
+    pending is a user turn not yet in the history (a speculative reply to a partial transcript).
+    """
+    note = TURN_STATE(step=session.step, lead=session.lead)
+    if session.summary:
+        note = CONVERSATION_SUMMARY(summary=session.summary) + note
+    history = session.history if pending is None else session.history + [{"role": "user", "text": pending}]
+    turns = recent_turns(history, CONTEXT_TOKEN_BUDGET)
+    cached = await context_cache.name() if use_cache and CONTEXT_CACHE_ENABLED else None
+    if cached is not None:
+        return {"cachedContent": cached, "contents": conversation_contents(turns, note)}
+    note = RETRIEVED_KNOWLEDGE(knowledge=knowledge_for(history)) + note
+    return {"systemInstruction": SYSTEM_INSTRUCTION, "contents": conversation_contents(turns, note)}
+
+def payload_tokens(payload):
+    """Estimated prompt tokens sent with a payload, not counting a cached prefix."""
+    contents = payload["contents"] + [payload.get("systemInstruction", {"parts": []})]
+    return sum(estimate_tokens(part["text"]) for content in contents for part in content["parts"])
+
+class ReplyPayload:
+    """
+    Builds the reply payload for whichever provider the router picks: the context cache is
+    referenced only for providers that can use it. used_cache records whether it was and
+    prompt_tokens how many prompt tokens went out, over every provider tried.
+    """
+
+    def __init__(self, session, use_cache=True, pending=None):
+        self.session = session
+        self.use_cache = use_cache
+        self.pending = pending
+        self.used_cache = False
+        self.prompt_tokens = 0
+
+    async def __call__(self, provider):
+        payload = await build_reply_payload(self.session, self.use_cache and provider.supports_context_cache,
+                                            self.pending)
+        self.used_cache = self.used_cache or "cachedContent" in payload
+        self.prompt_tokens += payload_tokens(payload)
+        return payload
+
+async def get_session_reply(session):
+    payload = ReplyPayload(session)
+    try:
+        with timer("gemini"):
+            return await llm.generate(payload)
+    except httpx.HTTPStatusError as e:
+        if not payload.used_cache:
+            logging.error(f"Gemini API error: {e}")
             return None
-    else:
-        logging.info(f"TTS file already in audio_dir: {target}")
-    return base
+        # The cached prefix was rejected (expired or deleted on the Gemini side); resend it inline once
+        logging.warning(f"Gemini rejected the context cache, retrying inline: {e}")
+        await context_cache.invalidate()
+        return await get_gemini_reply(ReplyPayload(session, use_cache=False))
+    except Exception as e:
+        logging.error(f"Gemini API error: {e}")
+        return None
+
+# --- Admission control ---
+# At most WILLOW_MAX_ACTIVE_TURNS turns call the LLM and TTS at once (each provider also has its own
+# limit). Up to WILLOW_MAX_QUEUED_TURNS more wait, each for WILLOW_TURN_QUEUE_TIMEOUT seconds; past
+# that a turn is shed with the pre-synthesized BUSY_REPLY. Each session may send WILLOW_SESSION_RATE
+# turns per second on average, in bursts of WILLOW_SESSION_BURST.
+turn_limiter = Limiter(
+    "turns",
+    max_active=int(os.getenv("WILLOW_MAX_ACTIVE_TURNS", "32")),
+    max_waiting=int(os.getenv("WILLOW_MAX_QUEUED_TURNS", "64")),
+    timeout=float(os.getenv("WILLOW_TURN_QUEUE_TIMEOUT", "5")),
+)
+SESSION_RATE = float(os.getenv("WILLOW_SESSION_RATE", "1"))
+SESSION_BURST = int(os.getenv("WILLOW_SESSION_BURST", "5"))
+metrics.describe("admission_wait_seconds", "Time turns and TTS jobs waited for a slot")
+metrics.describe("admission_shed", "Requests shed by a limiter, by reason")
+metrics.describe("rate_limited", "Turns refused by the per-session rate limit")
+
+def collect_admission_metrics():
+    for limiter in (turn_limiter, tts_limiter):
+        yield "admission_active", "gauge", limiter.active, {"limiter": limiter.name}
+        yield "admission_queue_depth", "gauge", limiter.waiting, {"limiter": limiter.name}
+
+metrics.add_collector(collect_admission_metrics)
+
+def rate_limited(session):
+    """Seconds the session has to wait before its next turn, or 0 if it may go ahead."""
+    if SESSION_RATE <= 0:
+        return 0.0
+    if session.rate_limit is None:
+        session.rate_limit = TokenBucket(SESSION_RATE, SESSION_BURST)
+    wait = session.rate_limit.take()
+    if wait:
+        metrics.increment("rate_limited")
+    return wait
+
+def rate_limit_response(session, wait):
+    response = JSONResponse({"error": "Too many messages, please slow down.", "retry_after": round(wait, 1)},
+                            status_code=429, headers={"Retry-After": str(max(1, round(wait)))})
+    return with_session(response, session)
+
+@asynccontextmanager
+async def admit(user_text):
+    """Hold a turn slot while the turn runs. Farewells and canned replies skip the queue."""
+    if wants_end(user_text) or wants_video(user_text):
+        yield
+        return
+    async with turn_limiter.slot():
+        yield
+
+def busy_reply(session):
+    """Instant answer for a shed turn: nothing goes upstream and the turn is not recorded."""
+    return {
+        "reply": BUSY_REPLY,
+        "audio_url": canned_audio_url(BUSY_REPLY),
+        "showImage": False,
+        "lead": session.lead,
+        "end": False,
+        "youtube_url": None,
+        "busy": True
+    }
 
 @app.post("/talk")
 async def talk(request: Request):
@@ -423,161 +1321,274 @@ async def talk(request: Request):
     Main conversational endpoint. Handles user input, manages state, logs all interactions,
     and recovers gracefully from errors or interruptions.
     """
+    session = get_session(request)
     try:
         data = await request.json()
+        # Return the text right away and let the browser fetch audio when it is ready
+        defer_audio = bool(data.get("defer_audio")) or request.query_params.get("defer_audio") in ("1", "true")
         user_text = (data.get("message") or "").strip()
-        step = conversation_state["step"]
-        lead = conversation_state["lead"]
+        wait = rate_limited(session)
+        if wait:
+            return rate_limit_response(session, wait)
+        # Requests for one session run one at a time; other sessions are not blocked
+        async with session.lock:
+            try:
+                async with admit(user_text):
+                    result = await run_turn(session, user_text, defer_audio, choose_audio_format(request, data))
+            except Overloaded:
+                result = busy_reply(session)
+        return with_session(JSONResponse(result), session)
+    except Exception as e:
+        # Catch-all for unexpected errors
+        logging.error(f"/talk endpoint error: {e}")
+        return with_session(JSONResponse({
+            "reply": ERROR_REPLY,
+            "audio_url": canned_audio_url(ERROR_REPLY),
+            "showImage": False,
+            "lead": None,
+            "end": False,
+            "youtube_url": None
+        }), session)
 
-        if user_text:
-            conversation_state["history"].append({"role": "user", "text": user_text})
-            log_interaction("user", user_text)
-        # Only keep last 10 turns for LLM context, but log full transcript
-        conversation_state["history"] = conversation_state["history"][-10:]
-
-        # Detect end-of-conversation intent
-        end_keywords = [
-            "bye", "ok bye", "thank you", "thankyou", "thanks", "see you", "goodbye", "talk later", "end chat", "end conversation", "that's all", "done", "finish", "no more", "that's it"
-        ]
-        user_text_lower = user_text.lower()
-        if any(kw in user_text_lower for kw in end_keywords):
-            # Compose a summary prompt for Gemini
-            conversation_str = "\n".join([
-                ("User: " + h["text"]) if h["role"] == "user" else ("Jane: " + h["text"]) for h in conversation_state["history"]
-            ])
-            summary_prompt = f"""
-Summarize this sales conversation in 5-6 sentences for a human sales agent. Include:
-- The user's name, company, and role (if provided)
-- The user's requirements and main problem
-- Any objections or concerns
-- Budget (if mentioned)
-- Any other relevant details for handoff
-
-Conversation:
-{conversation_str}
-
-Now, output a JSON object with the following fields: company, domain, problem, budget, summary, user_last_message, and a short summary for the agent. If any field is missing, set it to null. Example:
-{{
-  "company": ...,
-  "domain": ...,
-  "problem": ...,
-  "budget": ...,
-  "summary": ...,
-  "user_last_message": ...,
-  "agent_summary": ...
-}}
-"""
-            gemini_json = await get_gemini_reply(summary_prompt)
-            if not gemini_json:
-                bot_reply = "Sorry, the AI backend is currently unavailable. Please try again later."
-                log_interaction("bot", bot_reply)
-                return JSONResponse({
-                    "reply": bot_reply,
-                    "lead": None,
-                    "end": True
-                })
-            import json
+@app.post("/talk/stream")
+async def talk_stream(request: Request):
+    """
+    Streaming version of /talk. Responds with newline-delimited JSON events so the
+    browser can start playing the first sentence while the rest is still being generated.
+    """
+    session = get_session(request)
+    data = await request.json()
+    user_text = (data.get("message") or "").strip()
+    audio_format = choose_audio_format(request, data)
+    wait = rate_limited(session)
+    if wait:
+        return rate_limit_response(session, wait)
+
+    async def events():
+        async with session.lock:
             try:
-                lead_summary = json.loads(gemini_json)
-            except Exception:
-                # fallback: just use summary as before
-                lead_summary = {
-                    "summary": gemini_json,
-                    "conversation": conversation_state["history"][:],
-                    "user_last_message": user_text,
-                    "company": lead.get("company"),
-                    "domain": lead.get("domain"),
-                    "problem": lead.get("problem"),
-                    "budget": lead.get("budget"),
-                    "agent_summary": None
-                }
-            lead_summary["conversation"] = conversation_state["history"][:]
-            conversation_state["lead"] = lead_summary
-            bot_reply = "Thank you for chatting with Willow AI! I've summarized your requirements for our team. Have a great day!"
-            conversation_state["history"].append({"role": "bot", "text": bot_reply})
-            log_interaction("bot", bot_reply)
-            lead_summary["conversation"] = conversation_state["history"][:]
-            return JSONResponse({
-                "reply": bot_reply,
-                "showImage": False,
-                "lead": lead_summary,
-                "end": True,
-                "youtube_url": None
-            })
-
-        # Build conversation string for Gemini
-        conversation_str = "\n".join([
-            ("User: " + h["text"]) if h["role"] == "user" else ("Jane: " + h["text"]) for h in conversation_state["history"]
-        ])
-
-        # If user asks for a video/demo, always provide a sample video link
-        import re
-        video_keywords = ["video", "demo", "show", "see", "sample"]
-        if any(kw in user_text.lower() for kw in video_keywords):
-            sample_video_url = "https://www.youtube.com/watch?v=dQw4w9WgXcQ"
-            bot_reply = (
-                f"Absolutely! Here's a quick demo video of Willow AI in action: {sample_video_url}\n"
-                "This video will show you how Willow AI engages leads, qualifies them, and books meetings in real time. Let me know if you have any questions after watching!"
-            )
-            conversation_state["history"].append({"role": "bot", "text": bot_reply})
-            log_interaction("bot", bot_reply)
-            audio_path = speak(bot_reply)
-            return JSONResponse({
-                "reply": bot_reply,
-                "audio_url": f"/audio/{audio_path}" if audio_path else None,
-                "showImage": False,
-                "lead": lead,
-                "end": False,
-                "youtube_url": sample_video_url
-            })
-
-        # Initial prompt for first message
-        if len(conversation_state["history"]) == 1:
-            prompt = f"""{SYSTEM_PROMPT}\n\nKnowledge Base:\n{KNOWLEDGE_BASE}\n\nConversation so far:\n{conversation_str}\nCurrent step: {step}\nCollected lead info: {lead}\nYour reply (be concise, human, and impactful):\n"""
-        else:
-            prompt = f"""{SYSTEM_PROMPT}\n\nKnowledge Base:\n{KNOWLEDGE_BASE}\n\nConversation so far:\n{conversation_str}\nCurrent step: {step}\nCollected lead info: {lead}\nYour reply (be concise, human, and impactful):\n"""
-
-        bot_reply = await get_gemini_reply(prompt)
-        if not bot_reply:
-            bot_reply = "Sorry, the AI backend is currently unavailable. Please try again later."
-            conversation_state["history"].append({"role": "bot", "text": bot_reply})
-            log_interaction("bot", bot_reply)
-            return JSONResponse({
-                "reply": bot_reply,
-                "audio_url": None,
-                "showImage": False,
-                "lead": lead,
-                "end": False,
-                "youtube_url": None
-            })
-
-        conversation_state["history"].append({"role": "bot", "text": bot_reply})
-        log_interaction("bot", bot_reply)
-
-        # Detect YouTube video link in bot_reply (simple regex for demo)
-        youtube_url = None
-        yt_match = re.search(r'(https?://(?:www\.)?(?:youtube\.com|youtu\.be)/[\w\-?&=%.]+)', bot_reply)
-        if yt_match:
-            youtube_url = yt_match.group(1)
-
-        # Use TTS for the reply
-        audio_path = speak(bot_reply)
-        return JSONResponse({
+                async with admit(user_text):
+                    async for event in stream_turn(session, user_text, audio_format):
+                        yield json.dumps(event) + "\n"
+            except Overloaded:
+                yield json.dumps({"type": "done", **busy_reply(session)}) + "\n"
+            except Exception as e:
+                logging.error(f"/talk/stream endpoint error: {e}")
+                yield json.dumps({
+                    "type": "done",
+                    "reply": ERROR_REPLY,
+                    "audio_url": canned_audio_url(ERROR_REPLY),
+                    "showImage": False,
+                    "lead": None,
+                    "end": False,
+                    "youtube_url": None
+                }) + "\n"
+
+    return with_session(StreamingResponse(events(), media_type="application/x-ndjson"), session)
+
+async def run_turn(session, user_text, defer_audio=False, audio_format=DEFAULT_AUDIO_FORMAT):
+    """
+    Run one conversational turn for a session and return the response payload.
+    The caller must hold session.lock.
+    """
+    lead = session.lead
+    add_user_turn(session, user_text)
+
+    # Detect end-of-conversation intent
+    if wants_end(user_text):
+        return end_conversation(session)
+
+    # If user asks for a video/demo, always provide a sample video link
+    if wants_video(user_text):
+        bot_reply = DEMO_VIDEO_REPLY
+        add_bot_turn(session, bot_reply)
+        return {
             "reply": bot_reply,
-            "audio_url": f"/audio/{audio_path}" if audio_path else None,
+            "audio_url": await reply_audio_url(bot_reply, defer_audio, session.session_id, audio_format),
             "showImage": False,
             "lead": lead,
             "end": False,
-            "youtube_url": youtube_url
-        })
-    except Exception as e:
-        # Catch-all for unexpected errors
-        logging.error(f"/talk endpoint error: {e}")
-        return JSONResponse({
-            "reply": "Sorry, something went wrong. Please try again later.",
-            "audio_url": None,
+            "youtube_url": SAMPLE_VIDEO_URL
+        }
+
+    # Refresh first: the reply cache version depends on the knowledge base
+    refresh_knowledge_base()
+    started = time.perf_counter()
+    bot_reply = cached_reply(user_text)
+    cache_hit = bot_reply is not None
+    if bot_reply is None:
+        bot_reply = await get_session_reply(session)
+        if bot_reply:
+            remember_reply(session, user_text, bot_reply)
+    llm_ms = round((time.perf_counter() - started) * 1000, 1)
+    if not bot_reply:
+        bot_reply = FALLBACK_REPLY
+        metrics.increment("fallbacks", endpoint="talk")
+        add_bot_turn(session, bot_reply, llm_ms=llm_ms)
+        return {
+            "reply": bot_reply,
+            "audio_url": canned_audio_url(bot_reply),
             "showImage": False,
-            "lead": None,
+            "lead": lead,
             "end": False,
             "youtube_url": None
-        })
\ No newline at end of file
+        }
+
+    add_bot_turn(session, bot_reply, llm_ms=llm_ms, cache_hit=cache_hit)
+
+    # Use TTS for the reply
+    return {
+        "reply": bot_reply,
+        "audio_url": await reply_audio_url(bot_reply, defer_audio, session.session_id, audio_format),
+        "showImage": False,
+        "lead": lead,
+        "end": False,
+        "youtube_url": find_youtube_url(bot_reply)
+    }
+
+async def replay(text):
+    yield text
+
+async def stream_turn(session, user_text, audio_format=DEFAULT_AUDIO_FORMAT, speculation=None):
+    """
+    Streaming variant of run_turn. Yields events as the reply is generated:
+    one {"type": "sentence"} event per sentence, with its audio synthesized while
+    later sentences are still streaming from Gemini, then a final {"type": "done"}
+    event carrying the same fields as /talk. speculation is a task already answering
+    user_text (see start_speculation). The caller must hold session.lock.
+    """
+    if wants_end(user_text) or wants_video(user_text):
+        # Canned and summary replies have nothing to stream
+        yield {"type": "done", **await run_turn(session, user_text, audio_format=audio_format)}
+        return
+
+    lead = session.lead
+    started = time.perf_counter()
+    guess = await claim_speculation(session, speculation) if speculation is not None else None
+    add_user_turn(session, user_text)
+    refresh_knowledge_base()
+    first_sentence_ms = None
+    hit = cached_reply(user_text) if guess is None else None
+    payload = ReplyPayload(session) if hit is None and guess is None else None
+    fragments = llm.stream(payload) if payload is not None else replay(hit or guess)
+    sentences = []
+    try:
+        async for sentence, audio_path in synthesize_in_order(iter_sentences(fragments), lambda sentence: speak(sentence, session.session_id, audio_format)):
+            sentences.append(sentence)
+            if first_sentence_ms is None:
+                first_sentence_ms = round((time.perf_counter() - started) * 1000, 1)
+                metrics.observe("stage_seconds", first_sentence_ms / 1000, stage="first_sentence")
+            yield {
+                "type": "sentence",
+                "index": len(sentences) - 1,
+                "text": sentence,
+                "audio_url": f"/audio/{audio_path}" if audio_path else None
+            }
+    except Exception as e:
+        logging.error(f"Gemini streaming error: {e}")
+        if payload is not None and payload.used_cache:
+            # Possibly an expired context cache; rebuild it before the next turn
+            await context_cache.invalidate()
+
+    bot_reply = " ".join(sentences)
+    if not bot_reply:
+        bot_reply = FALLBACK_REPLY
+        metrics.increment("fallbacks", endpoint="talk_stream")
+    elif hit is None:
+        remember_reply(session, user_text, bot_reply)
+    add_bot_turn(session, bot_reply, first_sentence_ms=first_sentence_ms,
+                 total_ms=round((time.perf_counter() - started) * 1000, 1), cache_hit=hit is not None,
+                 speculative=guess is not None)
+    yield {
+        "type": "done",
+        "reply": bot_reply,
+        # Audio was already delivered sentence by sentence, unless this is the fallback
+        "audio_url": None if sentences else canned_audio_url(bot_reply),
+        "showImage": False,
+        "lead": lead,
+        "end": False,
+        "youtube_url": find_youtube_url(bot_reply)
+    }
+
+# --- Speculative replies ---
+# On /ws/audio the reply is started before the user has finished: once the partial transcript has
+# held for WILLOW_SPECULATE_STABLE_MS, the LLM is asked to answer it. If the final transcript is
+# the same, that reply is used, finished or still in flight; otherwise it is cancelled and the turn
+# runs as usual. Nothing is speculated while the session has a turn running, for canned or cached
+# replies, or while turns are queueing for admission. WILLOW_SPECULATE=0 turns it off.
+SPECULATE = os.getenv("WILLOW_SPECULATE", "1") == "1"
+SPECULATE_STABLE = int(os.getenv("WILLOW_SPECULATE_STABLE_MS", "300")) / 1000
+metrics.describe("speculations", "Speculative replies by outcome (hit, miss, abandoned, stale, failed)")
+metrics.describe("speculation_wasted_tokens", "Estimated LLM tokens spent on speculative replies that went unused")
+metrics.describe("voice_turns", "Final transcripts on /ws/audio; speculations / voice_turns is the speculation rate")
+
+class SpeculativeReply:
+    """A reply to a partial transcript, the history it was generated against and its token cost."""
+    __slots__ = ("reply", "mark", "tokens")
+
+    def __init__(self, reply, mark, tokens):
+        self.reply = reply
+        self.mark = mark
+        self.tokens = tokens
+
+def history_mark(session):
+    # Changes whenever a turn is added or the session is reset, but not when old turns are trimmed
+    return session.history[-1] if session.history else session.history
+
+def start_speculation(session, text):
+    """Speculator hook: a coroutine answering text, or None when speculating would not pay off."""
+    if session.lock.locked() or wants_end(text) or wants_video(text) or has_cached_reply(text):
+        return None
+    if turn_limiter.waiting or turn_limiter.active >= turn_limiter.max_active:
+        return None
+    return speculative_reply(session, text)
+
+async def speculative_reply(session, text):
+    mark = history_mark(session)
+    payload = ReplyPayload(session, pending=text)
+    started = time.perf_counter()
+    try:
+        # A guess is already extra work; a hedged second request would double it
+        reply = await llm.generate(payload, hedge=False)
+    except asyncio.CancelledError:
+        metrics.increment("speculation_wasted_tokens", payload.prompt_tokens)
+        raise
+    except Exception as e:
+        # The turn makes its own call
+        logging.warning(f"Speculative reply failed: {e}")
+        reply = None
+    metrics.observe("stage_seconds", time.perf_counter() - started, stage="gemini_speculative")
+    return SpeculativeReply(reply, mark, payload.prompt_tokens + (estimate_tokens(reply) if reply else 0))
+
+def waste_speculation(result):
+    metrics.increment("speculation_wasted_tokens", result.tokens)
+
+async def claim_speculation(session, task):
+    """The speculative reply for this turn if it answered the current history, otherwise None."""
+    result = await task
+    if result.reply and result.mark is history_mark(session):
+        metrics.increment("speculations", outcome="hit")
+        return result.reply
+    metrics.increment("speculations", outcome="failed" if not result.reply else "stale")
+    waste_speculation(result)
+    return None
+
+# --- Models ---
+# Models load in the background after startup, so the port opens at once and /ready reports when
+# they are in; anything used earlier loads on demand. With WILLOW_PRELOAD_MODELS=1 the fork-safe
+# ones (Vosk) load at import instead, so a pre-forking server (gunicorn --preload) shares one copy
+# between its workers.
+if os.getenv("WILLOW_PRELOAD_MODELS") == "1":
+    registry.preload()
+
+@app.on_event("startup")
+async def warm_up_models():
+    # Not awaited: startup finishes while the models load on a worker thread
+    asyncio.get_running_loop().run_in_executor(None, registry.warm_up)
+
+if __name__ == "__main__":
+    # Serve this module's app directly; WILLOW_RELOAD=1 re-imports it in a reloading child (development only)
+    if os.getenv("WILLOW_RELOAD") == "1":
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
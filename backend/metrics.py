@@ -0,0 +1,147 @@
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+QUANTILES = (0.5, 0.95, 0.99)
+PREFIX = "willow"
+
+# Stage timings of the current request, for the Server-Timing header
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+class Metrics:
+    """
+    In-process latency histograms and counters, rendered as Prometheus text. Each series
+    keeps its last window observations for the p50/p95/p99 quantiles plus a running sum
+    and count. Safe to use from worker threads.
+    """
+
+    def __init__(self, window=2048):
+        self.window = window
+        self._lock = threading.Lock()
+        # (name, labels) -> [recent samples, sum, count]
+        self._series = {}
+        # (name, labels) -> value
+        self._counters = {}
+        self._help = {}
+        self._collectors = []
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [deque(maxlen=self.window), 0.0, 0]
+            series[0].append(seconds)
+            series[1] += seconds
+            series[2] += 1
+
+    def increment(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def add_collector(self, collect):
+        """
+        Register collect(), called on every scrape, returning (name, type, value, labels)
+        tuples for values other components already track (cache sizes, hit counts, ...).
+        """
+        self._collectors.append(collect)
+
+    @contextmanager
+    def timer(self, stage):
+        """Time a block as stage: feeds the stage histogram, the error counter and Server-Timing."""
+        started = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.increment("errors", stage=stage)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe("stage_seconds", elapsed, stage=stage)
+            timings = _request_timings.get()
+            if timings is not None:
+                timings.append((stage, elapsed))
+
+    def quantiles(self, name, **labels):
+        """Return {quantile: seconds} for one series, or None if it has no samples."""
+        with self._lock:
+            series = self._series.get((name, tuple(sorted(labels.items()))))
+            samples = sorted(series[0]) if series else None
+        if not samples:
+            return None
+        return {q: samples[min(len(samples) - 1, int(q * len(samples)))] for q in QUANTILES}
+
+    def render(self):
+        """Prometheus text exposition format."""
+        with self._lock:
+            series = {key: (sorted(value[0]), value[1], value[2]) for key, value in self._series.items()}
+            counters = dict(self._counters)
+        lines = []
+        for name in sorted({key[0] for key in series}):
+            full = f"{PREFIX}_{name}"
+            lines.append(f"# HELP {full} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {full} summary")
+            for (series_name, labels), (samples, total, count) in sorted(series.items()):
+                if series_name != name:
+                    continue
+                for q in QUANTILES:
+                    value = samples[min(len(samples) - 1, int(q * len(samples)))] if samples else float("nan")
+                    lines.append(f"{full}{_labels(labels + (('quantile', str(q)),))} {value:.6f}")
+                lines.append(f"{full}_sum{_labels(labels)} {total:.6f}")
+                lines.append(f"{full}_count{_labels(labels)} {count}")
+        for name in sorted({key[0] for key in counters}):
+            full = f"{PREFIX}_{name}_total"
+            lines.append(f"# HELP {full} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {full} counter")
+            for (counter_name, labels), value in sorted(counters.items()):
+                if counter_name == name:
+                    lines.append(f"{full}{_labels(labels)} {value}")
+        collected = {}
+        for collect in self._collectors:
+            for name, kind, value, labels in collect():
+                collected.setdefault((name, kind), []).append((tuple(sorted(labels.items())), value))
+        for (name, kind), values in sorted(collected.items()):
+            full = f"{PREFIX}_{name}"
+            lines.append(f"# HELP {full} {self._help.get(name, name)}")
+            lines.append(f"# TYPE {full} {kind}")
+            for labels, value in values:
+                lines.append(f"{full}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+
+def start_request_timing():
+    """Start collecting stage timings for the current request and return the list they go into."""
+    timings = []
+    _request_timings.set(timings)
+    return timings
+
+
+def stop_request_timing():
+    """Stop reporting timings to the current request, e.g. in a background task it spawned."""
+    _request_timings.set(None)
+
+
+def server_timing_header(timings):
+    """Format collected (stage, seconds) pairs as a Server-Timing header value, summing repeats."""
+    totals = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in totals.items())
+
+
+metrics = Metrics()
+timer = metrics.timer
@@ -0,0 +1,109 @@
+import gc
+import logging
+import os
+import threading
+import time
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+MODELS_DIR = os.getenv("WILLOW_MODELS_DIR") or os.path.join(PACKAGE_DIR, "models")
+
+
+def model_path(name):
+    """Resolve a model location: absolute paths are kept, anything else is looked up under MODELS_DIR."""
+    return name if os.path.isabs(name) else os.path.join(MODELS_DIR, name)
+
+
+class ModelRegistry:
+    """
+    Heavy models (speech recognition, local TTS) loaded at most once per process. Each is
+    registered with a loader and loaded on first use or by warm_up(), whichever comes first;
+    status() and ready() report progress for the /ready endpoint. A failed load is retried on
+    the next get(). preload() loads the fork-safe models before a pre-forking server starts
+    its workers, so they share the model pages copy-on-write instead of each loading a copy.
+    """
+
+    def __init__(self):
+        self._loaders = {}
+        self._required = set()
+        self._preload = set()
+        self._locks = {}
+        self._models = {}
+        self._errors = {}
+        self._seconds = {}
+        self._loading = set()
+
+    def register(self, name, loader, required=True, preload=True):
+        """
+        Add a model. required models gate readiness; preload=False keeps loaders that start
+        threads or processes (which do not survive a fork) out of preload().
+        """
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+        if required:
+            self._required.add(name)
+        if preload:
+            self._preload.add(name)
+
+    def get(self, name):
+        """Return the model, loading it first if needed. Concurrent callers wait for one load."""
+        if name in self._models:
+            return self._models[name]
+        with self._locks[name]:
+            if name not in self._models:
+                self._load(name)
+        return self._models[name]
+
+    def _load(self, name):
+        self._loading.add(name)
+        started = time.perf_counter()
+        try:
+            self._models[name] = self._loaders[name]()
+        except Exception as e:
+            self._errors[name] = str(e)
+            raise
+        finally:
+            self._loading.discard(name)
+        self._errors.pop(name, None)
+        self._seconds[name] = round(time.perf_counter() - started, 3)
+        logging.info(f"Loaded model {name} in {self._seconds[name]:.2f}s")
+
+    def warm_up(self, names=None):
+        """Load the given models (all by default), logging failures. Returns True if all loaded."""
+        loaded = True
+        for name in names or list(self._loaders):
+            try:
+                self.get(name)
+            except Exception as e:
+                logging.error(f"Model {name} failed to load: {e}")
+                loaded = False
+        return loaded
+
+    def preload(self):
+        """
+        Load the fork-safe models in the parent process, then freeze the garbage collector's
+        view of them so reference counting in the workers does not copy their pages.
+        """
+        loaded = self.warm_up([name for name in self._loaders if name in self._preload])
+        gc.freeze()
+        return loaded
+
+    def ready(self):
+        return all(name in self._models for name in self._required)
+
+    def status(self):
+        status = {}
+        for name in self._loaders:
+            if name in self._models:
+                entry = {"state": "loaded", "seconds": self._seconds[name]}
+            elif name in self._loading:
+                entry = {"state": "loading"}
+            elif name in self._errors:
+                entry = {"state": "failed", "error": self._errors[name]}
+            else:
+                entry = {"state": "pending"}
+            entry["required"] = name in self._required
+            status[name] = entry
+        return status
+
+
+registry = ModelRegistry()
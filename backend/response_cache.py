@@ -0,0 +1,131 @@
+import re
+import time
+from collections import OrderedDict
+
+WORD = re.compile(r"[a-z0-9']+")
+# Only questions are cached; statements usually carry visitor-specific facts
+QUESTION_START = re.compile(
+    r"^(how|what|what's|whats|why|when|where|which|who|can|could|do|does|did|is|are|will|would|should|tell me)\b"
+)
+# Questions this short ("why?", "yes?", "how so?") only make sense after what was said before
+MIN_QUESTION_WORDS = 4
+# Words that point at the visitor or at earlier turns ("what is my name?", "can you repeat
+# that?", "and how much is it?"): the answer depends on the conversation, not just the question
+CONTEXT_WORDS = frozenset("""
+    i i'm i've i'd me my mine myself we we're we've us our ours
+    it it's its that that's this these those they them their he she him her his
+    again repeat earlier previous said else
+""".split())
+# Openers that continue the previous turn ("and how much?", "so what does the setup involve?")
+FOLLOW_UP_START = frozenset("and so but then also ok okay yes yeah no".split())
+
+
+def normalize(text):
+    return " ".join(WORD.findall(text.lower()))
+
+
+def shingles(normalized, size=3):
+    """Character n-grams of each word plus the words themselves, for fuzzy matching."""
+    grams = set()
+    for word in normalized.split():
+        grams.add(word)
+        padded = f" {word} "
+        grams.update(padded[i:i + size] for i in range(len(padded) - size + 1))
+    return frozenset(grams)
+
+
+def is_cacheable(user_text):
+    """Whether a question means the same thing whoever asks it and whenever in the conversation."""
+    text = user_text.strip()
+    words = normalize(text).split()
+    if len(words) < MIN_QUESTION_WORDS or words[0] in FOLLOW_UP_START:
+        return False
+    if any(word in CONTEXT_WORDS for word in words):
+        return False
+    return text.endswith("?") or bool(QUESTION_START.match(" ".join(words)))
+
+
+def numbers(normalized):
+    return frozenset(word for word in normalized.split() if any(c.isdigit() for c in word))
+
+
+class ResponseCache:
+    """
+    Semantic cache of bot replies to common prospect questions. Keys are the normalized
+    latest user turn plus a prompt/knowledge base version, so editing either invalidates
+    old answers. Lookups try an exact match first, then the most similar cached question by
+    shingle Jaccard similarity at or above threshold whose numbers are the same ("10 users"
+    never matches "100 users"). Entries expire after ttl seconds and
+    the least recently used are dropped beyond max_entries.
+    """
+
+    def __init__(self, threshold=0.8, ttl=3600, max_entries=500):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        # (version, normalized question) -> (shingles, reply, stored_at)
+        self._entries = OrderedDict()
+
+    def lookup(self, user_text, version):
+        """Return a cached reply for a similar question, or None."""
+        now = time.monotonic()
+        self._expire(now)
+        key, near = self._match(user_text, version, now)
+        if key is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        self.near_hits += near
+        return self._entries[key][1]
+
+    def peek(self, user_text, version):
+        """Like lookup(), but leaves the hit counters and the LRU order alone."""
+        key, _ = self._match(user_text, version, time.monotonic())
+        return None if key is None else self._entries[key][1]
+
+    def _match(self, user_text, version, now):
+        # (key of the entry answering user_text or None, whether it is only a near match)
+        cutoff = now - self.ttl
+        key = (version, normalize(user_text))
+        entry = self._entries.get(key)
+        if entry is not None and entry[2] >= cutoff:
+            return key, False
+        query = shingles(key[1])
+        query_numbers = numbers(key[1])
+        best_key, best_score = None, 0.0
+        for candidate, (grams, _, stored_at) in self._entries.items():
+            if candidate[0] != version or stored_at < cutoff or numbers(candidate[1]) != query_numbers:
+                continue
+            score = len(query & grams) / (len(query | grams) or 1)
+            if score > best_score:
+                best_key, best_score = candidate, score
+        if best_key is not None and best_score >= self.threshold:
+            return best_key, True
+        return None, False
+
+    def store(self, user_text, version, reply):
+        key = (version, normalize(user_text))
+        self._entries[key] = (shingles(key[1]), reply, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def _expire(self, now):
+        cutoff = now - self.ttl
+        # Entries are only refreshed by store(), so check every entry's age, not just the front
+        for key in [k for k, (_, _, stored_at) in self._entries.items() if stored_at < cutoff]:
+            del self._entries[key]
@@ -0,0 +1,199 @@
+import hashlib
+import math
+import os
+import re
+from collections import Counter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+SECTION_HEADING = re.compile(r'^Section \d+:')
+# Q&A items in the knowledge base start with a keycap number emoji such as 1️⃣
+QA_ITEM = re.compile(r'^\d️?⃣')
+TOKEN = re.compile(r"[a-z0-9]+")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for", "from", "how",
+    "i", "if", "in", "is", "it", "its", "me", "my", "of", "on", "or", "our", "so", "that", "the",
+    "their", "there", "this", "to", "was", "we", "what", "when", "which", "who", "will", "with",
+    "you", "your",
+}
+
+
+def tokenize(text):
+    # Light plural folding so "works" matches "work" and "languages" matches "language"
+    return [t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith("ss") else t
+            for t in TOKEN.findall(text.lower()) if t not in STOPWORDS]
+
+
+def estimate_tokens(text):
+    # Roughly four characters per token for English text
+    return len(text) // 4 + 1
+
+
+class Chunk:
+    __slots__ = ("section", "body", "text", "digest", "terms", "length", "position")
+
+    def __init__(self, section, body, position):
+        self.section = section
+        self.body = body
+        self.text = f"{section}\n{body}" if section else body
+        self.digest = hashlib.sha1(self.text.encode("utf-8")).hexdigest()
+        self.terms = Counter(tokenize(self.text))
+        self.length = sum(self.terms.values())
+        self.position = position
+
+
+def split_knowledge_base(text, max_words=120):
+    """
+    Split the knowledge base into retrievable chunks: one per Q&A item, and groups of
+    paragraphs of at most max_words words elsewhere. Each chunk remembers its section heading.
+    """
+    chunks = []
+    section = ""
+    current = []
+    in_qa = False
+
+    def flush():
+        if current:
+            chunks.append((section, "\n".join(current)))
+            current.clear()
+
+    for index, para in enumerate(p.strip() for p in re.split(r'\n\s*\n', text.strip())):
+        if not para:
+            continue
+        if index == 0 and "\n" not in para and len(para.split()) < 10 and not SECTION_HEADING.match(para):
+            # A short first line is the document title, not content
+            section = para
+            continue
+        if SECTION_HEADING.match(para):
+            flush()
+            section = para
+            in_qa = False
+            continue
+        if QA_ITEM.match(para):
+            flush()
+            in_qa = True
+        elif not in_qa and current and sum(len(p.split()) for p in current) + len(para.split()) > max_words:
+            flush()
+        current.append(para)
+    flush()
+    return chunks
+
+
+class KnowledgeIndex:
+    """
+    In-memory BM25 index over knowledge base chunks. Rebuilds incrementally: chunks whose
+    text is unchanged keep their term counts (and embeddings), only new ones are processed.
+    Pass embed (a function mapping a list of strings to a 2-D NumPy array) to blend in
+    vector similarity.
+    """
+
+    def __init__(self, text="", k1=1.5, b=0.75, embed=None, vector_weight=0.5):
+        self.k1 = k1
+        self.b = b
+        self.embed = embed if np is not None else None
+        self.vector_weight = vector_weight
+        self.chunks = []
+        self.text = ""
+        self._source_digest = None
+        self._source_mtime = None
+        self._idf = {}
+        self._avg_length = 0.0
+        self._vectors = {}
+        self._matrix = None
+        self.update(text)
+
+    def update(self, text):
+        """Re-index text if it changed. Returns True if the index was rebuilt."""
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        if digest == self._source_digest:
+            return False
+        self._source_digest = digest
+        self.text = text
+        previous = {chunk.digest: chunk for chunk in self.chunks}
+        chunks = []
+        for position, (section, body) in enumerate(split_knowledge_base(text)):
+            chunk = Chunk(section, body, position)
+            old = previous.get(chunk.digest)
+            if old is not None:
+                # Unchanged text: reuse the already computed term counts
+                old.position = position
+                chunk = old
+            chunks.append(chunk)
+        self.chunks = chunks
+
+        doc_freq = Counter()
+        for chunk in chunks:
+            doc_freq.update(chunk.terms.keys())
+        n = len(chunks)
+        self._idf = {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()}
+        self._avg_length = sum(chunk.length for chunk in chunks) / n if n else 0.0
+
+        if self.embed is not None and chunks:
+            missing = [chunk for chunk in chunks if chunk.digest not in self._vectors]
+            if missing:
+                for chunk, vector in zip(missing, self.embed([c.text for c in missing])):
+                    self._vectors[chunk.digest] = vector / (np.linalg.norm(vector) or 1.0)
+            live = {chunk.digest for chunk in chunks}
+            self._vectors = {d: v for d, v in self._vectors.items() if d in live}
+            self._matrix = np.vstack([self._vectors[chunk.digest] for chunk in chunks])
+        return True
+
+    @property
+    def version(self):
+        """Digest of the indexed text; changes whenever the knowledge base does."""
+        return self._source_digest
+
+    def refresh_from_file(self, path):
+        """Re-index from path if the file changed since the last call."""
+        mtime = os.stat(path).st_mtime
+        if mtime == self._source_mtime:
+            return False
+        self._source_mtime = mtime
+        with open(path, encoding="utf-8") as f:
+            return self.update(f.read())
+
+    def score(self, query):
+        """Return a relevance score per chunk, in index order."""
+        terms = tokenize(query)
+        scores = []
+        for chunk in self.chunks:
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * chunk.length / (self._avg_length or 1.0))
+            for term in terms:
+                tf = chunk.terms.get(term)
+                if tf:
+                    score += self._idf[term] * tf * (self.k1 + 1) / (tf + norm)
+            scores.append(score)
+        if self._matrix is not None and terms:
+            top = max(scores) or 1.0
+            query_vector = self.embed([query])[0]
+            similarity = self._matrix @ (query_vector / (np.linalg.norm(query_vector) or 1.0))
+            scores = [(1 - self.vector_weight) * s / top + self.vector_weight * float(v)
+                      for s, v in zip(scores, similarity)]
+        return scores
+
+    def retrieve(self, query, top_k=4, token_budget=800, fallback=1):
+        """
+        Return the top_k most relevant chunks that fit in token_budget, in knowledge base
+        order. When nothing matches (e.g. "hi"), return the first fallback chunks instead.
+        """
+        scores = self.score(query)
+        ranked = sorted((i for i, s in enumerate(scores) if s > 0), key=lambda i: -scores[i])
+        if not ranked:
+            ranked = list(range(min(fallback, len(self.chunks))))
+        selected = []
+        used = 0
+        for i in ranked[:top_k]:
+            cost = estimate_tokens(self.chunks[i].text)
+            if used + cost > token_budget:
+                continue
+            selected.append(self.chunks[i])
+            used += cost
+        return sorted(selected, key=lambda chunk: chunk.position)
+
+    def context_for(self, query, top_k=4, token_budget=800):
+        """Relevant knowledge base text for a prompt."""
+        return "\n\n".join(chunk.text for chunk in self.retrieve(query, top_k, token_budget))
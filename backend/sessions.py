@@ -0,0 +1,111 @@
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+
+
+class Session:
+    """
+    Conversation state for a single visitor. Kept small on purpose so many
+    sessions can live in one backend process.
+    """
+    __slots__ = ("session_id", "conversation_id", "step", "lead", "history", "summary", "folded", "context_task",
+                 "rate_limit", "last_seen", "lock")
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        # A new conversation starts on every reset; the session id stays the same
+        self.conversation_id = uuid.uuid4().hex
+        self.step = 0
+        self.lead = {}
+        # Recent turns only; older ones live on in summary and the transcript store
+        self.history = []
+        # Rolling summary of the conversation, and how many leading history turns it covers
+        self.summary = ""
+        self.folded = 0
+        self.context_task = None
+        # Token bucket for per-session rate limiting, created on the first turn
+        self.rate_limit = None
+        self.last_seen = time.monotonic()
+        # Serializes requests for this session only; other sessions run in parallel
+        self.lock = asyncio.Lock()
+
+    def reset(self):
+        self.conversation_id = uuid.uuid4().hex
+        self.step = 0
+        self.lead = {}
+        self.history = []
+        self.summary = ""
+        self.folded = 0
+
+
+class SessionStore:
+    """
+    In-memory session manager with idle-TTL and LRU eviction.
+    Sessions are ordered by last access, so the least recently used one is
+    always at the front and is the first to go when the store is full.
+    """
+
+    def __init__(self, max_sessions=1000, ttl=1800, on_evict=None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        # Called with the session id whenever a session is dropped, for any reason
+        self.on_evict = on_evict
+        self._sessions = OrderedDict()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def get(self, session_id):
+        """Return the live session for session_id, or None if unknown or expired."""
+        self._evict_expired()
+        session = self._sessions.get(session_id) if session_id else None
+        if session is not None:
+            session.last_seen = time.monotonic()
+            self._sessions.move_to_end(session_id)
+        return session
+
+    def get_or_create(self, session_id=None):
+        """Return the session for session_id, creating a fresh one if needed."""
+        session = self.get(session_id)
+        if session is not None:
+            return session
+        session_id = session_id or uuid.uuid4().hex
+        session = Session(session_id)
+        self._sessions[session_id] = session
+        if len(self._sessions) > self.max_sessions:
+            self._evict_lru()
+        return session
+
+    def discard(self, session_id):
+        """Drop a session immediately (e.g. when the visitor ends the chat)."""
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._evicted(session_id)
+        return session
+
+    def _evicted(self, session_id):
+        if self.on_evict is not None:
+            self.on_evict(session_id)
+
+    def _evict_lru(self):
+        # Skip sessions with a request in flight so their state is not split in two
+        for session_id, session in list(self._sessions.items()):
+            if len(self._sessions) <= self.max_sessions:
+                break
+            if not session.lock.locked():
+                del self._sessions[session_id]
+                self._evicted(session_id)
+
+    def _evict_expired(self):
+        # Oldest sessions are at the front, so stop at the first one still alive
+        cutoff = time.monotonic() - self.ttl
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if session.last_seen >= cutoff:
+                break
+            self._sessions.popitem(last=False)
+            self._evicted(session_id)
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import re
+
+from metrics import metrics
+
+_SPACE = re.compile(r"\s+")
+
+
+def normalize(text):
+    return _SPACE.sub(" ", (text or "").strip().lower())
+
+
+class Speculator:
+    """
+    Starts work on a guess of the final input while the user is still talking. Once a partial
+    transcript has stayed the same for stable seconds, start(text) is called; it returns a
+    coroutine to run as the guess, or None to skip this one. A partial that moves away from the
+    guess cancels it. take(final) hands over the guess if the final transcript matches (still
+    running or done), otherwise cancels it. discard(result) is called for guesses that finished
+    but were thrown away. Guesses that were cancelled or did not match show up in the speculations
+    counter as "abandoned" and "miss"; the consumer reports hits.
+    """
+
+    def __init__(self, start, stable=0.3, discard=None):
+        self.start = start
+        self.stable = stable
+        self.discard = discard
+        self._partial = ""
+        self._timer = None
+        self._guess = None
+        self._task = None
+
+    def partial(self, text):
+        """Note the latest partial transcript; a change restarts the stability window."""
+        text = normalize(text)
+        if text == self._partial:
+            return
+        self._partial = text
+        if self._task is not None and self._guess != text:
+            self._drop("abandoned")
+        self._stop_timer()
+        if text and self._task is None:
+            self._timer = asyncio.ensure_future(self._wait(text))
+
+    def take(self, final):
+        """Return the guess's task if final matches it, else None (cancelling any guess)."""
+        self._partial = ""
+        self._stop_timer()
+        if self._task is None:
+            return None
+        if self._guess == normalize(final):
+            task = self._task
+            self._task = self._guess = None
+            return task
+        self._drop("miss")
+        return None
+
+    def cancel(self):
+        self._partial = ""
+        self._stop_timer()
+        if self._task is not None:
+            self._drop("abandoned")
+
+    def abandon(self, task, outcome="abandoned"):
+        """Throw away a guess handed over by take() that the consumer could not use."""
+        metrics.increment("speculations", outcome=outcome)
+        if not task.done():
+            task.cancel()
+            return
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            logging.error(f"Speculative task failed: {task.exception()}")
+        elif self.discard is not None:
+            self.discard(task.result())
+
+    async def _wait(self, text):
+        await asyncio.sleep(self.stable)
+        self._timer = None
+        coro = self.start(text)
+        if coro is None:
+            return
+        self._guess = text
+        self._task = asyncio.ensure_future(coro)
+
+    def _stop_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _drop(self, outcome):
+        task = self._task
+        self._task = self._guess = None
+        self.abandon(task, outcome)
@@ -0,0 +1,306 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    session_id TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_session ON conversations (session_id);
+CREATE INDEX IF NOT EXISTS conversations_created ON conversations (created);
+
+CREATE TABLE IF NOT EXISTS turns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS turns_conversation ON turns (conversation_id, id);
+
+CREATE TABLE IF NOT EXISTS leads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    session_id TEXT NOT NULL,
+    created REAL NOT NULL,
+    status TEXT,
+    name TEXT,
+    role TEXT,
+    company TEXT COLLATE NOCASE,
+    domain TEXT COLLATE NOCASE,
+    problem TEXT,
+    budget TEXT,
+    summary TEXT,
+    agent_summary TEXT,
+    user_last_message TEXT,
+    data TEXT
+);
+CREATE INDEX IF NOT EXISTS leads_created ON leads (created, id);
+CREATE INDEX IF NOT EXISTS leads_company ON leads (company, id);
+CREATE INDEX IF NOT EXISTS leads_domain ON leads (domain, id);
+"""
+
+# One lead per conversation: older databases could hold several, so keep the newest before the
+# unique index goes on
+UNIQUE_LEADS = """
+DELETE FROM leads WHERE id NOT IN (SELECT MAX(id) FROM leads GROUP BY conversation_id);
+DROP INDEX IF EXISTS leads_conversation;
+CREATE UNIQUE INDEX leads_conversation_unique ON leads (conversation_id);
+"""
+
+# Full-text search over leads, kept in step with the table by triggers
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS leads_fts USING fts5(
+    company, domain, problem, summary, content='leads', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS leads_fts_insert AFTER INSERT ON leads BEGIN
+    INSERT INTO leads_fts (rowid, company, domain, problem, summary)
+    VALUES (new.id, new.company, new.domain, new.problem, new.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS leads_fts_delete AFTER DELETE ON leads BEGIN
+    INSERT INTO leads_fts (leads_fts, rowid, company, domain, problem, summary)
+    VALUES ('delete', old.id, old.company, old.domain, old.problem, old.summary);
+END;
+CREATE TRIGGER IF NOT EXISTS leads_fts_update AFTER UPDATE ON leads BEGIN
+    INSERT INTO leads_fts (leads_fts, rowid, company, domain, problem, summary)
+    VALUES ('delete', old.id, old.company, old.domain, old.problem, old.summary);
+    INSERT INTO leads_fts (rowid, company, domain, problem, summary)
+    VALUES (new.id, new.company, new.domain, new.problem, new.summary);
+END;
+"""
+
+LEAD_COLUMNS = ("id", "conversation_id", "session_id", "created", "status", "name", "role", "company",
+                "domain", "problem", "budget", "summary", "agent_summary", "user_last_message")
+_STOP = object()
+
+
+class ConversationStore:
+    """
+    Embedded SQLite store (WAL mode) for conversations, their turns and lead summaries.
+    Writes are queued and applied in batches, one transaction per batch, by a background
+    writer thread, so request handlers never wait on the disk. Reads use a connection per
+    thread and should run off the event loop; call flush() first to see queued writes.
+    """
+
+    def __init__(self, path, batch_size=200, flush_interval=0.2, max_queue=10000):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._local = threading.local()
+        self._queued = 0
+        self._applied = 0
+        self._progress = threading.Condition()
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        try:
+            connection.executescript(FTS_SCHEMA)
+            self.full_text = True
+        except sqlite3.OperationalError:
+            # SQLite built without FTS5; search falls back to LIKE
+            self.full_text = False
+        if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'leads_conversation_unique'").fetchone() is None:
+            connection.executescript(UNIQUE_LEADS)
+        connection.close()
+        self._start_writer()
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _start_writer(self):
+        self._writer = threading.Thread(target=self._run, name="store-writer", daemon=True)
+        self._writer.start()
+
+    def _after_fork(self):
+        # Threads and SQLite connections do not survive a fork; writes queued before it belong
+        # to the parent, so the child starts from an empty queue with its own writer
+        self._queue = queue.Queue(maxsize=self._queue.maxsize)
+        self._local = threading.local()
+        self._progress = threading.Condition()
+        self._queued = self._applied = 0
+        self._start_writer()
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=10)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _reader(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = self._connect()
+        return connection
+
+    # --- Writes (non-blocking) ---
+
+    def _enqueue(self, sql, params):
+        with self._progress:
+            try:
+                self._queue.put_nowait((sql, params))
+            except queue.Full:
+                self.dropped += 1
+                logging.error("Conversation store queue full; dropping a write")
+                return
+            self._queued += 1
+
+    def add_turn(self, conversation_id, session_id, role, text):
+        now = time.time()
+        self._enqueue("INSERT INTO conversations (id, session_id, created, last_seen) VALUES (?, ?, ?, ?) "
+                      "ON CONFLICT(id) DO UPDATE SET last_seen = excluded.last_seen",
+                      (conversation_id, session_id, now, now))
+        self._enqueue("INSERT INTO turns (conversation_id, role, text, created) VALUES (?, ?, ?, ?)",
+                      (conversation_id, role, text, now))
+
+    def save_lead(self, conversation_id, session_id, lead, status):
+        """
+        Record the lead summary for a conversation. Scalar fields get their own columns; the full
+        dict is kept as JSON. A conversation has at most one lead: saving again replaces it in
+        place (same id and created), except that a failed summary never replaces a done one.
+        """
+        values = [conversation_id, session_id, time.time(), status]
+        values += [_scalar(lead.get(column)) for column in LEAD_COLUMNS[5:]]
+        values.append(json.dumps(lead, default=str))
+        placeholders = ", ".join("?" * len(values))
+        replaced = ("session_id",) + LEAD_COLUMNS[4:] + ("data",)
+        updates = ", ".join(f"{column} = excluded.{column}" for column in replaced)
+        self._enqueue(f"INSERT INTO leads ({', '.join(LEAD_COLUMNS[1:])}, data) VALUES ({placeholders}) "
+                      f"ON CONFLICT(conversation_id) DO UPDATE SET {updates} "
+                      "WHERE excluded.status = 'done' OR leads.status IS NOT 'done'",
+                      tuple(values))
+
+    def delete_lead(self, lead_id):
+        self._enqueue("DELETE FROM leads WHERE id = ?", (lead_id,))
+
+    def flush(self, timeout=5.0):
+        """Wait until every write queued before this call has been committed."""
+        deadline = time.monotonic() + timeout
+        with self._progress:
+            target = self._queued
+            while self._applied < target:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._progress.wait(remaining)
+        return True
+
+    def close(self, timeout=5.0):
+        self._queue.put(_STOP)
+        self._writer.join(timeout)
+
+    def _run(self):
+        connection = self._connect()
+        while True:
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is _STOP for item in batch)
+            writes = [item for item in batch if item is not _STOP]
+            try:
+                with connection:
+                    for sql, params in writes:
+                        connection.execute(sql, params)
+            except sqlite3.Error as e:
+                logging.error(f"Conversation store write failed, {len(writes)} writes lost: {e}")
+            with self._progress:
+                self._applied += len(writes)
+                self._progress.notify_all()
+            if stop:
+                connection.close()
+                return
+
+    # --- Reads (blocking; run them on a worker thread) ---
+
+    def turns(self, conversation_id):
+        """Every turn of a conversation in order, as {"role", "text"} dicts."""
+        self.flush()
+        rows = self._reader().execute(
+            "SELECT role, text FROM turns WHERE conversation_id = ? ORDER BY id", (conversation_id,))
+        return [{"role": row["role"], "text": row["text"]} for row in rows]
+
+    def list_leads(self, limit=50, before=None, company=None, domain=None, query=None,
+                   since=None, until=None, fields=None):
+        """
+        Newest leads first with keyset pagination: pass the returned cursor as before to get
+        the next page. fields limits the columns returned (id and created are always
+        included). Returns (leads, next_cursor).
+        """
+        columns = project(fields)
+        where, params = [], []
+        if before is not None:
+            where.append("leads.id < ?")
+            params.append(before)
+        if company:
+            where.append("leads.company = ?")
+            params.append(company)
+        if domain:
+            where.append("leads.domain = ?")
+            params.append(domain)
+        if since is not None:
+            where.append("leads.created >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("leads.created < ?")
+            params.append(until)
+        if query and query.strip():
+            if self.full_text:
+                where.append("leads.id IN (SELECT rowid FROM leads_fts WHERE leads_fts MATCH ?)")
+                params.append(_fts_query(query))
+            else:
+                where.append("(leads.company LIKE ? OR leads.domain LIKE ? OR leads.problem LIKE ? OR leads.summary LIKE ?)")
+                params += [f"%{query}%"] * 4
+        sql = f"SELECT {', '.join('leads.' + c for c in columns)} FROM leads"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY leads.id DESC LIMIT ?"
+        params.append(limit + 1)
+        rows = [dict(row) for row in self._reader().execute(sql, params)]
+        next_cursor = rows[limit - 1]["id"] if len(rows) > limit else None
+        return rows[:limit], next_cursor
+
+    def get_lead(self, lead_id, fields=None):
+        """One lead with its full JSON data and transcript, or None."""
+        self.flush()
+        row = self._reader().execute("SELECT * FROM leads WHERE id = ?", (lead_id,)).fetchone()
+        if row is None:
+            return None
+        lead = json.loads(row["data"]) if row["data"] else {}
+        lead.update({column: row[column] for column in LEAD_COLUMNS})
+        lead["conversation"] = self.turns(row["conversation_id"])
+        if fields:
+            wanted = set(fields) | {"id", "created"}
+            lead = {key: value for key, value in lead.items() if key in wanted}
+        return lead
+
+
+def project(fields):
+    """Validated column list for a field projection; unknown fields are ignored."""
+    if not fields:
+        return list(LEAD_COLUMNS)
+    return ["id", "created"] + [f for f in LEAD_COLUMNS if f in fields and f not in ("id", "created")]
+
+
+def _scalar(value):
+    if value is None or isinstance(value, (str, int, float)):
+        return value
+    return json.dumps(value, default=str)
+
+
+def _fts_query(query):
+    # Quote each word so user input cannot use FTS syntax; words match as prefixes
+    words = [word.replace('"', '""') for word in query.split()]
+    return " ".join(f'"{word}"*' for word in words)
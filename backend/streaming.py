@@ -0,0 +1,62 @@
+import asyncio
+import re
+
+# A sentence ends at . ! or ? (plus any closing quotes/brackets) followed by whitespace,
+# so decimals like "3.5" and links like "youtube.com/watch" are never split
+SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+')
+
+
+async def iter_sentences(fragments, min_chars=20):
+    """
+    Re-chunk a stream of LLM text fragments into whole sentences as soon as each
+    one is complete. Very short sentences are merged with the next one so TTS is
+    not called for a lone "Sure!".
+    """
+    buffer = ""
+    async for fragment in fragments:
+        buffer += fragment
+        start = 0
+        for match in SENTENCE_END.finditer(buffer):
+            if match.end() - start >= min_chars:
+                yield buffer[start:match.end()].strip()
+                start = match.end()
+        buffer = buffer[start:]
+    if buffer.strip():
+        yield buffer.strip()
+
+
+async def synthesize_in_order(sentences, synthesize, max_ahead=3):
+    """
+    Start synthesize(sentence) for each sentence as soon as it arrives, while later
+    sentences are still being generated, and yield (sentence, result) pairs in the
+    original order. At most max_ahead syntheses are queued ahead of the consumer.
+    """
+    pending = asyncio.Queue(maxsize=max_ahead)
+
+    async def produce():
+        try:
+            async for sentence in sentences:
+                await pending.put((sentence, asyncio.ensure_future(synthesize(sentence))))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            await pending.put(None)
+            raise
+        await pending.put(None)
+
+    producer = asyncio.ensure_future(produce())
+    try:
+        while True:
+            item = await pending.get()
+            if item is None:
+                break
+            sentence, task = item
+            yield sentence, await task
+        # Surface errors from the LLM stream once everything before them was delivered
+        await producer
+    finally:
+        producer.cancel()
+        while not pending.empty():
+            item = pending.get_nowait()
+            if item is not None:
+                item[1].cancel()
@@ -1,39 +1,232 @@
 # backend/stt.py
+import os
 import queue
-import sounddevice as sd
-import vosk
 import sys
 import json
-from datetime import datetime
+import time
+import wave
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from event_log import get_event_log
+from metrics import metrics, timer
+from model_registry import model_path, registry
 
 q = queue.Queue()
 
-model = vosk.Model("models/vosk-model-small-en-us-0.15")
+# Relative to backend/models (or WILLOW_MODELS_DIR), whatever the working directory
+MODEL_PATH = model_path(os.getenv("WILLOW_VOSK_MODEL", "vosk-model-small-en-us-0.15"))
+SAMPLE_RATE = 16000
+
+# Voice activity detection: silence is dropped before it reaches Vosk and an utterance is
+# finalized once speech has been followed by WILLOW_VAD_SILENCE_MS of silence
+USE_VAD = os.getenv("WILLOW_VAD", "1") == "1"
+VAD_FRAME_MS = int(os.getenv("WILLOW_VAD_FRAME_MS", "30"))
+VAD_SILENCE_MS = int(os.getenv("WILLOW_VAD_SILENCE_MS", "500"))
+VAD_PREROLL_MS = int(os.getenv("WILLOW_VAD_PREROLL_MS", "300"))
+# Frame RMS, on the 16-bit sample scale, above which a frame counts as speech
+VAD_ENERGY = float(os.getenv("WILLOW_VAD_ENERGY", "300"))
+
+def _load_model():
+    import vosk
+    if not os.path.isdir(MODEL_PATH):
+        raise FileNotFoundError(f"Vosk model not found at {MODEL_PATH}")
+    return vosk.Model(MODEL_PATH)
+
+registry.register("vosk", _load_model)
+
+def get_model():
+    """The Vosk model, loaded once per process and shared between all recognizers."""
+    return registry.get("vosk")
+
+class VoiceActivityDetector:
+    """
+    Energy and zero-crossing voice activity detection over fixed-size frames of 16-bit mono
+    PCM. A frame is speech if its RMS clears the threshold (raised to three times the
+    tracked background level in noisy rooms); inside an utterance, quieter frames with a high
+    zero-crossing rate count too, so unvoiced consonants such as "s" and "f" do not end it.
+    Speech starts after start_ms of loud frames and ends after silence_ms without speech.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, frame_ms=VAD_FRAME_MS, silence_ms=VAD_SILENCE_MS,
+                 preroll_ms=VAD_PREROLL_MS, energy_threshold=VAD_ENERGY, zcr_threshold=0.25,
+                 start_ms=60, hangover_ms=150):
+        self.frame_samples = max(1, sample_rate * frame_ms // 1000)
+        self.frame_bytes = self.frame_samples * 2
+        self.silence_frames = max(1, silence_ms // frame_ms)
+        self.start_frames = max(1, start_ms // frame_ms)
+        # Trailing frames still passed to the recognizer so word endings are decoded
+        self.hangover_frames = hangover_ms // frame_ms
+        self.energy_threshold = energy_threshold
+        self.zcr_threshold = zcr_threshold
+        # Frames from just before speech starts, replayed so the first syllable is not clipped
+        self.preroll = deque(maxlen=max(self.start_frames, preroll_ms // frame_ms))
+        self.noise_floor = None
+        self.reset()
+
+    def reset(self):
+        self.in_speech = False
+        self.speech_run = 0
+        self.silence_run = 0
+        self.preroll.clear()
+        self._pending = b""
+
+    def classify(self, frames):
+        """Per-frame (rms, loud, unvoiced) arrays for an (n, frame_samples) int16 array."""
+        samples = frames.astype(np.float32)
+        rms = np.sqrt(np.mean(samples * samples, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        threshold = self.energy_threshold
+        if self.noise_floor is not None:
+            threshold = max(threshold, 3 * self.noise_floor)
+        return rms, rms >= threshold, (rms >= threshold / 2) & (zcr >= self.zcr_threshold)
+
+    def process(self, data):
+        """
+        Split a chunk of PCM into frames. Yields ("audio", frame) for frames the recognizer
+        should see (speech, its pre-roll and a short hangover) and ("end", None) once an
+        utterance has been followed by silence_ms of silence; other frames are dropped.
+        A partial frame at the end of the chunk is kept for the next call.
+        """
+        data = self._pending + data
+        usable = len(data) - len(data) % self.frame_bytes
+        self._pending = data[usable:]
+        if not usable:
+            return
+        frames = np.frombuffer(data, dtype=np.int16, count=usable // 2).reshape(-1, self.frame_samples)
+        rms, loud, unvoiced = self.classify(frames)
+        passed = 0
+        for i in range(len(frames)):
+            frame = data[i * self.frame_bytes:(i + 1) * self.frame_bytes]
+            if self.in_speech:
+                if loud[i] or unvoiced[i]:
+                    self.silence_run = 0
+                    passed += 1
+                    yield "audio", frame
+                    continue
+                self.silence_run += 1
+                if self.silence_run <= self.hangover_frames:
+                    passed += 1
+                    yield "audio", frame
+                if self.silence_run >= self.silence_frames:
+                    self.in_speech = False
+                    self.silence_run = 0
+                    yield "end", None
+                continue
+            self.preroll.append(frame)
+            if not loud[i]:
+                self.speech_run = 0
+                self._track_noise(rms[i])
+                continue
+            self.speech_run += 1
+            if self.speech_run >= self.start_frames:
+                self.in_speech = True
+                self.speech_run = 0
+                passed += len(self.preroll)
+                while self.preroll:
+                    yield "audio", self.preroll.popleft()
+        metrics.increment("vad_frames", passed, decision="speech")
+        metrics.increment("vad_frames", len(frames) - passed, decision="skipped")
+
+    def _track_noise(self, rms):
+        # Follows the background level down quickly and up slowly
+        if self.noise_floor is None or rms < self.noise_floor:
+            self.noise_floor = float(rms)
+        else:
+            self.noise_floor += 0.01 * (rms - self.noise_floor)
+
+
+class StreamingRecognizer:
+    """
+    Per-connection recognizer for raw 16-bit mono PCM pushed from a client.
+    Not thread-safe: feed one connection's frames one at a time, in order.
+    With VAD on (WILLOW_VAD, the default) silence never reaches Vosk and an utterance is
+    finalized as soon as the detector sees it end, instead of when Vosk's own endpointer does.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE, vad=USE_VAD):
+        import vosk
+        self.rec = vosk.KaldiRecognizer(get_model(), sample_rate)
+        self.vad = VoiceActivityDetector(sample_rate) if vad else None
+        self._last_partial = ""
+
+    def accept(self, data):
+        """
+        Feed a chunk of PCM. Returns ("final", text) when an utterance closes,
+        otherwise ("partial", text) with the current hypothesis ("" if the chunk was silence).
+        """
+        with timer("stt_decode"):
+            if self.vad is None:
+                if self.rec.AcceptWaveform(data):
+                    return "final", json.loads(self.rec.Result()).get("text", "")
+                return "partial", json.loads(self.rec.PartialResult()).get("partial", "")
+            finals = []
+            speech = []
+            for kind, frame in self.vad.process(data):
+                if kind == "audio":
+                    speech.append(frame)
+                    continue
+                if speech and self.rec.AcceptWaveform(b"".join(speech)):
+                    finals.append(json.loads(self.rec.Result()).get("text", ""))
+                speech = []
+                finals.append(json.loads(self.rec.FinalResult()).get("text", ""))
+            if speech and self.rec.AcceptWaveform(b"".join(speech)):
+                finals.append(json.loads(self.rec.Result()).get("text", ""))
+                speech = []
+            if finals:
+                return "final", " ".join(text for text in finals if text)
+            if not speech:
+                return "partial", ""
+            return "partial", json.loads(self.rec.PartialResult()).get("partial", "")
+
+    def flush(self):
+        """Force the pending utterance to a final result (e.g. when the user stops talking)."""
+        if self.vad is not None:
+            self.vad.reset()
+        return json.loads(self.rec.FinalResult()).get("text", "")
+
+    def stream(self, chunks):
+        """
+        Recognize an iterable of PCM chunks, yielding ("partial", text) whenever the running
+        hypothesis changes and ("final", text) for each finished utterance.
+        """
+        for data in chunks:
+            kind, text = self.accept(data)
+            if kind == "final":
+                self._last_partial = ""
+                yield kind, text
+            elif text and text != self._last_partial:
+                self._last_partial = text
+                yield kind, text
 
 def callback(indata, frames, time, status):
     q.put(bytes(indata))
 
-def listen():
+def listen(on_partial=None):
     """
     Listen to the user's voice using Vosk and return the recognized text.
+    on_partial(text) is called with the running hypothesis while the user speaks.
     Handles interruptions and logs all recognized text for review.
     """
+    # Imported here so the server can use this module without an audio device
+    import sounddevice as sd
     try:
-        with sd.RawInputStream(samplerate=16000, blocksize=8000, dtype='int16',
+        recognizer = StreamingRecognizer(SAMPLE_RATE)
+        # Read one VAD frame at a time so the end of speech is noticed within a frame
+        blocksize = recognizer.vad.frame_samples if recognizer.vad is not None else 8000
+        with sd.RawInputStream(samplerate=SAMPLE_RATE, blocksize=blocksize, dtype='int16',
                                channels=1, callback=callback):
-            rec = vosk.KaldiRecognizer(model, 16000)
             print("Listening...")
-            while True:
-                data = q.get()
-                if rec.AcceptWaveform(data):
-                    result = json.loads(rec.Result())
-                    text = result.get("text", "")
-                    if text:
-                        print("User said:", text)
-                        # Log the transcript for review
-                        with open("stt_transcript.log", "a") as f:
-                            f.write(f"{datetime.now()} USER: {text}\n")
-                        return text
+            for kind, text in recognizer.stream(iter(q.get, None)):
+                if kind == "partial":
+                    if on_partial is not None:
+                        on_partial(text)
+                elif text:
+                    print("User said:", text)
+                    # Log the transcript for review; queued, so the audio loop never waits on disk
+                    get_event_log().log("turn", role="user", stage="stt", text=text)
+                    return text
     except KeyboardInterrupt:
         print("[STT] Interrupted by user.")
         return None
@@ -41,6 +234,175 @@ def listen():
         print(f"[STT] Error: {e}")
         return None
 
-# For testing
+# --- Batch transcription of recorded calls ---
+
+BATCH_CHUNK_SECONDS = 0.5
+AUDIO_EXTENSIONS = (".wav",)
+
+
+def iter_audio_files(paths):
+    """Expand files and directories (recursively) into WAV paths, in sorted order."""
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+        for root, dirs, names in os.walk(path):
+            dirs.sort()
+            for name in sorted(names):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    yield os.path.join(root, name)
+
+
+def transcribe_file(path, chunk_seconds=BATCH_CHUNK_SECONDS):
+    """
+    Transcribe a 16-bit PCM WAV file (stereo is mixed down), streaming it through a
+    KaldiRecognizer in fixed-size chunks. Returns the transcript with per-word timings.
+    """
+    import vosk
+    started = time.perf_counter()
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2:
+            raise ValueError("need 16-bit PCM")
+        channels = wav.getnchannels()
+        rate = wav.getframerate()
+        duration = wav.getnframes() / rate
+        rec = vosk.KaldiRecognizer(get_model(), rate)
+        rec.SetWords(True)
+        chunk_frames = max(1, int(rate * chunk_seconds))
+        results = []
+        while True:
+            data = wav.readframes(chunk_frames)
+            if not data:
+                break
+            if channels > 1:
+                samples = np.frombuffer(data, dtype=np.int16).reshape(-1, channels)
+                data = samples.mean(axis=1).astype(np.int16).tobytes()
+            if rec.AcceptWaveform(data):
+                results.append(json.loads(rec.Result()))
+        results.append(json.loads(rec.FinalResult()))
+    words = [
+        {"word": word["word"], "start": round(word["start"], 2), "end": round(word["end"], 2),
+         "conf": round(word.get("conf", 1.0), 3)}
+        for result in results for word in result.get("result", [])
+    ]
+    elapsed = time.perf_counter() - started
+    return {
+        "path": path,
+        "text": " ".join(result["text"] for result in results if result.get("text")),
+        "words": words,
+        "duration": round(duration, 3),
+        "seconds": round(elapsed, 3),
+        "rtf": round(elapsed / duration, 4) if duration else None,
+    }
+
+
+def _transcribe_safely(path):
+    try:
+        return transcribe_file(path)
+    except Exception as e:
+        return {"path": path, "error": f"{type(e).__name__}: {e}"}
+
+
+def _load_batch_worker():
+    """Process-pool initializer: load the Vosk model once for the worker's lifetime."""
+    # warm_up logs rather than raises: a failing initializer would break the whole pool,
+    # while this way each file reports the load error
+    registry.warm_up(["vosk"])
+
+
+def transcribe_batch(paths, out, workers=None):
+    """
+    Transcribe files on a pool of worker processes, writing one JSON line per file to out
+    as each finishes. Returns (files, failed, audio seconds, wall seconds).
+    """
+    started = time.perf_counter()
+    files = failed = 0
+    audio = 0.0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_load_batch_worker) as pool:
+        futures = [pool.submit(_transcribe_safely, path) for path in paths]
+        for future in as_completed(futures):
+            result = future.result()
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+            files += 1
+            if "error" in result:
+                failed += 1
+                print(f"[STT] {result['path']}: {result['error']}", file=sys.stderr)
+            else:
+                audio += result["duration"]
+    return files, failed, audio, time.perf_counter() - started
+
+
+def read_transcribed(path):
+    """
+    Paths that already have a transcript in an earlier run's JSON Lines output. Lines that do not
+    parse (the last one, if that run was killed mid-write) are skipped, so their files run again.
+    """
+    done = set()
+    with open(path) as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(result, dict) and "path" in result and "error" not in result:
+                done.add(result["path"])
+    return done
+
+
+def open_for_resume(path):
+    """Open output for appending, first ending a line cut short by a killed run so new records start clean."""
+    cut_short = False
+    if os.path.exists(path):
+        with open(path, "rb") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell():
+                f.seek(-1, os.SEEK_END)
+                cut_short = f.read(1) != b"\n"
+    out = open(path, "a")
+    if cut_short:
+        out.write("\n")
+    return out
+
+
+def batch_main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Transcribe recorded WAV files offline to JSON Lines.")
+    parser.add_argument("paths", nargs="+", help="WAV files or directories to search for them")
+    parser.add_argument("--out", help="JSON Lines output (default: stdout)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes, each with its own copy of the model")
+    parser.add_argument("--resume", action="store_true",
+                        help="append to --out, skipping files it already has a transcript for")
+    args = parser.parse_args(argv)
+    if not os.path.isdir(MODEL_PATH):
+        parser.error(f"Vosk model not found at {MODEL_PATH} (set WILLOW_VOSK_MODEL or WILLOW_MODELS_DIR)")
+
+    paths = list(iter_audio_files(args.paths))
+    done = set()
+    if args.resume and args.out and os.path.exists(args.out):
+        done = read_transcribed(args.out)
+        paths = [path for path in paths if path not in done]
+    if not args.out:
+        out = sys.stdout
+    else:
+        out = open_for_resume(args.out) if args.resume else open(args.out, "w")
+    try:
+        files, failed, audio, wall = transcribe_batch(paths, out, args.workers)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    # Real-time factor: wall-clock seconds per second of audio, across the whole pool
+    rtf = wall / audio if audio else 0.0
+    print(f"[STT] {files} files ({failed} failed, {len(done)} already done), {audio / 60:.1f} min of audio "
+          f"in {wall:.1f}s: RTF {rtf:.3f} ({1 / rtf if rtf else 0:.1f}x real time) "
+          f"on {args.workers} workers", file=sys.stderr)
+    return 1 if failed else 0
+
+
+# For testing: with no arguments, transcribe one utterance from the microphone;
+# otherwise transcribe the given files, e.g. python stt.py calls/ --out transcripts.jsonl
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(batch_main())
     print(listen())
@@ -0,0 +1,41 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_store import AudioArtifactManager
+
+
+def manager_with(tmp_path, *names):
+    manager = AudioArtifactManager(str(tmp_path))
+    for name in names:
+        (tmp_path / name).write_bytes(b"audio")
+    return manager
+
+
+def test_session_files_are_deleted_when_the_session_ends(tmp_path):
+    manager = manager_with(tmp_path, "a.mp3")
+    assert manager.track("a.mp3", "s1")
+    manager.track("a.mp3", "s1")
+    manager.release_session("s1")
+    assert manager.cleanup() == 1
+    assert not (tmp_path / "a.mp3").exists()
+
+
+def test_a_file_handed_to_a_second_session_is_shared(tmp_path):
+    manager = manager_with(tmp_path, "a.mp3")
+    manager.track("a.mp3", "s1")
+    manager.track("a.mp3", "s2")
+    manager.release_session("s1")
+    manager.release_session("s2")
+    assert manager.cleanup() == 0
+    assert (tmp_path / "a.mp3").exists()
+
+
+def test_a_cache_hit_after_the_owner_ended_shares_the_file(tmp_path):
+    manager = manager_with(tmp_path, "a.mp3")
+    manager.track("a.mp3", "s1")
+    manager.release_session("s1")
+    manager.track("a.mp3", "s2")
+    manager.release_session("s2")
+    assert manager.cleanup() == 0
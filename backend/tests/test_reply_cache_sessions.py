@@ -0,0 +1,45 @@
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_workdir = tempfile.mkdtemp(prefix="willow-test-")
+atexit.register(shutil.rmtree, _workdir, True)
+os.environ.update({
+    "WILLOW_GEMINI_STUB": "1",
+    "WILLOW_TTS_ENGINE": "stub",
+    "WILLOW_SESSION_RATE": "0",
+    "WILLOW_DB_PATH": os.path.join(_workdir, "willow.db"),
+    "WILLOW_LOG_PATH": os.path.join(_workdir, "interaction.log"),
+    "WILLOW_AUDIO_DIR": os.path.join(_workdir, "audio"),
+})
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+
+
+def talk(client, message, session_id=None):
+    if session_id is None:
+        # Start a new visitor: the client would otherwise send the last session's cookie
+        client.cookies.clear()
+    headers = {"X-Session-Id": session_id} if session_id else {}
+    response = client.post("/talk", json={"message": message, "audio_format": "wav"}, headers=headers)
+    return response.headers["X-Session-Id"], response.json()["reply"]
+
+
+def test_only_opening_questions_are_shared():
+    with TestClient(main.app) as client:
+        main.response_cache._entries.clear()
+        session_a, _ = talk(client, "I run sales at Initech, budget is 40k")
+        talk(client, "What pricing plans does Willow offer?", session_a)
+        talk(client, "can you repeat that?", session_a)
+        assert len(main.response_cache._entries) == 0
+
+        _, reply = talk(client, "can you repeat that?")
+        assert "Initech" not in reply and "40k" not in reply
+        talk(client, "What pricing plans does Willow offer?")
+        assert len(main.response_cache._entries) == 1
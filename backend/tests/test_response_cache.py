@@ -0,0 +1,50 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from response_cache import ResponseCache, is_cacheable
+
+
+def test_context_free_questions_are_cacheable():
+    assert is_cacheable("How much does Willow cost per month?")
+    assert is_cacheable("What integrations does Willow support?")
+    assert is_cacheable("Does Willow work with Salesforce?")
+
+
+def test_follow_ups_are_not_cacheable():
+    for text in ("why?", "yes?", "can you repeat that?", "what is my name?", "and how much is that?",
+                 "how does it work?", "so what happens next then?", "tell me more about this"):
+        assert not is_cacheable(text), text
+
+
+def test_statements_are_not_cacheable():
+    assert not is_cacheable("I run sales at Initech, budget is 40k")
+
+
+def test_near_hit_requires_the_same_numbers():
+    cache = ResponseCache(threshold=0.8)
+    cache.store("how much does it cost for 10 users?", "v1", "Ten seats are $500 a month.")
+
+    assert cache.lookup("how much does it cost for 100 users?", "v1") is None
+    assert cache.lookup("how much does it cost for 10 users", "v1") == "Ten seats are $500 a month."
+
+
+def test_near_hit_without_numbers():
+    cache = ResponseCache(threshold=0.8)
+    cache.store("what integrations does willow support?", "v1", "Salesforce and HubSpot.")
+
+    assert cache.lookup("what integration does willow support?", "v1") == "Salesforce and HubSpot."
+    assert cache.lookup("what integrations does willow support?", "v2") is None
+
+
+def test_peek_does_not_count_or_reorder():
+    cache = ResponseCache(max_entries=2)
+    cache.store("How much does Willow cost?", "v1", "It starts at $50.")
+    cache.store("What integrations does Willow support?", "v1", "Salesforce and HubSpot.")
+    assert cache.peek("How much does Willow cost?", "v1") == "It starts at $50."
+    assert cache.peek("Where is Willow based?", "v1") is None
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 0
+    # Peeking did not make the first entry recently used, so it is the one evicted
+    cache.store("Where is Willow based?", "v1", "Berlin.")
+    assert cache.peek("How much does Willow cost?", "v1") is None
@@ -0,0 +1,56 @@
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from store import ConversationStore
+
+
+def open_store(path):
+    return ConversationStore(str(path), flush_interval=0.01)
+
+
+def test_saving_a_lead_twice_keeps_one_row(tmp_path):
+    store = open_store(tmp_path / "willow.db")
+    store.save_lead("c1", "s1", {"company": "Acme", "summary": "wants a demo"}, "done")
+    store.flush()
+    (first,), _ = store.list_leads()
+    store.save_lead("c1", "s1", {"company": "Acme Robotics", "summary": "wants a demo and pricing"}, "done")
+    store.flush()
+    leads, _ = store.list_leads()
+    assert len(leads) == 1
+    assert leads[0]["id"] == first["id"]
+    assert leads[0]["company"] == "Acme Robotics"
+    if store.full_text:
+        assert [lead["id"] for lead in store.list_leads(query="pricing")[0]] == [first["id"]]
+        assert store.list_leads(query="Acme")[0]
+    store.close()
+
+
+def test_failed_summary_does_not_replace_a_done_one(tmp_path):
+    store = open_store(tmp_path / "willow.db")
+    store.save_lead("c1", "s1", {"company": "Acme", "summary": "wants a demo"}, "done")
+    store.save_lead("c1", "s1", {"company": "Acme", "summary": None}, "failed")
+    store.flush()
+    (lead,), _ = store.list_leads()
+    assert lead["status"] == "done"
+    assert lead["summary"] == "wants a demo"
+    store.close()
+
+
+def test_existing_duplicates_are_collapsed_on_open(tmp_path):
+    path = tmp_path / "willow.db"
+    store = open_store(path)
+    store.close()
+    connection = sqlite3.connect(str(path))
+    connection.executescript("""
+        DROP INDEX leads_conversation_unique;
+        INSERT INTO leads (conversation_id, session_id, created, status, company) VALUES ('c1', 's1', 1, 'done', 'Old');
+        INSERT INTO leads (conversation_id, session_id, created, status, company) VALUES ('c1', 's1', 2, 'done', 'New');
+    """)
+    connection.close()
+    store = open_store(path)
+    leads, _ = store.list_leads()
+    assert [lead["company"] for lead in leads] == ["New"]
+    store.close()
@@ -0,0 +1,40 @@
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import stt
+
+
+def write_lines(path, text):
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def test_resume_skips_truncated_last_line(tmp_path):
+    out = tmp_path / "transcripts.jsonl"
+    done = {"path": "calls/a.wav", "text": "hello", "words": [], "duration": 1.0}
+    failed = {"path": "calls/b.wav", "error": "ValueError: need 16-bit PCM"}
+    # The previous run was killed halfway through writing c.wav's record
+    write_lines(out, json.dumps(done) + "\n" + json.dumps(failed) + "\n" + '{"path": "calls/c.wav", "te')
+
+    assert stt.read_transcribed(out) == {"calls/a.wav"}
+
+
+def test_resume_appends_on_a_fresh_line(tmp_path):
+    out = tmp_path / "transcripts.jsonl"
+    write_lines(out, json.dumps({"path": "calls/a.wav", "text": "hello"}) + "\n" + '{"path": "calls/c.wav", "te')
+
+    with stt.open_for_resume(out) as f:
+        f.write(json.dumps({"path": "calls/c.wav", "text": "again"}) + "\n")
+
+    assert stt.read_transcribed(out) == {"calls/a.wav", "calls/c.wav"}
+
+
+def test_resume_output_may_not_exist_yet(tmp_path):
+    out = tmp_path / "transcripts.jsonl"
+    with stt.open_for_resume(out) as f:
+        f.write(json.dumps({"path": "calls/a.wav", "text": "hello"}) + "\n")
+
+    assert out.read_text() == json.dumps({"path": "calls/a.wav", "text": "hello"}) + "\n"
@@ -1,27 +1,119 @@
-from gtts import gTTS
+import io
 import uuid
 import os
-from pydub import AudioSegment
+import subprocess
+import wave
+import numpy as np
+from tts_engines import GTTSEngine
+from metrics import timer
 
-def text_to_speech(text, speed=1.0):
+# Output encodings. All are mono; the compressed ones are small enough for mobile visitors
+# and can start playing before the download finishes.
+AUDIO_FORMATS = {
+    "wav": {"ext": ".wav", "mime": "audio/wav"},
+    "opus": {"ext": ".ogg", "mime": "audio/ogg", "ffmpeg": ["-c:a", "libopus", "-b:a", "24k", "-application", "voip", "-f", "ogg"]},
+    "mp3": {"ext": ".mp3", "mime": "audio/mpeg", "ffmpeg": ["-c:a", "libmp3lame", "-b:a", "48k", "-f", "mp3"]},
+}
+OUTPUT_SAMPLE_RATE = 24000
+
+def time_stretch(samples, rate, frame=1024, tolerance=256):
+    """
+    Change the duration of audio by rate (1.2 = 20% faster) without shifting its pitch,
+    using WSOLA: each frame is taken from near its nominal position, nudged to the offset
+    that best lines up with the previous frame, and overlap-added with a Hann window.
+    samples is an int16 array shaped (n,) or (n, channels).
+    """
+    x = samples.astype(np.float32)
+    if x.ndim == 1:
+        x = x[:, None]
+    hop = frame // 2
+    if rate == 1.0 or len(x) < 2 * frame + tolerance:
+        return samples
+    mono = x.mean(axis=1)
+    window = np.hanning(frame + 1)[:-1].astype(np.float32)
+    n_frames = int((len(x) - frame - tolerance) / (hop * rate))
+    out = np.zeros((hop * n_frames + frame, x.shape[1]), dtype=np.float32)
+    norm = np.zeros(len(out), dtype=np.float32)
+    position = 0
+    written = 0
+    for i in range(n_frames):
+        if i > 0:
+            # Match the overlap region against where the previous frame would have continued
+            natural = position + hop
+            if natural + hop > len(x):
+                break
+            template = mono[natural:natural + hop]
+            nominal = int(i * hop * rate)
+            lo = max(0, nominal - tolerance)
+            hi = min(len(x) - frame, nominal + tolerance)
+            if hi < lo:
+                break
+            scores = np.correlate(mono[lo:hi + hop], template, mode="valid")
+            position = lo + int(np.argmax(scores))
+        out[i * hop:i * hop + frame] += x[position:position + frame] * window[:, None]
+        norm[i * hop:i * hop + frame] += window
+        written = i * hop + frame
+    if not written:
+        return samples
+    used = written
+    out = out[:used] / np.maximum(norm[:used], 1e-3)[:, None]
+    out = np.clip(out, -32768, 32767).astype(np.int16)
+    return out[:, 0] if samples.ndim == 1 else out
+
+def encode_wav(samples, frame_rate):
+    """Encode mono int16 samples as a WAV file in memory."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(frame_rate)
+        wav.writeframes(np.ascontiguousarray(samples, dtype=np.int16).tobytes())
+    return buffer.getvalue()
+
+def encode_audio(samples, frame_rate, fmt="wav"):
+    """Encode mono int16 samples as fmt ("wav", "opus" or "mp3") in memory."""
+    if fmt == "wav":
+        return encode_wav(samples, frame_rate)
+    # Pipe raw PCM through ffmpeg; nothing is written to disk
+    command = ["ffmpeg", "-hide_banner", "-loglevel", "error",
+               "-f", "s16le", "-ar", str(frame_rate), "-ac", "1", "-i", "pipe:0",
+               "-ar", str(OUTPUT_SAMPLE_RATE)] + AUDIO_FORMATS[fmt]["ffmpeg"] + ["pipe:1"]
+    result = subprocess.run(command, input=np.ascontiguousarray(samples, dtype=np.int16).tobytes(),
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return result.stdout
+
+_default_engine = None
+
+def get_default_engine():
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = GTTSEngine()
+    return _default_engine
+
+def synthesize(text, speed=1.0, fmt="wav", engine=None):
+    """
+    Convert text to speech entirely in memory and return the encoded audio bytes.
+    The engine (gTTS unless another is given) produces PCM samples, the speed change
+    is a NumPy time-stretch and encoding happens in memory, so nothing touches the disk.
+    """
+    with timer("tts_engine"):
+        samples, frame_rate = (engine or get_default_engine()).synthesize(text)
+    with timer("tts_stretch"):
+        samples = time_stretch(samples, speed)
+    with timer("tts_encode"):
+        return encode_audio(samples, frame_rate, fmt)
+
+def text_to_speech(text, speed=1.0, directory=".", fmt="wav", engine=None):
     """
-    Convert text to speech using gTTS and pydub. Returns the filename of the generated audio.
-    Handles speed adjustment and cleans up temp files.
+    Convert text to speech (gTTS unless another engine is given). Returns the filename
+    of the generated audio. The audio is built in memory and written to disk once.
     """
     try:
-        print("🔊 Converting text to speech (gTTS):", text)
-        filename = f"reply_{uuid.uuid4().hex}.wav"
-        mp3_filename = filename.replace('.wav', '.mp3')
-        tts = gTTS(text)
-        tts.save(mp3_filename)
-        # Convert mp3 to wav for compatibility and adjust speed
-        sound = AudioSegment.from_mp3(mp3_filename)
-        if speed != 1.0:
-            sound = sound._spawn(sound.raw_data, overrides={
-                "frame_rate": int(sound.frame_rate * speed)
-            }).set_frame_rate(sound.frame_rate)
-        sound.export(filename, format="wav")
-        os.remove(mp3_filename)
+        print(f"🔊 Converting text to speech ({(engine or get_default_engine()).name}):", text)
+        filename = os.path.join(directory, f"reply_{uuid.uuid4().hex}{AUDIO_FORMATS[fmt]['ext']}")
+        data = synthesize(text, speed, fmt, engine)
+        with open(filename, "wb") as f:
+            f.write(data)
         return filename
     except Exception as e:
         print(f"TTS error: {e}")
@@ -0,0 +1,142 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from metrics import timer
+
+CACHE_PREFIX = "tts_"
+
+
+def normalize_text(text):
+    """Collapse whitespace so trivially different copies of a reply share one entry."""
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def cache_key(text, speed, voice, fmt="wav"):
+    raw = f"{voice}|{fmt}|{speed:.3f}|{normalize_text(text)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+class TTSCache:
+    """
+    Content-addressed cache of synthesized audio, keyed on (normalized text, speed, voice, format).
+    Files live in directory as tts_<key>.<ext>; an in-memory LRU of their sizes keeps the
+    total under max_bytes. Safe to use from the TTS worker threads.
+    """
+
+    def __init__(self, directory, max_bytes=200 * 1024 * 1024, on_evict=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.on_evict = on_evict
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._load_existing()
+
+    def _load_existing(self):
+        # Pick up files from a previous run, oldest first so they are evicted first
+        files = []
+        for name in os.listdir(self.directory):
+            if name.startswith(CACHE_PREFIX) and not name.endswith(".part"):
+                path = os.path.join(self.directory, name)
+                stat = os.stat(path)
+                files.append((stat.st_mtime, name, stat.st_size))
+        for _, name, size in sorted(files):
+            key = os.path.splitext(name)[0][len(CACHE_PREFIX):]
+            self._entries[key] = (name, size)
+            self.total_bytes += size
+        self._evict()
+
+    def get(self, key):
+        """Return the cached file name for key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if not os.path.exists(os.path.join(self.directory, entry[0])):
+                # Removed behind our back; forget it
+                del self._entries[key]
+                self.total_bytes -= entry[1]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, data, ext=".wav"):
+        """Write freshly synthesized audio bytes into the cache and return the cached name."""
+        name = CACHE_PREFIX + key + ext
+        target = os.path.join(self.directory, name)
+        # Write under a temporary name first so a half-written file is never served
+        partial = target + ".part"
+        with timer("tts_file_write"):
+            with open(partial, "wb") as f:
+                f.write(data)
+            os.replace(partial, target)
+        size = len(data)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.total_bytes -= old[1]
+            self._entries[key] = (name, size)
+            self.total_bytes += size
+            self._evict(keep=key)
+        return name
+
+    def get_or_create(self, text, speed, voice, synthesize, fmt="wav", ext=".wav"):
+        """
+        Return the cached file name for this utterance, calling synthesize() (which must
+        return the encoded audio bytes, or None on failure) only on a miss. Concurrent misses for
+        the same text wait for one synthesis instead of each running their own.
+        """
+        key = cache_key(text, speed, voice, fmt)
+        name = self.get(key)
+        if name is not None:
+            self.hits += 1
+            return name
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                name = self.get(key)
+                if name is not None:
+                    self.hits += 1
+                    return name
+                self.misses += 1
+                data = synthesize()
+                if not data:
+                    return None
+                return self.put(key, data, ext)
+            finally:
+                with self._lock:
+                    self._key_locks.pop(key, None)
+
+    def forget(self, name):
+        """Drop the entry for a cached file that was deleted by someone else."""
+        key = os.path.splitext(name)[0][len(CACHE_PREFIX):]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == name:
+                del self._entries[key]
+                self.total_bytes -= entry[1]
+
+    def _evict(self, keep=None):
+        # Caller holds self._lock (or is the constructor)
+        while self.total_bytes > self.max_bytes and self._entries:
+            key, (name, size) = next(iter(self._entries.items()))
+            if key == keep:
+                break
+            del self._entries[key]
+            self.total_bytes -= size
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.error(f"Could not evict TTS cache file {name}: {e}")
+            if self.on_evict is not None:
+                self.on_evict(name)
@@ -0,0 +1,212 @@
+import io
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+from metrics import timer
+
+
+class TTSEngine:
+    """
+    A speech synthesizer behind tts.synthesize(). synthesize() returns (samples, sample_rate)
+    with mono int16 samples; speed changes and encoding are applied afterwards.
+    """
+    name = "base"
+
+    @property
+    def voice(self):
+        """Identifies the engine and voice in TTS cache keys."""
+        return self.name
+
+    def start(self):
+        """Load models and start workers. Safe to call more than once."""
+
+    def close(self):
+        pass
+
+    def synthesize(self, text):
+        raise NotImplementedError
+
+
+class GTTSEngine(TTSEngine):
+    """Google Translate TTS over the network. No model to load, but every call is a round trip."""
+    name = "gtts"
+
+    def __init__(self, lang="en"):
+        self.lang = lang
+
+    @property
+    def voice(self):
+        return f"gtts:{self.lang}"
+
+    def synthesize(self, text):
+        from gtts import gTTS
+        from pydub import AudioSegment
+        mp3 = io.BytesIO()
+        with timer("gtts_download"):
+            gTTS(text, lang=self.lang).write_to_fp(mp3)
+        mp3.seek(0)
+        with timer("pydub_decode"):
+            sound = AudioSegment.from_file(mp3, format="mp3").set_sample_width(2)
+        samples = np.array(sound.get_array_of_samples(), dtype=np.int16)
+        if sound.channels > 1:
+            # Speech does not need stereo; downmix to halve the payload
+            samples = samples.reshape(-1, sound.channels).mean(axis=1).astype(np.int16)
+        return samples, sound.frame_rate
+
+
+class StubTTSEngine(TTSEngine):
+    """
+    Deterministic stand-in for benchmarks and offline runs: a plain tone whose length
+    follows the text, returned after latency seconds (standing in for the network round
+    trip or model time). Same text, same samples.
+    """
+    name = "stub"
+
+    def __init__(self, latency=0.0, sample_rate=22050, seconds_per_char=0.06):
+        self.latency = latency
+        self.sample_rate = sample_rate
+        self.seconds_per_char = seconds_per_char
+
+    def synthesize(self, text):
+        if self.latency:
+            time.sleep(self.latency)
+        length = int(max(1, len(text)) * self.seconds_per_char * self.sample_rate)
+        t = np.arange(length) / self.sample_rate
+        return (np.sin(2 * np.pi * 220 * t) * 3000).astype(np.int16), self.sample_rate
+
+
+# --- Local engine: runs inside the worker processes ---
+
+_worker_model = None
+
+
+def load_coqui_model(model_name):
+    """Process-pool initializer: load the Coqui model once and keep it for the worker's lifetime."""
+    global _worker_model
+    from TTS.api import TTS
+    _worker_model = TTS(model_name, progress_bar=False)
+
+
+def coqui_synthesize_batch(texts):
+    rate = _worker_model.synthesizer.output_sample_rate
+    results = []
+    for text in texts:
+        wav = np.asarray(_worker_model.tts(text), dtype=np.float32)
+        results.append(((np.clip(wav, -1.0, 1.0) * 32767).astype(np.int16), rate))
+    return results
+
+
+def _worker_ready():
+    # Give sibling workers a chance to take the other warm-up tasks
+    time.sleep(0.05)
+    return True
+
+
+class LocalTTSEngine(TTSEngine):
+    """
+    Offline synthesis on a dedicated process pool. Each worker loads the model once in its
+    initializer and keeps it warm. Short utterances are collected for batch_window seconds
+    and sent to a worker together, which saves a round trip per sentence. loader and
+    synthesize_batch must be module-level functions so they can be sent to the workers;
+    swap them to run against another local model.
+    """
+    name = "coqui"
+    DEFAULT_MODEL = "tts_models/en/ljspeech/tacotron2-DDC"
+
+    def __init__(self, model_name=DEFAULT_MODEL, processes=2, batch_size=8, batch_window=0.02,
+                 short_chars=80, loader=load_coqui_model, synthesize_batch=coqui_synthesize_batch):
+        self.model_name = model_name
+        self.processes = processes
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.short_chars = short_chars
+        self.loader = loader
+        self.synthesize_batch = synthesize_batch
+        self._pool = None
+        self._queue = []
+        self._cond = threading.Condition()
+        self._start_lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def voice(self):
+        return f"{self.name}:{self.model_name}"
+
+    def start(self):
+        with self._start_lock:
+            if self._pool is not None:
+                return
+            self._pool = ProcessPoolExecutor(max_workers=self.processes, initializer=self.loader,
+                                             initargs=(self.model_name,))
+            # Spawn every worker now so the model is loaded before the first request
+            for future in [self._pool.submit(_worker_ready) for _ in range(self.processes)]:
+                future.result()
+            threading.Thread(target=self._dispatch, name="tts-batcher", daemon=True).start()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+    def synthesize(self, text):
+        if self._closed:
+            raise RuntimeError("TTS engine closed")
+        self.start()
+        if len(text) > self.short_chars:
+            return self._pool.submit(self.synthesize_batch, [text]).result()[0]
+        future = Future()
+        with self._cond:
+            self._queue.append((text, future))
+            self._cond.notify()
+        return future.result()
+
+    def _dispatch(self):
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    for _, future in self._queue:
+                        future.set_exception(RuntimeError("TTS engine closed"))
+                    return
+            # Let other short utterances arriving right now join this batch
+            time.sleep(self.batch_window)
+            with self._cond:
+                batch = self._queue[:self.batch_size]
+                del self._queue[:self.batch_size]
+            try:
+                pending = self._pool.submit(self.synthesize_batch, [text for text, _ in batch])
+            except Exception as e:
+                # Pool shut down or broken; fail this batch rather than leave callers waiting
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            pending.add_done_callback(lambda done, batch=batch: _deliver(batch, done))
+
+
+def _deliver(batch, done):
+    error = done.exception()
+    for index, (_, future) in enumerate(batch):
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(done.result()[index])
+
+
+ENGINES = {
+    "gtts": GTTSEngine,
+    "coqui": LocalTTSEngine,
+    "stub": StubTTSEngine,
+}
+
+
+def create_engine(name="gtts", **options):
+    """Build a TTS engine by name ("gtts", "coqui" or "stub")."""
+    if name not in ENGINES:
+        raise ValueError(f"Unknown TTS engine: {name}")
+    return ENGINES[name](**options)
@@ -0,0 +1,58 @@
+import asyncio
+import contextvars
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TTSWorkerPool:
+    """
+    Runs blocking TTS work (gTTS download, pydub decode/export, file moves) on a
+    bounded thread pool so the event loop keeps serving other sessions.
+    Also tracks deferred synthesis jobs so a reply can be returned before its audio is ready.
+    """
+
+    def __init__(self, max_workers=4, job_ttl=300):
+        self.max_workers = max_workers
+        self.job_ttl = job_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+        self._jobs = {}
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the pool and wait for its result."""
+        loop = asyncio.get_running_loop()
+        # Carry the caller's context over so stage timings land in its request
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, context.run, fn, *args)
+
+    def start_job(self, fn, *args):
+        """Start fn(*args) in the background and return a job id to fetch the result later."""
+        job_id = uuid.uuid4().hex
+        task = asyncio.ensure_future(self.run(fn, *args))
+        self._jobs[job_id] = task
+
+        def _expire(_):
+            # Keep finished results around long enough for the browser to fetch them
+            asyncio.get_running_loop().call_later(self.job_ttl, self._jobs.pop, job_id, None)
+            if not task.cancelled() and task.exception() is not None:
+                logging.error(f"TTS job {job_id} failed: {task.exception()}")
+
+        task.add_done_callback(_expire)
+        return job_id
+
+    async def wait_job(self, job_id, timeout=30):
+        """Wait for a deferred job. Returns its result, or None if unknown, failed or timed out."""
+        task = self._jobs.get(job_id)
+        if task is None:
+            return None
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except Exception as e:
+            logging.error(f"TTS job {job_id} unavailable: {e}")
+            return None
+
+    def shutdown(self):
+        for task in self._jobs.values():
+            task.cancel()
+        self._jobs.clear()
+        self._executor.shutdown(wait=False)
@@ -67,6 +67,7 @@ function App() {
     try {
       const response = await fetch('http://localhost:8000/talk', {
         method: 'POST',
+        credentials: 'include',
         headers: { 'Content-Type': 'application/json' },
         body: JSON.stringify({ message: text }),
       });
@@ -142,23 +143,27 @@ function App() {
     }
   }, [conversation]);
 
+  // --- Lead summaries are written in the background; poll until ready, then store ---
+  const saveLeadWhenReady = async (data) => {
+    for (let attempt = 0; data.lead_status === 'pending' && attempt < 4; attempt++) {
+      const response = await fetch('http://localhost:8000/lead?wait=15', { credentials: 'include' });
+      if (!response.ok) throw new Error('Backend error: ' + response.statusText);
+      data = await response.json();
+    }
+    if (data.lead && data.lead.summary) {
+      const prev = JSON.parse(localStorage.getItem('willow_leads') || '[]');
+      if (!prev.length || prev[prev.length - 1].summary !== data.lead.summary) {
+        localStorage.setItem('willow_leads', JSON.stringify([...prev, data.lead]));
+      }
+    }
+  };
+
   // --- Store lead in localStorage ONLY when backend ends chat and provides summary ---
   useEffect(() => {
     async function fetchLeadIfEnded() {
       if (end) {
         try {
-          const response = await fetch('http://localhost:8000/lead', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-          });
-          if (!response.ok) throw new Error('Backend error: ' + response.statusText);
-          const data = await response.json();
-          if (data.lead && data.lead.summary) {
-            const prev = JSON.parse(localStorage.getItem('willow_leads') || '[]');
-            if (!prev.length || prev[prev.length - 1].summary !== data.lead.summary) {
-              localStorage.setItem('willow_leads', JSON.stringify([...prev, data.lead]));
-            }
-          }
+          await saveLeadWhenReady({ lead_status: 'pending' });
         } catch (e) {
           setError('Could not save lead. Please try again.');
         }
@@ -207,7 +212,7 @@ function App() {
       setTyping(false);
       setDisplayedBotText('');
       localStorage.removeItem('willow_chat_state');
-      fetch('http://localhost:8000/reset', { method: 'POST' });
+      fetch('http://localhost:8000/reset', { method: 'POST', credentials: 'include' });
     }, 300000);
     return () => clearTimeout(inactivityTimer.current);
   }, [conversation, input]);
@@ -251,19 +256,14 @@ function App() {
               const lastUserMsg = conversation.length > 0 ? conversation.filter(m => m.sender === 'user').slice(-1)[0]?.text : '';
               const response = await fetch('http://localhost:8000/lead', {
                 method: 'POST',
+                credentials: 'include',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ message: lastUserMsg || '' })
               });
               const data = await response.json();
               console.log('Lead data:', data);
-              // If the backend returns a lead with summary, store it in localStorage
-
-              if (data.lead && data.lead.summary) {
-                const prev = JSON.parse(localStorage.getItem('willow_leads') || '[]');
-                if (!prev.length || prev[prev.length - 1].summary !== data.lead.summary) {
-                  localStorage.setItem('willow_leads', JSON.stringify([...prev, data.lead]));
-                }
-              }
+              // The summary is still being written; store it once it is ready without holding up the reset
+              saveLeadWhenReady(data).catch(() => {});
             } catch (e) {
               // Optionally handle error
             }
@@ -276,7 +276,7 @@ function App() {
             setDisplayedBotText('');
             setYoutubeUrl('');
             localStorage.removeItem('willow_chat_state');
-            fetch('http://localhost:8000/reset', { method: 'POST' });
+            fetch('http://localhost:8000/reset', { method: 'POST', credentials: 'include' });
           }}
         >
           End Chat
@@ -6,29 +6,82 @@ import React, { useEffect, useState } from 'react';
 import { useNavigate } from 'react-router-dom';
 import './leads.css';
 
+const API_URL = 'http://localhost:8000';
+const LIST_FIELDS = 'company,domain,status,created';
+const TOKEN_KEY = 'willowAdminToken';
+
+// Call a lead endpoint with the admin token (WILLOW_ADMIN_TOKEN on the backend). The token is
+// asked for once and kept for the browser session; a rejected token is cleared and asked for again.
+async function adminFetch(url, options = {}) {
+    for (let attempt = 0; attempt < 2; attempt++) {
+        let token = sessionStorage.getItem(TOKEN_KEY);
+        if (!token) {
+            token = window.prompt('Admin token') || '';
+            if (!token) break;
+            sessionStorage.setItem(TOKEN_KEY, token);
+        }
+        const response = await fetch(url, {
+            ...options,
+            headers: { ...options.headers, Authorization: `Bearer ${token}` },
+        });
+        if (response.status !== 401) return response;
+        sessionStorage.removeItem(TOKEN_KEY);
+    }
+    throw new Error('Backend error: unauthorized');
+}
+
 function Leads() {
     const [leads, setLeads] = useState([]);
+    const [nextCursor, setNextCursor] = useState(null);
+    const [search, setSearch] = useState('');
     const [selected, setSelected] = useState(null);
+    const [selectedLead, setSelectedLead] = useState(null);
     const [error, setError] = useState(null); // For error banners
     const navigate = useNavigate();
 
-    // Load leads from localStorage on mount
-    useEffect(() => {
+    // Load one page of leads from the backend; only the fields the sidebar shows are fetched
+    const loadLeads = async (cursor = null) => {
         try {
-            const stored = localStorage.getItem('willow_leads');
-            setLeads(stored ? JSON.parse(stored) : []);
+            const params = new URLSearchParams({ limit: '50', fields: LIST_FIELDS });
+            if (cursor !== null) params.set('cursor', cursor);
+            if (search.trim()) params.set('q', search.trim());
+            const response = await adminFetch(`${API_URL}/leads?${params}`);
+            if (!response.ok) throw new Error('Backend error: ' + response.statusText);
+            const data = await response.json();
+            setLeads((prev) => (cursor === null ? data.leads : [...prev, ...data.leads]));
+            setNextCursor(data.next_cursor);
         } catch (e) {
-            setError('Could not load leads from localStorage.');
+            setError('Could not load leads.');
         }
+    };
+
+    useEffect(() => {
+        loadLeads();
     }, []);
 
-    // Delete a lead and update localStorage
-    const handleDelete = (idx) => {
+    // Fetch the full lead (summary, notes, transcript) when one is selected
+    const handleSelect = async (idx) => {
+        setSelected(idx);
+        setSelectedLead(null);
+        try {
+            const response = await adminFetch(`${API_URL}/leads/${leads[idx].id}`);
+            if (!response.ok) throw new Error('Backend error: ' + response.statusText);
+            setSelectedLead(await response.json());
+        } catch (e) {
+            setError('Could not load lead details.');
+        }
+    };
+
+    // Delete a lead on the backend and drop it from the list
+    const handleDelete = async (idx) => {
         try {
-            const updated = leads.filter((_, i) => i !== idx);
-            setLeads(updated);
-            localStorage.setItem('willow_leads', JSON.stringify(updated));
-            if (selected === idx) setSelected(null);
+            const response = await adminFetch(`${API_URL}/leads/${leads[idx].id}`, { method: 'DELETE' });
+            if (!response.ok) throw new Error('Backend error: ' + response.statusText);
+            setLeads(leads.filter((_, i) => i !== idx));
+            if (selected === idx) {
+                setSelected(null);
+                setSelectedLead(null);
+            }
         } catch (e) {
             setError('Could not delete lead.');
         }
@@ -50,6 +103,7 @@ function Leads() {
     }
 
     const parsedLeads = leads.map(getParsedLead);
+    const parsedSelected = getParsedLead(selectedLead);
 
     // --- Render UI ---
     return (
@@ -64,6 +118,13 @@ function Leads() {
             <div className="leads-sidebar-fixed">
                 <div className="sidebar-header">
                     <div className="logo">Willow Leads Dashboard</div>
+                    <input
+                        className="lead-search"
+                        placeholder="Search leads"
+                        value={search}
+                        onChange={(e) => setSearch(e.target.value)}
+                        onKeyDown={(e) => e.key === 'Enter' && loadLeads()}
+                    />
                 </div>
                 <div className="lead-items">
                     {parsedLeads.length === 0 ? (
@@ -73,7 +134,7 @@ function Leads() {
                             <div
                                 key={idx}
                                 className={`lead-card ${selected === idx ? 'selected' : ''} ${lead.critical ? 'critical' : ''}`}
-                                onClick={() => setSelected(idx)}
+                                onClick={() => handleSelect(idx)}
                             >
                                 <div className="lead-title-row">
                                     <span className="company-name">{lead.company || 'Untitled'}</span>
@@ -82,12 +143,15 @@ function Leads() {
                             </div>
                         ))
                     )}
+                    {nextCursor !== null && (
+                        <button className="load-more" onClick={() => loadLeads(nextCursor)}>Load more</button>
+                    )}
                 </div>
             </div>
             <div className="leads-details">
-                {selected !== null && parsedLeads[selected] ? (
+                {selected !== null && parsedSelected ? (
                     (() => {
-                        const lead = parsedLeads[selected];
+                        const lead = parsedSelected;
                         return (
                             <div className="details-card">
                                 <div className="header-row">